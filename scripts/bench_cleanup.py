@@ -0,0 +1,1478 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for cleanup.py that run without an AWS account.
+
+  arn   Classify synthetic ARNs with the table-driven parser and with the
+        substring chain it replaced, checking both against the expected result
+  sim   Run process_region and main (discovering by tags, from a Terraform
+        state with main_state, probing every enabled region with
+        main_all_regions, or through a plan file with plan_apply) against an in-process fake of the AWS APIs
+        cleanup.py uses, serially, concurrently and on the asyncio engine,
+        reporting wall-clock time, API calls and peak memory
+"""
+
+import argparse
+import asyncio
+import bisect
+import contextlib
+import gc
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import tracemalloc
+import types
+import uuid
+from collections import Counter
+from unittest import mock
+
+import boto3
+from botocore.awsrequest import AWSResponse
+from botocore.hooks import first_non_none_response
+
+import cleanup
+from cleanup import Colors, log
+
+# ARN templates we produce, with the (type, identifier) cleanup.py should derive.
+# {n} is replaced with a running number so every ARN is distinct.
+ARN_SHAPES = [
+    ("arn:aws:eks:{region}:{account}:cluster/xelta-{n}",
+     lambda n, arn: ('eks_cluster', f"xelta-{n}")),
+    ("arn:aws:eks:{region}:{account}:nodegroup/xelta-{n}/workers-{n}/8ec5b4a2-0f47-4ef0-b1a4-{n:012d}",
+     lambda n, arn: ('eks_nodegroup', (f"xelta-{n}", f"workers-{n}"))),
+    ("arn:aws:elasticache:{region}:{account}:cluster:xelta-redis-{n}-001",
+     lambda n, arn: ('elasticache_cluster', f"xelta-redis-{n}-001")),
+    ("arn:aws:elasticache:{region}:{account}:replicationgroup:xelta-redis-{n}",
+     lambda n, arn: ('elasticache_replication_group', f"xelta-redis-{n}")),
+    ("arn:aws:elasticache:{region}:{account}:snapshot:xelta-redis-{n}-final",
+     lambda n, arn: ('elasticache_snapshot', f"xelta-redis-{n}-final")),
+    ("arn:aws:elasticache:{region}:{account}:parametergroup:xelta-redis-params-{n}",
+     lambda n, arn: ('elasticache_parameter_group', f"xelta-redis-params-{n}")),
+    ("arn:aws:elasticache:{region}:{account}:subnetgroup:xelta-redis-subnets-{n}",
+     lambda n, arn: ('elasticache_subnet_group', f"xelta-redis-subnets-{n}")),
+    ("arn:aws:rds:{region}:{account}:cluster:xelta-db-{n}",
+     lambda n, arn: ('rds_cluster', f"xelta-db-{n}")),
+    ("arn:aws:rds:{region}:{account}:cluster-pg:xelta-db-params-{n}",
+     lambda n, arn: ('rds_parameter_group', f"xelta-db-params-{n}")),
+    ("arn:aws:rds:{region}:{account}:subgrp:xelta-db-subnets-{n}",
+     lambda n, arn: ('rds_subnet_group', f"xelta-db-subnets-{n}")),
+    ("arn:aws:elasticloadbalancing:{region}:{account}:loadbalancer/app/xelta-alb-{n}/50dc6c495c0c{n:04d}",
+     lambda n, arn: ('load_balancer', arn)),
+    ("arn:aws:elasticloadbalancing:{region}:{account}:loadbalancer/net/xelta-nlb-{n}/73e2d6bc24d8{n:04d}",
+     lambda n, arn: ('load_balancer', arn)),
+    ("arn:aws:elasticloadbalancing:{region}:{account}:targetgroup/xelta-tg-{n}/6d0ecf831eec{n:04d}",
+     lambda n, arn: ('target_group', arn)),
+    ("arn:aws:ec2:{region}:{account}:natgateway/nat-{n:017x}",
+     lambda n, arn: ('nat_gateway', f"nat-{n:017x}")),
+    ("arn:aws:ec2:{region}:{account}:internet-gateway/igw-{n:017x}",
+     lambda n, arn: ('internet_gateway', f"igw-{n:017x}")),
+    ("arn:aws:ec2:{region}:{account}:subnet/subnet-{n:017x}",
+     lambda n, arn: ('subnet', f"subnet-{n:017x}")),
+    ("arn:aws:ec2:{region}:{account}:route-table/rtb-{n:017x}",
+     lambda n, arn: ('route_table', f"rtb-{n:017x}")),
+    ("arn:aws:ec2:{region}:{account}:security-group/sg-{n:017x}",
+     lambda n, arn: ('security_group', f"sg-{n:017x}")),
+    ("arn:aws:ec2:{region}:{account}:vpc/vpc-{n:017x}",
+     lambda n, arn: ('vpc', f"vpc-{n:017x}")),
+    ("arn:aws:ec2:{region}:{account}:launch-template/lt-{n:017x}",
+     lambda n, arn: ('launch_template', f"lt-{n:017x}")),
+    # Look-alikes the script must leave alone
+    ("arn:aws:ec2:{region}:{account}:transit-gateway-route-table/tgw-rtb-{n:017x}",
+     lambda n, arn: None),
+    ("arn:aws:ec2:{region}:{account}:egress-only-internet-gateway/eigw-{n:017x}",
+     lambda n, arn: None),
+    ("arn:aws:ec2:{region}:{account}:vpc-endpoint/vpce-{n:017x}",
+     lambda n, arn: None),
+]
+
+def legacy_classify(arn):
+    """The substring chain process_region used before the table-driven parser"""
+    if ':eks:' in arn and ':cluster/' in arn:
+        return 'eks_cluster', arn.split('cluster/')[-1]
+    elif ':eks:' in arn and ':nodegroup/' in arn:
+        parts = arn.split('nodegroup/')[-1].split('/')
+        return 'eks_nodegroup', (parts[0], parts[1])
+    elif ':elasticache:' in arn and ':cluster:' in arn:
+        return 'elasticache_cluster', arn.split(':')[-1]
+    elif ':elasticache:' in arn and ':replicationgroup:' in arn:
+        return 'elasticache_replication_group', arn.split(':')[-1]
+    elif ':elasticache:' in arn and ':snapshot:' in arn:
+        return 'elasticache_snapshot', arn.split(':')[-1]
+    elif ':elasticache:' in arn and ':parametergroup:' in arn:
+        return 'elasticache_parameter_group', arn.split(':')[-1]
+    elif ':elasticache:' in arn and ':subnetgroup:' in arn:
+        return 'elasticache_subnet_group', arn.split(':')[-1]
+    elif ':rds:' in arn and ':cluster:' in arn:
+        return 'rds_cluster', arn.split(':')[-1]
+    elif ':rds:' in arn and ':cluster-pg:' in arn:
+        return 'rds_parameter_group', arn.split(':')[-1]
+    elif ':rds:' in arn and ':subgrp:' in arn:
+        return 'rds_subnet_group', arn.split(':')[-1]
+    elif ':elasticloadbalancing:' in arn and 'loadbalancer/' in arn:
+        return 'load_balancer', arn
+    elif ':elasticloadbalancing:' in arn and 'targetgroup/' in arn:
+        return 'target_group', arn
+    elif ':ec2:' in arn and 'natgateway/' in arn:
+        return 'nat_gateway', arn.split('/')[-1]
+    elif ':ec2:' in arn and 'internet-gateway/' in arn:
+        return 'internet_gateway', arn.split('/')[-1]
+    elif ':ec2:' in arn and 'subnet/' in arn:
+        return 'subnet', arn.split('/')[-1]
+    elif ':ec2:' in arn and 'route-table/' in arn:
+        return 'route_table', arn.split('/')[-1]
+    elif ':ec2:' in arn and 'security-group/' in arn:
+        sg_id = arn.split('/')[-1]
+        if sg_id != 'default':
+            return 'security_group', sg_id
+    elif ':ec2:' in arn and 'vpc/' in arn:
+        return 'vpc', arn.split('/')[-1]
+    elif ':ec2:' in arn and 'launch-template/' in arn:
+        return 'launch_template', arn.split('/')[-1]
+    return None
+
+def synthetic_arns(count, account='123456789012'):
+    """Build count distinct ARNs cycling through ARN_SHAPES, with their expected results"""
+    arns = []
+    expected = []
+    shapes = itertools.cycle(ARN_SHAPES)
+    regions = itertools.cycle(cleanup.REGIONS)
+    for n in range(count):
+        template, expect = next(shapes)
+        arn = template.format(region=next(regions), account=account, n=n)
+        arns.append(arn)
+        expected.append(expect(n, arn))
+    return arns, expected
+
+def _time(fn, arns):
+    # Like timeit, keep the garbage collector from skewing the comparison
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        results = [fn(arn) for arn in arns]
+        return time.perf_counter() - start, results
+    finally:
+        gc.enable()
+
+def _as_pair(record):
+    return None if record is None else (record.kind, record.ident)
+
+def bench_arn(args):
+    """Compare the table-driven ARN parser with the legacy substring chain"""
+    log(f"Generating {args.count:,} synthetic ARNs across {len(ARN_SHAPES)} shapes...", Colors.OKCYAN)
+    arns, expected = synthetic_arns(args.count)
+
+    legacy_best = parser_best = None
+    for _ in range(args.repeat):
+        elapsed, legacy_results = _time(legacy_classify, arns)
+        legacy_best = elapsed if legacy_best is None else min(legacy_best, elapsed)
+        elapsed, parser_results = _time(cleanup.classify, arns)
+        parser_best = elapsed if parser_best is None else min(parser_best, elapsed)
+
+    parser_wrong = sum(1 for got, want in zip(parser_results, expected) if _as_pair(got) != want)
+    legacy_wrong = sum(1 for got, want in zip(legacy_results, expected) if got != want)
+
+    log(f"\n  legacy substring chain: {legacy_best:.3f}s "
+        f"({args.count / legacy_best:,.0f} ARNs/s), {legacy_wrong:,} misclassified", Colors.OKBLUE)
+    log(f"  table-driven parser:    {parser_best:.3f}s "
+        f"({args.count / parser_best:,.0f} ARNs/s), {parser_wrong:,} misclassified", Colors.OKBLUE)
+    log(f"  speedup: {legacy_best / parser_best:.2f}x", Colors.BOLD)
+
+    if parser_wrong:
+        log("✗ Table-driven parser misclassified ARNs", Colors.FAIL)
+        return 1
+    return 0
+
+# Simulated AWS
+#
+# The fake sits behind real botocore clients: parameters are validated and
+# serialized as usual, then a last-registered before-call handler answers the
+# call in-process instead of sending it. Rate-limiter and metrics hooks in
+# cleanup.py therefore see every call, and botocore's own retry policy decides
+# how throttled attempts are retried.
+
+ACCOUNT = '123456789012'
+
+# Deletions that complete asynchronously, with how long each takes relative to
+# --settle (node groups are the slowest thing to delete)
+SETTLE_WEIGHTS = {
+    'eks_nodegroup': 1.0,
+    'eks_cluster': 0.8,
+    'rds_cluster': 0.8,
+    'elasticache_replication_group': 0.6,
+    'elasticache_cluster': 0.4,
+    'nat_gateway': 0.2,
+    'vpc_endpoint': 0.1,
+    'load_balancer': 0.1,
+    'dynamodb_table': 0.3,
+    'ecs_service': 0.2,
+    'lambda_event_source_mapping': 0.1,
+}
+# How long an ECS service takes to stop its tasks once scaled to zero, relative to --settle
+ECS_DRAIN_WEIGHT = 0.3
+# How long a CloudFront configuration change takes to deploy, relative to --settle;
+# disabling a distribution is the slowest step of a real teardown
+DISTRIBUTION_DEPLOY_WEIGHT = 2.0
+
+# Error code each type fails with while something still depends on it
+IN_USE_CODES = {
+    'eks_cluster': 'ResourceInUseException',
+    'elasticache_cluster': 'InvalidCacheClusterState',
+    'elasticache_subnet_group': 'CacheSubnetGroupInUse',
+    'elasticache_parameter_group': 'InvalidCacheParameterGroupState',
+    'rds_subnet_group': 'InvalidDBSubnetGroupStateFault',
+    'rds_parameter_group': 'InvalidDBParameterGroupState',
+    'target_group': 'ResourceInUse',
+    'ecs_cluster': 'ClusterContainsServicesException',
+    'waf_web_acl': 'WAFAssociatedItemException',
+    'acm_certificate': 'ResourceInUseException',
+    'elastic_ip': 'InvalidIPAddress.InUse',
+}
+
+NOT_FOUND = {
+    'eks_nodegroup': 'ResourceNotFoundException',
+    'eks_cluster': 'ResourceNotFoundException',
+    'elasticache_cluster': 'CacheClusterNotFound',
+    'elasticache_replication_group': 'ReplicationGroupNotFoundFault',
+    'elasticache_snapshot': 'SnapshotNotFoundFault',
+    'elasticache_parameter_group': 'CacheParameterGroupNotFound',
+    'elasticache_subnet_group': 'CacheSubnetGroupNotFoundFault',
+    'rds_cluster': 'DBClusterNotFoundFault',
+    'rds_parameter_group': 'DBClusterParameterGroupNotFound',
+    'rds_subnet_group': 'DBSubnetGroupNotFoundFault',
+    'load_balancer': 'LoadBalancerNotFound',
+    'target_group': 'TargetGroupNotFound',
+    'nat_gateway': 'NatGatewayNotFound',
+    'internet_gateway': 'InvalidInternetGatewayID.NotFound',
+    'subnet': 'InvalidSubnetID.NotFound',
+    'route_table': 'InvalidRouteTableID.NotFound',
+    'security_group': 'InvalidGroup.NotFound',
+    'elastic_ip': 'InvalidAllocationID.NotFound',
+    'network_interface': 'InvalidNetworkInterfaceID.NotFound',
+    'vpc': 'InvalidVpcID.NotFound',
+    'launch_template': 'InvalidLaunchTemplateId.NotFound',
+    's3_bucket': 'NoSuchBucket',
+    'ecs_cluster': 'ClusterNotFoundException',
+    'ecs_service': 'ServiceNotFoundException',
+    'ecs_task_definition': 'ClientException',
+    'lambda_function': 'ResourceNotFoundException',
+    'lambda_event_source_mapping': 'ResourceNotFoundException',
+    'sqs_queue': 'QueueDoesNotExist',
+    'dynamodb_table': 'ResourceNotFoundException',
+    'cloudfront_distribution': 'NoSuchDistribution',
+    'waf_web_acl': 'WAFNonexistentItemException',
+    'acm_certificate': 'ResourceNotFoundException',
+}
+
+THROTTLE_CODES = {
+    'ec2': 'RequestLimitExceeded',
+    'eks': 'ThrottlingException',
+    'resourcegroupstaggingapi': 'ThrottlingException',
+    's3': 'SlowDown',
+}
+
+# (service, operation) -> (resource type, parameter naming it) for plain deletes
+DELETE_OPERATIONS = {
+    ('eks', 'DeleteNodegroup'): ('eks_nodegroup', 'nodegroupName'),
+    ('eks', 'DeleteCluster'): ('eks_cluster', 'name'),
+    ('elasticache', 'DeleteCacheCluster'): ('elasticache_cluster', 'CacheClusterId'),
+    ('elasticache', 'DeleteReplicationGroup'): ('elasticache_replication_group', 'ReplicationGroupId'),
+    ('elasticache', 'DeleteSnapshot'): ('elasticache_snapshot', 'SnapshotName'),
+    ('elasticache', 'DeleteCacheParameterGroup'): ('elasticache_parameter_group', 'CacheParameterGroupName'),
+    ('elasticache', 'DeleteCacheSubnetGroup'): ('elasticache_subnet_group', 'CacheSubnetGroupName'),
+    ('rds', 'DeleteDBCluster'): ('rds_cluster', 'DBClusterIdentifier'),
+    ('rds', 'DeleteDBClusterParameterGroup'): ('rds_parameter_group', 'DBClusterParameterGroupName'),
+    ('rds', 'DeleteDBSubnetGroup'): ('rds_subnet_group', 'DBSubnetGroupName'),
+    ('elbv2', 'DeleteLoadBalancer'): ('load_balancer', 'LoadBalancerArn'),
+    ('elbv2', 'DeleteTargetGroup'): ('target_group', 'TargetGroupArn'),
+    ('ec2', 'DeleteNatGateway'): ('nat_gateway', 'NatGatewayId'),
+    ('ec2', 'DeleteInternetGateway'): ('internet_gateway', 'InternetGatewayId'),
+    ('ec2', 'DeleteSubnet'): ('subnet', 'SubnetId'),
+    ('ec2', 'DeleteRouteTable'): ('route_table', 'RouteTableId'),
+    ('ec2', 'DeleteSecurityGroup'): ('security_group', 'GroupId'),
+    ('ec2', 'ReleaseAddress'): ('elastic_ip', 'AllocationId'),
+    ('ec2', 'DeleteNetworkInterface'): ('network_interface', 'NetworkInterfaceId'),
+    ('ec2', 'DeleteVpc'): ('vpc', 'VpcId'),
+    ('ec2', 'DeleteLaunchTemplate'): ('launch_template', 'LaunchTemplateId'),
+    ('ecs', 'DeleteCluster'): ('ecs_cluster', 'cluster'),
+    ('lambda', 'DeleteFunction'): ('lambda_function', 'FunctionName'),
+    ('lambda', 'DeleteEventSourceMapping'): ('lambda_event_source_mapping', 'UUID'),
+    ('sqs', 'DeleteQueue'): ('sqs_queue', 'QueueUrl'),
+    ('dynamodb', 'DeleteTable'): ('dynamodb_table', 'TableName'),
+    ('acm', 'DeleteCertificate'): ('acm_certificate', 'CertificateArn'),
+}
+
+# Regions describe_regions reports as enabled; only cleanup.REGIONS are populated,
+# so the rest are the empty regions an --all-regions probe has to rule out
+ENABLED_REGIONS = [
+    'ap-northeast-1', 'ap-northeast-2', 'ap-northeast-3', 'ap-south-1', 'ap-southeast-1', 'ap-southeast-2',
+    'ca-central-1', 'eu-central-1', 'eu-north-1', 'eu-west-1', 'eu-west-2', 'eu-west-3', 'sa-east-1',
+    'us-east-1', 'us-east-2', 'us-west-1', 'us-west-2',
+]
+
+# Terraform resource type of each kind, for the state written for the main_state scenario
+STATE_TYPES = {
+    'vpc': 'aws_vpc',
+    'subnet': 'aws_subnet',
+    'route_table': 'aws_route_table',
+    'internet_gateway': 'aws_internet_gateway',
+    'security_group': 'aws_security_group',
+    'nat_gateway': 'aws_nat_gateway',
+    'elastic_ip': 'aws_eip',
+    'eks_cluster': 'aws_eks_cluster',
+    'eks_nodegroup': 'aws_eks_node_group',
+    'launch_template': 'aws_launch_template',
+    'load_balancer': 'aws_lb',
+    'target_group': 'aws_lb_target_group',
+    'elasticache_replication_group': 'aws_elasticache_replication_group',
+    'elasticache_cluster': 'aws_elasticache_cluster',
+    'elasticache_subnet_group': 'aws_elasticache_subnet_group',
+    'elasticache_parameter_group': 'aws_elasticache_parameter_group',
+    'rds_cluster': 'aws_rds_cluster',
+    'rds_subnet_group': 'aws_db_subnet_group',
+    'rds_parameter_group': 'aws_rds_cluster_parameter_group',
+    's3_bucket': 'aws_s3_bucket',
+    'ecs_cluster': 'aws_ecs_cluster',
+    'ecs_service': 'aws_ecs_service',
+    'ecs_task_definition': 'aws_ecs_task_definition',
+    'lambda_function': 'aws_lambda_function',
+    'lambda_event_source_mapping': 'aws_lambda_event_source_mapping',
+    'sqs_queue': 'aws_sqs_queue',
+    'dynamodb_table': 'aws_dynamodb_table',
+    'cloudfront_distribution': 'aws_cloudfront_distribution',
+    'waf_web_acl': 'aws_wafv2_web_acl',
+    'acm_certificate': 'aws_acm_certificate',
+}
+STATE_PROVIDER = 'provider["registry.terraform.io/hashicorp/aws"]'
+
+class FakeError(Exception):
+    def __init__(self, code, message=''):
+        super().__init__(code)
+        self.code = code
+        self.message = message or code
+
+class FakeResource:
+    __slots__ = ('kind', 'name', 'arn', 'region', 'type_filter', 'tags', 'blockers',
+                 'cascade', 'attached_to', 'gone_at', 'vpc')
+
+    def __init__(self, kind, name, arn, region, type_filter, tags):
+        self.kind = kind
+        self.name = name
+        self.arn = arn
+        self.region = region
+        self.type_filter = type_filter
+        self.tags = tags
+        self.blockers = []    # resources that must be gone before this one can be deleted
+        self.cascade = []     # resources deleted along with this one
+        self.attached_to = None
+        self.gone_at = None   # set when deletion starts; the resource disappears at this time
+        self.vpc = None       # the VPC a subnet, route table, group, ENI or endpoint is in
+
+def _after_prefix(prefix):
+    """The smallest string greater than every string starting with prefix"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+class FakeBucket:
+    """Object versions, delete markers and multipart uploads of one bucket, in key order"""
+
+    def __init__(self, objects):
+        self.entries = []  # sorted (key, version id, is delete marker)
+        for n in range(objects):
+            # Mostly nested under a few top-level prefixes, some at the root
+            key = f"shard-{n % 16:02d}/results/{n:09d}.json" if n % 10 else f"{n:09d}.json"
+            versions = 1 + (n % 3 == 0)
+            for version in range(versions):
+                self.entries.append((key, f"v{version}-{n:09d}", False))
+            if n % 5 == 0:
+                self.entries.append((key, f"m-{n:09d}", True))
+        self.entries.sort()
+        self.positions = {(key, version_id): i for i, (key, version_id, _) in enumerate(self.entries)}
+        self.deleted = bytearray(len(self.entries))
+        self.live = len(self.entries)
+        self.uploads = {(f"uploads/{n:05d}.bin", f"upload-{n}") for n in range(max(1, objects // 1000))}
+
+    def list_versions(self, prefix, delimiter, key_marker, version_marker, max_keys):
+        entries = self.entries
+        end = bisect.bisect_left(entries, (_after_prefix(prefix),)) if prefix else len(entries)
+        if not key_marker:
+            i = bisect.bisect_left(entries, (prefix,))
+        elif delimiter and key_marker.endswith(delimiter):
+            i = bisect.bisect_left(entries, (_after_prefix(key_marker),))
+        elif version_marker:
+            i = bisect.bisect_right(entries, (key_marker, version_marker, True))
+        else:
+            i = bisect.bisect_left(entries, (key_marker + '\0',))
+
+        versions, markers, prefixes = [], [], []
+        last = None
+        while i < end and len(versions) + len(markers) + len(prefixes) < max_keys:
+            key, version_id, is_marker = entries[i]
+            split = key.find(delimiter, len(prefix)) if delimiter else -1
+            if split >= 0:
+                common_prefix = key[:split + len(delimiter)]
+                prefixes.append({'Prefix': common_prefix})
+                last = (common_prefix, None)
+                i = bisect.bisect_left(entries, (_after_prefix(common_prefix),))
+                continue
+            if not self.deleted[i]:
+                (markers if is_marker else versions).append({'Key': key, 'VersionId': version_id, 'IsLatest': True})
+                last = (key, version_id)
+            i += 1
+
+        response = {'Versions': versions, 'DeleteMarkers': markers, 'CommonPrefixes': prefixes,
+                    'IsTruncated': i < end and last is not None}
+        if response['IsTruncated']:
+            response['NextKeyMarker'] = last[0]
+            if last[1]:
+                response['NextVersionIdMarker'] = last[1]
+        return response
+
+    def delete(self, objects):
+        for obj in objects:
+            i = self.positions.get((obj['Key'], obj.get('VersionId')))
+            if i is not None and not self.deleted[i]:
+                self.deleted[i] = 1
+                self.live -= 1
+
+class Inventory:
+    """Numbers of resources to generate, spread round-robin across regions"""
+
+    def __init__(self, vpcs=50, subnets=500, target_groups=200, nodegroups=30, clusters=10,
+                 load_balancers=20, security_groups=100, nat_gateways=50, caches=5, databases=5,
+                 buckets=3, objects_per_bucket=20000, ecs_services=6, functions=30, event_source_mappings=9,
+                 queues=9, tables=9, distributions=1, detached_interfaces=30, vpc_endpoints=6,
+                 group_references=30):
+        self.vpcs = vpcs
+        self.subnets = subnets
+        self.target_groups = target_groups
+        self.nodegroups = nodegroups
+        self.clusters = clusters
+        self.load_balancers = load_balancers
+        self.security_groups = security_groups
+        self.nat_gateways = nat_gateways
+        self.caches = caches
+        self.databases = databases
+        self.buckets = buckets
+        self.objects_per_bucket = objects_per_bucket
+        self.ecs_services = ecs_services
+        self.functions = functions
+        self.event_source_mappings = event_source_mappings
+        self.queues = queues
+        self.tables = tables
+        self.distributions = distributions
+        # Blockers outside the tagged inventory, cleared by the network pre-flight
+        self.detached_interfaces = detached_interfaces
+        self.vpc_endpoints = vpc_endpoints
+        self.group_references = group_references
+
+class FakeAWS:
+    """In-process stand-in for the AWS APIs cleanup.py calls"""
+
+    def __init__(self, latency=0.0, jitter=0.5, throttle=0.0, server_rate=0, settle=1.0,
+                 consistency_lag=0.1, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle = throttle
+        self.server_rate = server_rate
+        self.settle = settle
+        self.consistency_lag = consistency_lag
+        self.random = random.Random(seed)
+        self.resources = {}    # (region, kind, name) -> FakeResource
+        self.by_arn = {}       # ARN -> FakeResource
+        self.by_region = {}    # region -> [FakeResource] in creation order, for stable paging
+        self.buckets = {}      # (region, bucket name) -> FakeBucket
+        self.services = {}     # (region, "cluster/service") -> {'desired', 'drained_at', 'scaling'}
+        self.mappings = {}     # (region, function name) -> [event source mapping FakeResource]
+        self.distributions = {}  # distribution id -> {'enabled', 'deployed_at', 'etag'}
+        self.vpc_members = {}    # (region, vpc id) -> [subnets, route tables, groups, ENIs, endpoints]
+        self.group_rules = {}    # (region, group id) -> [group ids its ingress rules reference]
+        self.calls = Counter()
+        self.throttled = Counter()
+        self._server_tokens = {}
+        self._lock = threading.Lock()
+        self._serial = itertools.count(1)
+
+    # Inventory
+
+    def _add(self, region, kind, name, arn, type_filter, tagged=True):
+        tags = [{'Key': cleanup.TAG_KEY, 'Value': cleanup.TAG_VALUES[next(self._serial) % len(cleanup.TAG_VALUES)]}]
+        resource = FakeResource(kind, name, arn, region, type_filter, tags if tagged else [])
+        self.resources[(region, kind, name)] = resource
+        self.by_arn[arn] = resource
+        self.by_region.setdefault(region, []).append(resource)
+        return resource
+
+    def _ec2(self, region, kind, arn_type, prefix, vpc=None, tagged=True):
+        name = f"{prefix}-{next(self._serial):017x}"
+        resource = self._add(region, kind, name, f"arn:aws:ec2:{region}:{ACCOUNT}:{arn_type}/{name}",
+                             f"ec2:{arn_type}", tagged)
+        if vpc is not None:
+            resource.vpc = vpc
+            self.vpc_members.setdefault((region, vpc.name), []).append(resource)
+        return resource
+
+    def populate(self, inventory, regions):
+        """Create the inventory, split as evenly as possible across regions"""
+        for index, region in enumerate(regions):
+            share = lambda total: total // len(regions) + (1 if index < total % len(regions) else 0)
+            counts = {name: share(total) for name, total in vars(inventory).items()}
+            counts['objects_per_bucket'] = inventory.objects_per_bucket
+            self._populate_region(region, counts)
+        self._populate_edge(cleanup.EDGE_REGION, inventory.distributions)
+        return self
+
+    def _populate_edge(self, region, distributions):
+        # Each distribution comes with the web ACL and certificate attached to it
+        for n in range(distributions):
+            distribution_id = f"E{next(self._serial):013X}"
+            distribution = self._add(region, 'cloudfront_distribution', distribution_id,
+                                     f"arn:aws:cloudfront::{ACCOUNT}:distribution/{distribution_id}",
+                                     'cloudfront:distribution')
+            self.distributions[distribution_id] = {'enabled': True, 'deployed_at': 0.0, 'etag': 'E1'}
+            name = f"xelta-waf-{n}"
+            web_acl = self._add(region, 'waf_web_acl', name,
+                                f"arn:aws:wafv2:{region}:{ACCOUNT}:global/webacl/{name}/{uuid.UUID(int=n)}", 'wafv2')
+            certificate_arn = f"arn:aws:acm:{region}:{ACCOUNT}:certificate/{uuid.UUID(int=next(self._serial))}"
+            certificate = self._add(region, 'acm_certificate', certificate_arn, certificate_arn, 'acm:certificate')
+            web_acl.blockers.append(distribution)
+            certificate.blockers.append(distribution)
+
+    def _populate_region(self, region, counts):
+        vpcs = [self._ec2(region, 'vpc', 'vpc', 'vpc') for _ in range(max(1, counts['vpcs']))]
+        subnets = {vpc.name: [] for vpc in vpcs}
+        for n in range(counts['subnets']):
+            vpc = vpcs[n % len(vpcs)]
+            subnet = self._ec2(region, 'subnet', 'subnet', 'subnet', vpc)
+            subnets[vpc.name].append(subnet)
+            vpc.blockers.append(subnet)
+        for vpc in vpcs:
+            if not subnets[vpc.name]:
+                subnet = self._ec2(region, 'subnet', 'subnet', 'subnet', vpc)
+                subnets[vpc.name].append(subnet)
+                vpc.blockers.append(subnet)
+            # A route table can't go while subnets are still associated with it
+            route_table = self._ec2(region, 'route_table', 'route-table', 'rtb', vpc)
+            route_table.blockers.extend(subnets[vpc.name])
+            vpc.blockers.append(route_table)
+            igw = self._ec2(region, 'internet_gateway', 'internet-gateway', 'igw')
+            igw.attached_to = vpc
+            vpc.blockers.append(igw)
+
+        groups = {vpc.name: [] for vpc in vpcs}
+        for n in range(counts['security_groups']):
+            vpc = vpcs[n % len(vpcs)]
+            group = self._ec2(region, 'security_group', 'security-group', 'sg', vpc)
+            groups[vpc.name].append(group)
+            vpc.blockers.append(group)
+        for n in range(counts['group_references']):
+            # An ingress rule of one group naming another keeps the named group alive
+            vpc_groups = groups[vpcs[n % len(vpcs)].name]
+            if len(vpc_groups) > 1:
+                source, target = vpc_groups[n % len(vpc_groups)], vpc_groups[(n + 1) % len(vpc_groups)]
+                self.group_rules.setdefault((region, source.name), []).append(target.name)
+                target.blockers.append(source)
+
+        # Leftovers from deleted Lambda functions and load balancers, and interface endpoints
+        for n in range(counts['detached_interfaces']):
+            vpc = vpcs[n % len(vpcs)]
+            interface = self._ec2(region, 'network_interface', 'network-interface', 'eni', vpc, tagged=False)
+            subnets[vpc.name][n % len(subnets[vpc.name])].blockers.append(interface)
+            if groups[vpc.name]:
+                groups[vpc.name][n % len(groups[vpc.name])].blockers.append(interface)
+        for n in range(counts['vpc_endpoints']):
+            vpc = vpcs[n % len(vpcs)]
+            endpoint = self._ec2(region, 'vpc_endpoint', 'vpc-endpoint', 'vpce', vpc, tagged=False)
+            subnets[vpc.name][0].blockers.append(endpoint)
+            vpc.blockers.append(endpoint)
+
+        def place(resource, vpc, n):
+            # Occupy two of the VPC's subnets and one of its security groups
+            vpc_subnets = subnets[vpc.name]
+            for subnet in {vpc_subnets[n % len(vpc_subnets)], vpc_subnets[(n + 1) % len(vpc_subnets)]}:
+                subnet.blockers.append(resource)
+            if groups[vpc.name]:
+                groups[vpc.name][n % len(groups[vpc.name])].blockers.append(resource)
+
+        for n in range(counts['nat_gateways']):
+            vpc = vpcs[n % len(vpcs)]
+            nat = self._ec2(region, 'nat_gateway', 'natgateway', 'nat')
+            subnets[vpc.name][0].blockers.append(nat)
+            # The gateway's address can only be released once the gateway is gone
+            address = self._ec2(region, 'elastic_ip', 'elastic-ip', 'eipalloc')
+            address.blockers.append(nat)
+            address.attached_to = nat
+            # Public addresses mapped by the NAT gateway keep the IGW attached
+            for igw in vpc.blockers:
+                if igw.kind == 'internet_gateway':
+                    igw.blockers.extend([nat, address])
+
+        clusters = []
+        for n in range(counts['clusters'] or (1 if counts['nodegroups'] else 0)):
+            vpc = vpcs[n % len(vpcs)]
+            name = f"xelta-{region}-{n}"
+            cluster = self._add(region, 'eks_cluster', name,
+                                f"arn:aws:eks:{region}:{ACCOUNT}:cluster/{name}", 'eks:cluster')
+            place(cluster, vpc, n)
+            clusters.append((cluster, vpc))
+        for n in range(counts['nodegroups']):
+            cluster, vpc = clusters[n % len(clusters)]
+            name = f"workers-{n}"
+            nodegroup = self._add(region, 'eks_nodegroup', name,
+                                  f"arn:aws:eks:{region}:{ACCOUNT}:nodegroup/{cluster.name}/{name}/{uuid.UUID(int=n)}",
+                                  'eks:nodegroup')
+            cluster.blockers.append(nodegroup)
+            place(nodegroup, vpc, n)
+            self._ec2(region, 'launch_template', 'launch-template', 'lt')
+
+        balancers = []
+        for n in range(counts['load_balancers'] or (1 if counts['target_groups'] else 0)):
+            vpc = vpcs[n % len(vpcs)]
+            arn = f"arn:aws:elasticloadbalancing:{region}:{ACCOUNT}:loadbalancer/app/xelta-alb-{n}/{n:016x}"
+            balancer = self._add(region, 'load_balancer', arn, arn, 'elasticloadbalancing:loadbalancer')
+            place(balancer, vpc, n)
+            for igw in vpc.blockers:
+                if igw.kind == 'internet_gateway':
+                    igw.blockers.append(balancer)
+            balancers.append(balancer)
+        for n in range(counts['target_groups']):
+            arn = f"arn:aws:elasticloadbalancing:{region}:{ACCOUNT}:targetgroup/xelta-tg-{n}/{n:016x}"
+            target_group = self._add(region, 'target_group', arn, arn, 'elasticloadbalancing:targetgroup')
+            # Listener rules forward to the target group until the load balancer goes
+            target_group.blockers.append(balancers[n % len(balancers)])
+
+        for n in range(counts['caches']):
+            vpc = vpcs[n % len(vpcs)]
+            arn = f"arn:aws:elasticache:{region}:{ACCOUNT}"
+            group = self._add(region, 'elasticache_replication_group', f"xelta-redis-{n}",
+                              f"{arn}:replicationgroup:xelta-redis-{n}", 'elasticache:replicationgroup')
+            subnet_group = self._add(region, 'elasticache_subnet_group', f"xelta-redis-subnets-{n}",
+                                     f"{arn}:subnetgroup:xelta-redis-subnets-{n}", 'elasticache:subnetgroup')
+            parameter_group = self._add(region, 'elasticache_parameter_group', f"xelta-redis-params-{n}",
+                                        f"{arn}:parametergroup:xelta-redis-params-{n}", 'elasticache:parametergroup')
+            place(group, vpc, n)
+            subnet_group.blockers.append(group)
+            parameter_group.blockers.append(group)
+            for member in range(2):
+                name = f"xelta-redis-{n}-{member + 1:03d}"
+                cluster = self._add(region, 'elasticache_cluster', name, f"{arn}:cluster:{name}", 'elasticache:cluster')
+                # Members can only go with their replication group
+                cluster.blockers.append(group)
+                group.cascade.append(cluster)
+                subnet_group.blockers.append(cluster)
+                parameter_group.blockers.append(cluster)
+
+        for n in range(counts['databases']):
+            vpc = vpcs[n % len(vpcs)]
+            arn = f"arn:aws:rds:{region}:{ACCOUNT}"
+            database = self._add(region, 'rds_cluster', f"xelta-db-{n}", f"{arn}:cluster:xelta-db-{n}", 'rds:cluster')
+            subnet_group = self._add(region, 'rds_subnet_group', f"xelta-db-subnets-{n}",
+                                     f"{arn}:subgrp:xelta-db-subnets-{n}", 'rds:subgrp')
+            parameter_group = self._add(region, 'rds_parameter_group', f"xelta-db-params-{n}",
+                                        f"{arn}:cluster-pg:xelta-db-params-{n}", 'rds:cluster-pg')
+            place(database, vpc, n)
+            subnet_group.blockers.append(database)
+            parameter_group.blockers.append(database)
+
+        for n in range(counts['buckets']):
+            name = f"xelta-bench-results-{region}-{n}"
+            self._add(region, 's3_bucket', name, f"arn:aws:s3:::{name}", 's3')
+            self.buckets[(region, name)] = FakeBucket(counts['objects_per_bucket'])
+
+        if counts['ecs_services']:
+            arn = f"arn:aws:ecs:{region}:{ACCOUNT}"
+            cluster = self._add(region, 'ecs_cluster', f"xelta-{region}", f"{arn}:cluster/xelta-{region}", 'ecs:cluster')
+            target_groups = [r for r in self.by_region[region] if r.kind == 'target_group']
+            for n in range(counts['ecs_services']):
+                name = f"{cluster.name}/service-{n}"
+                service = self._add(region, 'ecs_service', name, f"{arn}:service/{name}", 'ecs:service')
+                self.services[(region, name)] = {'desired': 2, 'drained_at': None, 'scaling': True}
+                cluster.blockers.append(service)
+                place(service, vpcs[n % len(vpcs)], n)
+                if target_groups:
+                    target_groups[n % len(target_groups)].blockers.append(service)
+                family = f"xelta-{region}-service-{n}:1"
+                self._add(region, 'ecs_task_definition', family, f"{arn}:task-definition/{family}", 'ecs:task-definition')
+
+        arn = f"arn:aws:lambda:{region}:{ACCOUNT}"
+        functions = []
+        for n in range(counts['functions']):
+            name = f"xelta-{region}-handler-{n}"
+            functions.append(self._add(region, 'lambda_function', name, f"{arn}:function:{name}", 'lambda:function'))
+        queues = []
+        for n in range(counts['queues']):
+            name = f"xelta-{region}-jobs-{n}"
+            url = f"https://sqs.{region}.amazonaws.com/{ACCOUNT}/{name}"
+            queues.append(self._add(region, 'sqs_queue', url, f"arn:aws:sqs:{region}:{ACCOUNT}:{name}", 'sqs'))
+        for n in range(counts['tables']):
+            name = f"xelta-{region}-jobs-{n}"
+            self._add(region, 'dynamodb_table', name, f"arn:aws:dynamodb:{region}:{ACCOUNT}:table/{name}",
+                      'dynamodb:table')
+        for n in range(counts['event_source_mappings'] if functions and queues else 0):
+            mapping_uuid = str(uuid.UUID(int=next(self._serial)))
+            mapping = self._add(region, 'lambda_event_source_mapping', mapping_uuid,
+                                f"{arn}:event-source-mapping:{mapping_uuid}", 'lambda:event-source-mapping')
+            self.mappings.setdefault((region, functions[n % len(functions)].name), []).append(mapping)
+
+    def remaining(self, region=None):
+        """Resources not yet gone, in one region or all of them"""
+        now = time.monotonic()
+        return [
+            resource for resource in self.resources.values()
+            if (region is None or resource.region == region) and not self._gone(resource, now)
+        ]
+
+    def write_state(self, path):
+        """Write the tagged inventory as a Terraform state, in the attribute shapes the AWS provider uses"""
+        with open(path, 'w') as f:
+            f.write('{"version": 4, "serial": 1, "outputs": {}, "resources": [')
+            for n, item in enumerate(r for r in self.resources.values() if r.tags):
+                attributes = {'id': item.name, 'arn': item.arn, 'tags': {t['Key']: t['Value'] for t in item.tags}}
+                if item.kind == 's3_bucket':
+                    attributes['region'] = item.region
+                elif item.kind == 'ecs_service':
+                    # The provider keeps a service's ARN in its id alone
+                    attributes['id'] = attributes.pop('arn')
+                elif item.kind in ('nat_gateway', 'elastic_ip'):
+                    del attributes['arn']
+                elif item.kind == 'lambda_event_source_mapping':
+                    del attributes['arn']
+                    attributes['uuid'] = item.name
+                f.write(',' if n else '')
+                json.dump({'mode': 'managed', 'type': STATE_TYPES[item.kind], 'name': f"r{n}",
+                           'provider': f"{STATE_PROVIDER}.{item.region.replace('-', '_')}",
+                           'instances': [{'schema_version': 0, 'attributes': attributes}]}, f)
+            f.write(']}')
+
+    # State
+
+    def _gone(self, resource, now):
+        return resource.gone_at is not None and now >= resource.gone_at
+
+    def _blocking(self, resource, now):
+        # Dependents keep blocking for a while after they disappear, like lingering ENIs
+        return resource.gone_at is None or now < resource.gone_at + self.consistency_lag
+
+    def _find(self, region, kind, name, now):
+        resource = self.resources.get((region, kind, name))
+        if resource is None or self._gone(resource, now):
+            raise FakeError(NOT_FOUND[kind], f"{name} not found")
+        return resource
+
+    def _delete(self, resource, now):
+        if resource.gone_at is not None:
+            return
+        for blocker in resource.blockers:
+            if self._blocking(blocker, now):
+                raise FakeError(IN_USE_CODES.get(resource.kind, 'DependencyViolation'),
+                                f"{resource.name} has a dependent object: {blocker.name}")
+        if resource.kind == 'internet_gateway' and resource.attached_to:
+            raise FakeError('DependencyViolation', f"{resource.name} is attached to {resource.attached_to.name}")
+        resource.gone_at = now + self.settle * SETTLE_WEIGHTS.get(resource.kind, 0)
+        for member in resource.cascade:
+            if member.gone_at is None:
+                member.gone_at = resource.gone_at
+
+    def _state(self, resource, now, active='ACTIVE', deleting='DELETING'):
+        return deleting if resource.gone_at is not None else active
+
+    # Operations
+
+    def _get_resources(self, region, params, now):
+        if 'ResourceARNList' in params:
+            # Lookups by ARN are a single page; unknown and deleted ARNs are left out
+            found = (self.by_arn.get(arn) for arn in params['ResourceARNList'])
+            return {'ResourceTagMappingList': [
+                {'ResourceARN': resource.arn, 'Tags': resource.tags} for resource in found
+                if resource is not None and resource.region == region and not self._gone(resource, now)
+            ]}
+        type_filters = set(params.get('ResourceTypeFilters') or ())
+        # Filters are ANDed; the values within one are ORed, and a filter without values matches any
+        tag_filters = [(f['Key'], set(f.get('Values') or ())) for f in params.get('TagFilters', [])]
+        start = int(params.get('PaginationToken') or 0)
+        per_page = params.get('ResourcesPerPage', 100)
+        resources = self.by_region.get(region, [])
+        page = []
+        position = start
+        while position < len(resources) and len(page) < per_page:
+            resource = resources[position]
+            position += 1
+            if self._gone(resource, now):
+                continue
+            if type_filters and resource.type_filter not in type_filters:
+                continue
+            tags = {tag['Key']: tag['Value'] for tag in resource.tags}
+            if not all(key in tags and (not values or tags[key] in values) for key, values in tag_filters):
+                continue
+            page.append({'ResourceARN': resource.arn, 'Tags': resource.tags})
+        response = {'ResourceTagMappingList': page}
+        if position < len(resources):
+            response['PaginationToken'] = str(position)
+        return response
+
+    def _describe_regions(self, region, params, now):
+        return {'Regions': [{'RegionName': name, 'OptInStatus': 'opt-in-not-required'} for name in ENABLED_REGIONS]}
+
+    def _describe_internet_gateways(self, region, params, now):
+        gateways = []
+        for igw_id in params.get('InternetGatewayIds', []):
+            igw = self._find(region, 'internet_gateway', igw_id, now)
+            attachments = [{'VpcId': igw.attached_to.name, 'State': 'available'}] if igw.attached_to else []
+            gateways.append({'InternetGatewayId': igw.name, 'Attachments': attachments})
+        return {'InternetGateways': gateways}
+
+    def _detach_internet_gateway(self, region, params, now):
+        igw = self._find(region, 'internet_gateway', params['InternetGatewayId'], now)
+        if igw.attached_to is None or igw.attached_to.name != params['VpcId']:
+            raise FakeError('Gateway.NotAttached', f"{igw.name} is not attached to {params['VpcId']}")
+        for blocker in igw.blockers:
+            if self._blocking(blocker, now):
+                raise FakeError('DependencyViolation', f"Network {params['VpcId']} has some mapped public address(es)")
+        igw.attached_to = None
+        return {}
+
+    def _describe_nat_gateways(self, region, params, now):
+        gateways = []
+        for nat_id in params.get('NatGatewayIds', []):
+            nat = self.resources.get((region, 'nat_gateway', nat_id))
+            if nat is None:
+                raise FakeError('NatGatewayNotFound', f"{nat_id} not found")
+            # Deleted NAT gateways stay visible in the 'deleted' state
+            state = 'deleted' if self._gone(nat, now) else self._state(nat, now, 'available', 'deleting')
+            gateways.append({'NatGatewayId': nat_id, 'State': state})
+        return {'NatGateways': gateways}
+
+    def _describe_addresses(self, region, params, now):
+        addresses = []
+        for allocation_id in params.get('AllocationIds', []):
+            address = self._find(region, 'elastic_ip', allocation_id, now)
+            entry = {'AllocationId': address.name}
+            if address.attached_to is not None and not self._gone(address.attached_to, now):
+                entry['AssociationId'] = f"eipassoc-{address.attached_to.name}"
+            addresses.append(entry)
+        return {'Addresses': addresses}
+
+    def _disassociate_address(self, region, params, now):
+        nat = self.resources.get((region, 'nat_gateway', params['AssociationId'].split('-', 1)[1]))
+        if nat is None or self._gone(nat, now):
+            raise FakeError('InvalidAssociationID.NotFound', f"{params['AssociationId']} not found")
+        raise FakeError('AuthFailure', "You do not have permission to access the specified resource")
+
+    def _members(self, region, params, now, kind, id_param=None):
+        if id_param in params:
+            # Described by id, which fails as a whole if any of them is gone
+            return [(member.vpc.name, member) for member in
+                    [self._find(region, kind, name, now) for name in params[id_param]]]
+        vpc_ids = next((f['Values'] for f in params.get('Filters', []) if f['Name'] == 'vpc-id'), [])
+        return [
+            (vpc_id, member) for vpc_id in vpc_ids for member in self.vpc_members.get((region, vpc_id), [])
+            if member.kind == kind and not self._gone(member, now)
+        ]
+
+    def _describe_network_interfaces(self, region, params, now):
+        filters = {f['Name']: f['Values'] for f in params.get('Filters', [])}
+        interfaces = []
+        for item in self.by_region.get(region, []):
+            if item.kind != 'network_interface' or self._gone(item, now):
+                continue
+            holders = [r.name for r in self.by_region[region] if item in r.blockers]
+            if 'vpc-id' in filters and not any(item in self.vpc_members.get((region, v), [])
+                                           for v in filters['vpc-id']):
+                continue
+            if any(name in filters and not set(filters[name]) & set(holders) for name in ('subnet-id', 'group-id')):
+                continue
+            interfaces.append({'NetworkInterfaceId': item.name, 'Status': 'available'})
+        return {'NetworkInterfaces': interfaces}
+
+    def _describe_vpc_endpoints(self, region, params, now):
+        return {'VpcEndpoints': [{'VpcEndpointId': endpoint.name, 'VpcId': vpc_id, 'State': 'Available'}
+                                 for vpc_id, endpoint in self._members(region, params, now, 'vpc_endpoint')]}
+
+    def _delete_vpc_endpoints(self, region, params, now):
+        for endpoint_id in params['VpcEndpointIds']:
+            self._delete(self._find(region, 'vpc_endpoint', endpoint_id, now), now)
+        return {'Unsuccessful': []}
+
+    def _describe_subnets(self, region, params, now):
+        return {'Subnets': [{'SubnetId': subnet.name, 'VpcId': vpc_id}
+                            for vpc_id, subnet in self._members(region, params, now, 'subnet', 'SubnetIds')]}
+
+    def _describe_route_tables(self, region, params, now):
+        tables = []
+        for vpc_id, table in self._members(region, params, now, 'route_table', 'RouteTableIds'):
+            associations = [{'RouteTableAssociationId': f"rtbassoc-{subnet.name}", 'SubnetId': subnet.name,
+                             'Main': False}
+                            for subnet in table.blockers if not self._gone(subnet, now)]
+            tables.append({'RouteTableId': table.name, 'VpcId': vpc_id, 'Associations': associations})
+        return {'RouteTables': tables}
+
+    def _describe_security_groups(self, region, params, now):
+        groups = []
+        for vpc_id, group in self._members(region, params, now, 'security_group', 'GroupIds'):
+            referenced = self.group_rules.get((region, group.name), [])
+            permissions = [{'IpProtocol': 'tcp', 'FromPort': 443, 'ToPort': 443,
+                            'UserIdGroupPairs': [{'GroupId': name, 'UserId': ACCOUNT} for name in referenced]}]
+            groups.append({'GroupId': group.name, 'VpcId': vpc_id,
+                           'IpPermissions': permissions if referenced else [], 'IpPermissionsEgress': []})
+        return {'SecurityGroups': groups}
+
+    def _revoke_security_group_ingress(self, region, params, now):
+        group = self._find(region, 'security_group', params['GroupId'], now)
+        referenced = self.group_rules.get((region, group.name), [])
+        for permission in params['IpPermissions']:
+            for pair in permission.get('UserIdGroupPairs', []):
+                if pair['GroupId'] in referenced:
+                    referenced.remove(pair['GroupId'])
+                    target = self.resources[(region, 'security_group', pair['GroupId'])]
+                    target.blockers.remove(group)
+        return {'Return': True}
+
+    def _describe_nodegroup(self, region, params, now):
+        nodegroup = self._find(region, 'eks_nodegroup', params['nodegroupName'], now)
+        return {'nodegroup': {'nodegroupName': nodegroup.name, 'status': self._state(nodegroup, now)}}
+
+    def _describe_cluster(self, region, params, now):
+        cluster = self._find(region, 'eks_cluster', params['name'], now)
+        return {'cluster': {'name': cluster.name, 'status': self._state(cluster, now)}}
+
+    def _describe_replication_groups(self, region, params, now):
+        group = self._find(region, 'elasticache_replication_group', params['ReplicationGroupId'], now)
+        return {'ReplicationGroups': [{'ReplicationGroupId': group.name,
+                                       'Status': self._state(group, now, 'available', 'deleting')}]}
+
+    def _describe_cache_clusters(self, region, params, now):
+        cluster = self._find(region, 'elasticache_cluster', params['CacheClusterId'], now)
+        return {'CacheClusters': [{'CacheClusterId': cluster.name,
+                                   'CacheClusterStatus': self._state(cluster, now, 'available', 'deleting')}]}
+
+    def _describe_db_clusters(self, region, params, now):
+        cluster = self._find(region, 'rds_cluster', params['DBClusterIdentifier'], now)
+        return {'DBClusters': [{'DBClusterIdentifier': cluster.name,
+                                'Status': self._state(cluster, now, 'available', 'deleting')}]}
+
+    def _describe_load_balancers(self, region, params, now):
+        balancers = []
+        for arn in params.get('LoadBalancerArns', []):
+            balancer = self._find(region, 'load_balancer', arn, now)
+            balancers.append({'LoadBalancerArn': arn, 'State': {'Code': self._state(balancer, now, 'active', 'active')}})
+        return {'LoadBalancers': balancers}
+
+    def _bucket(self, region, params, now):
+        self._find(region, 's3_bucket', params['Bucket'], now)
+        return self.buckets[(region, params['Bucket'])]
+
+    def _list_object_versions(self, region, params, now):
+        bucket = self._bucket(region, params, now)
+        return bucket.list_versions(params.get('Prefix', ''), params.get('Delimiter', ''),
+                                    params.get('KeyMarker'), params.get('VersionIdMarker'),
+                                    min(params.get('MaxKeys', 1000), 1000))
+
+    def _delete_objects(self, region, params, now):
+        self._bucket(region, params, now).delete(params['Delete']['Objects'])
+        return {'Errors': []} if params['Delete'].get('Quiet') else {'Deleted': params['Delete']['Objects']}
+
+    def _list_multipart_uploads(self, region, params, now):
+        uploads = self._bucket(region, params, now).uploads
+        return {'Uploads': [{'Key': key, 'UploadId': upload_id} for key, upload_id in sorted(uploads)],
+                'IsTruncated': False}
+
+    def _abort_multipart_upload(self, region, params, now):
+        uploads = self._bucket(region, params, now).uploads
+        if (params['Key'], params['UploadId']) not in uploads:
+            raise FakeError('NoSuchUpload', f"{params['UploadId']} not found")
+        uploads.discard((params['Key'], params['UploadId']))
+        return {}
+
+    def _delete_bucket(self, region, params, now):
+        bucket = self._bucket(region, params, now)
+        if bucket.live or bucket.uploads:
+            raise FakeError('BucketNotEmpty', f"{params['Bucket']} is not empty")
+        self._delete(self._find(region, 's3_bucket', params['Bucket'], now), now)
+        return {}
+
+    def _service(self, region, params, now):
+        return self._find(region, 'ecs_service', f"{params['cluster']}/{params['service']}", now)
+
+    def _running(self, region, service, now):
+        state = self.services[(region, service.name)]
+        if state['desired'] or now < state['drained_at']:
+            return 2
+        return 0
+
+    def _deregister_scalable_target(self, region, params, now):
+        name = params['ResourceId'].split('/', 1)[1]
+        state = self.services.get((region, name))
+        if state is None or not state['scaling']:
+            raise FakeError('ObjectNotFoundException', f"No scalable target for {params['ResourceId']}")
+        state['scaling'] = False
+        return {}
+
+    def _update_service(self, region, params, now):
+        service = self._service(region, params, now)
+        if service.gone_at is not None:
+            raise FakeError('ServiceNotActiveException', f"{service.name} is not active")
+        state = self.services[(region, service.name)]
+        if params.get('desiredCount') == 0 and state['desired']:
+            state['desired'] = 0
+            state['drained_at'] = now + self.settle * ECS_DRAIN_WEIGHT
+        return {'service': {'serviceName': service.name}}
+
+    def _describe_services(self, region, params, now):
+        services, failures = [], []
+        for name in params['services']:
+            service = self.resources.get((region, 'ecs_service', f"{params['cluster']}/{name}"))
+            if service is None:
+                failures.append({'arn': name, 'reason': 'MISSING'})
+                continue
+            if self._gone(service, now):
+                status = 'INACTIVE'
+            else:
+                status = 'DRAINING' if service.gone_at is not None else 'ACTIVE'
+            running = 0 if status != 'ACTIVE' else self._running(region, service, now)
+            services.append({'serviceName': name, 'status': status, 'runningCount': running, 'pendingCount': 0})
+        return {'services': services, 'failures': failures}
+
+    def _delete_service(self, region, params, now):
+        service = self._service(region, params, now)
+        if self._running(region, service, now) and not params.get('force'):
+            raise FakeError('InvalidParameterException', "The service cannot be stopped while it is scaled above 0")
+        self._delete(service, now)
+        return {'service': {'serviceName': service.name}}
+
+    def _deregister_task_definition(self, region, params, now):
+        self._find(region, 'ecs_task_definition', params['taskDefinition'], now)
+        return {'taskDefinition': {'status': 'INACTIVE'}}
+
+    def _delete_task_definitions(self, region, params, now):
+        for name in params['taskDefinitions']:
+            self._delete(self._find(region, 'ecs_task_definition', name, now), now)
+        return {'taskDefinitions': [], 'failures': []}
+
+    def _list_event_source_mappings(self, region, params, now):
+        mappings = [
+            {'UUID': mapping.name, 'State': 'Deleting' if mapping.gone_at is not None else 'Enabled'}
+            for mapping in self.mappings.get((region, params.get('FunctionName')), [])
+            if not self._gone(mapping, now)
+        ]
+        return {'EventSourceMappings': mappings}
+
+    def _get_event_source_mapping(self, region, params, now):
+        mapping = self._find(region, 'lambda_event_source_mapping', params['UUID'], now)
+        return {'UUID': mapping.name, 'State': self._state(mapping, now, 'Enabled', 'Deleting')}
+
+    def _describe_table(self, region, params, now):
+        table = self._find(region, 'dynamodb_table', params['TableName'], now)
+        return {'Table': {'TableName': table.name, 'TableStatus': self._state(table, now)}}
+
+    def _get_queue_url(self, region, params, now):
+        url = f"https://sqs.{region}.amazonaws.com/{params['QueueOwnerAWSAccountId']}/{params['QueueName']}"
+        return {'QueueUrl': self._find(region, 'sqs_queue', url, now).name}
+
+    def _distribution(self, params, now):
+        distribution = self._find(cleanup.EDGE_REGION, 'cloudfront_distribution', params['Id'], now)
+        return distribution, self.distributions[distribution.name]
+
+    def _distribution_config(self, state):
+        # The smallest config UpdateDistribution's parameter validation accepts
+        return {
+            'CallerReference': 'bench',
+            'Comment': '',
+            'Enabled': state['enabled'],
+            'Origins': {'Quantity': 1, 'Items': [{'Id': 'alb', 'DomainName': 'alb.example.com'}]},
+            'DefaultCacheBehavior': {'TargetOriginId': 'alb', 'ViewerProtocolPolicy': 'redirect-to-https'},
+        }
+
+    def _get_distribution_config(self, region, params, now):
+        _, state = self._distribution(params, now)
+        return {'DistributionConfig': self._distribution_config(state), 'ETag': state['etag']}
+
+    def _get_distribution(self, region, params, now):
+        distribution, state = self._distribution(params, now)
+        status = 'Deployed' if now >= state['deployed_at'] else 'InProgress'
+        return {'Distribution': {'Id': distribution.name, 'Status': status,
+                                 'DistributionConfig': self._distribution_config(state)},
+                'ETag': state['etag']}
+
+    def _check_etag(self, state, params):
+        if params.get('IfMatch') != state['etag']:
+            raise FakeError('PreconditionFailed', f"ETag {params.get('IfMatch')} is not current")
+
+    def _update_distribution(self, region, params, now):
+        distribution, state = self._distribution(params, now)
+        self._check_etag(state, params)
+        state['enabled'] = params['DistributionConfig']['Enabled']
+        state['deployed_at'] = now + self.settle * DISTRIBUTION_DEPLOY_WEIGHT
+        state['etag'] = f"E{int(state['etag'][1:]) + 1}"
+        return {'ETag': state['etag']}
+
+    def _delete_distribution(self, region, params, now):
+        distribution, state = self._distribution(params, now)
+        self._check_etag(state, params)
+        if state['enabled'] or now < state['deployed_at']:
+            raise FakeError('DistributionNotDisabled', f"{distribution.name} has not been disabled and deployed")
+        self._delete(distribution, now)
+        return {}
+
+    def _web_acl(self, region, params, now):
+        return self._find(region, 'waf_web_acl', params['Name'], now)
+
+    def _get_web_acl(self, region, params, now):
+        web_acl = self._web_acl(region, params, now)
+        return {'WebACL': {'Name': web_acl.name, 'Id': params['Id']}, 'LockToken': web_acl.arn}
+
+    def _delete_web_acl(self, region, params, now):
+        web_acl = self._web_acl(region, params, now)
+        if params['LockToken'] != web_acl.arn:
+            raise FakeError('WAFOptimisticLockException', f"Stale lock token for {web_acl.name}")
+        self._delete(web_acl, now)
+        return {'NextLockToken': web_acl.arn}
+
+    OPERATIONS = {
+        ('resourcegroupstaggingapi', 'GetResources'): _get_resources,
+        ('ec2', 'DescribeRegions'): _describe_regions,
+        ('ec2', 'DescribeInternetGateways'): _describe_internet_gateways,
+        ('ec2', 'DetachInternetGateway'): _detach_internet_gateway,
+        ('ec2', 'DescribeNatGateways'): _describe_nat_gateways,
+        ('ec2', 'DescribeAddresses'): _describe_addresses,
+        ('ec2', 'DisassociateAddress'): _disassociate_address,
+        ('ec2', 'DescribeNetworkInterfaces'): _describe_network_interfaces,
+        ('ec2', 'DescribeVpcEndpoints'): _describe_vpc_endpoints,
+        ('ec2', 'DeleteVpcEndpoints'): _delete_vpc_endpoints,
+        ('ec2', 'DescribeSubnets'): _describe_subnets,
+        ('ec2', 'DescribeRouteTables'): _describe_route_tables,
+        ('ec2', 'DescribeSecurityGroups'): _describe_security_groups,
+        ('ec2', 'RevokeSecurityGroupIngress'): _revoke_security_group_ingress,
+        ('eks', 'DescribeNodegroup'): _describe_nodegroup,
+        ('eks', 'DescribeCluster'): _describe_cluster,
+        ('elasticache', 'DescribeReplicationGroups'): _describe_replication_groups,
+        ('elasticache', 'DescribeCacheClusters'): _describe_cache_clusters,
+        ('rds', 'DescribeDBClusters'): _describe_db_clusters,
+        ('elbv2', 'DescribeLoadBalancers'): _describe_load_balancers,
+        ('s3', 'ListObjectVersions'): _list_object_versions,
+        ('s3', 'DeleteObjects'): _delete_objects,
+        ('s3', 'ListMultipartUploads'): _list_multipart_uploads,
+        ('s3', 'AbortMultipartUpload'): _abort_multipart_upload,
+        ('s3', 'DeleteBucket'): _delete_bucket,
+        ('application-autoscaling', 'DeregisterScalableTarget'): _deregister_scalable_target,
+        ('ecs', 'UpdateService'): _update_service,
+        ('ecs', 'DescribeServices'): _describe_services,
+        ('ecs', 'DeleteService'): _delete_service,
+        ('ecs', 'DeregisterTaskDefinition'): _deregister_task_definition,
+        ('ecs', 'DeleteTaskDefinitions'): _delete_task_definitions,
+        ('lambda', 'ListEventSourceMappings'): _list_event_source_mappings,
+        ('lambda', 'GetEventSourceMapping'): _get_event_source_mapping,
+        ('dynamodb', 'DescribeTable'): _describe_table,
+        ('sqs', 'GetQueueUrl'): _get_queue_url,
+        ('cloudfront', 'GetDistributionConfig'): _get_distribution_config,
+        ('cloudfront', 'GetDistribution'): _get_distribution,
+        ('cloudfront', 'UpdateDistribution'): _update_distribution,
+        ('cloudfront', 'DeleteDistribution'): _delete_distribution,
+        ('wafv2', 'GetWebACL'): _get_web_acl,
+        ('wafv2', 'DeleteWebACL'): _delete_web_acl,
+    }
+
+    def _call(self, service, region, operation, params, now):
+        handler = self.OPERATIONS.get((service, operation))
+        if handler is not None:
+            return handler(self, region, params, now)
+        if (service, operation) in DELETE_OPERATIONS:
+            kind, param = DELETE_OPERATIONS[(service, operation)]
+            self._delete(self._find(region, kind, params[param], now), now)
+            return {}
+        raise FakeError('InvalidAction', f"{service}.{operation} is not simulated")
+
+    def _throttled(self, service, region, now):
+        if self.throttle and self.random.random() < self.throttle:
+            return True
+        if not self.server_rate:
+            return False
+        # Server-side token bucket per (service, region), one second of burst
+        tokens, updated = self._server_tokens.get((service, region), (self.server_rate, now))
+        tokens = min(self.server_rate, tokens + (now - updated) * self.server_rate)
+        if tokens < 1:
+            self._server_tokens[(service, region)] = (tokens, now)
+            return True
+        self._server_tokens[(service, region)] = (tokens - 1, now)
+        return False
+
+    def _respond(self, client, service, region, model, context):
+        params = context.pop('fake_params', {})
+        service_id = model.service_model.service_id.hyphenize()
+        attempts = 0
+        while True:
+            attempts += 1
+            if self.latency:
+                time.sleep(self.latency * self.random.uniform(1 - self.jitter, 1 + self.jitter))
+            with self._lock:
+                now = time.monotonic()
+                self.calls[service] += 1
+                try:
+                    if self._throttled(service, region, now):
+                        self.throttled[service] += 1
+                        raise FakeError(THROTTLE_CODES.get(service, 'Throttling'), 'Rate exceeded')
+                    status, parsed = 200, self._call(service, region, model.name, params, now)
+                except FakeError as e:
+                    status, parsed = 400, {'Error': {'Code': e.code, 'Message': e.message}}
+            parsed['ResponseMetadata'] = {'HTTPStatusCode': status, 'RetryAttempts': attempts - 1}
+            http = AWSResponse(f"https://{service}.{region}.amazonaws.com/", status, {}, None)
+            # Let botocore's retry policy (and cleanup.py's limiter) see each attempt
+            delay = first_non_none_response(client.meta.events.emit(
+                f"needs-retry.{service_id}.{model.name}",
+                response=(http, parsed), endpoint=None, operation=model,
+                attempts=attempts, caught_exception=None, request_dict={'context': context},
+            ))
+            if not delay:
+                return http, parsed
+            time.sleep(delay)
+
+    def attach(self, client):
+        """Answer every call the client makes in-process"""
+        service = client.meta.service_model.service_name
+        region = client.meta.region_name
+
+        def remember_params(params=None, context=None, **kwargs):
+            context['fake_params'] = dict(params)
+
+        def respond(model=None, context=None, **kwargs):
+            return self._respond(client, service, region, model, context)
+
+        client.meta.events.register('before-parameter-build', remember_params)
+        client.meta.events.register_last('before-call', respond)
+
+    def session(self, *args, **kwargs):
+        """A boto3 Session whose clients talk to this fake"""
+        session = boto3.Session(aws_access_key_id='fake', aws_secret_access_key='fake',
+                                region_name=cleanup.REGIONS[0])
+        world = self
+
+        def add_fake_endpoint(base_classes, **kwargs):
+            class FakeEndpoint:
+                def __init__(self, *args, **kwargs):
+                    super().__init__(*args, **kwargs)
+                    world.attach(self)
+            base_classes.insert(0, FakeEndpoint)
+
+        session.events.register('creating-client-class', add_fake_endpoint)
+        return session
+
+# Execution modes compared by the sim benchmark: (engine, deletion workers per region, regions at once)
+MODES = {
+    'serial': ('threads', 1, 1),
+    'concurrent': ('threads', cleanup.MAX_WORKERS, cleanup.REGION_WORKERS),
+    'asyncio': ('asyncio', cleanup.MAX_WORKERS, cleanup.REGION_WORKERS),
+}
+
+@contextlib.contextmanager
+def _simulated(world, args, mode):
+    """Point cleanup.py at the fake, with timings compressed to match the simulation"""
+    engine, workers, region_workers = MODES[mode]
+    with contextlib.ExitStack() as stack:
+        for name, value in [
+            ('ENGINE', engine),
+            ('MAX_WORKERS', workers),
+            ('REGION_WORKERS', region_workers),
+            ('POLL_INTERVAL', args.poll_interval),
+            ('RETRY_BASE_DELAY', args.poll_interval),
+            ('RETRY_MAX_DELAY', args.poll_interval * 8),
+            ('metrics', cleanup.Metrics()),
+            ('durations', cleanup.DurationStats()),
+            ('boto3', types.SimpleNamespace(Session=world.session)),
+        ]:
+            stack.enter_context(mock.patch.object(cleanup, name, value))
+        if not args.verbose:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w'))))
+        yield
+
+def _run_process_region(world, args, mode):
+    region = args.region
+    with _simulated(world, args, mode):
+        clients = cleanup.ClientPool(world.session(), limiter=cleanup.RateLimiter())
+        if cleanup.ENGINE == 'asyncio':
+            asyncio.run(_process_region_async(clients, region))
+        else:
+            cleanup.process_region(clients, region)
+    return [region], False
+
+async def _process_region_async(clients, region):
+    engine = cleanup.AsyncEngine()
+    try:
+        await cleanup.process_region_async(engine, clients, region)
+    finally:
+        engine.close()
+
+def _run_main(world, args, mode, extra_args=()):
+    engine, workers, region_workers = MODES[mode]
+    with tempfile.TemporaryDirectory() as scratch, _simulated(world, args, mode):
+        argv = ['cleanup.py', '--engine', engine, '--workers', str(workers), '--region-workers', str(region_workers),
+                '--journal', os.path.join(scratch, 'journal.jsonl'), '--metrics-json', '', '--metrics-prom', '', '--durations', '',
+                *extra_args]
+        with mock.patch.object(sys, 'argv', argv), \
+                mock.patch.object(cleanup, 'input', lambda prompt: 'DELETE', create=True):
+            cleanup.main()
+    return cleanup.REGIONS, True
+
+def _run_main_state(world, args, mode):
+    # Discovery from a Terraform state instead of the tag scan
+    with tempfile.TemporaryDirectory() as scratch, \
+            mock.patch.object(cleanup, 'state_inventory', None):
+        path = os.path.join(scratch, 'terraform.tfstate')
+        world.write_state(path)
+        return _run_main(world, args, mode, ['--state', path])
+
+def _run_main_all_regions(world, args, mode):
+    # Every enabled region is probed; only the populated ones should be processed
+    return _run_main(world, args, mode, ['--all-regions'])
+
+def _run_plan_apply(world, args, mode):
+    # Discovery is paid for once, by plan; apply only re-checks the planned resources
+    with tempfile.TemporaryDirectory() as scratch, \
+            mock.patch.object(cleanup, 'active_plan', None):
+        path = os.path.join(scratch, 'plan.json')
+        _run_main(world, args, mode, ['plan', '--plan-file', path])
+        return _run_main(world, args, mode, ['apply', '--plan-file', path])
+
+SCENARIOS = {
+    'process_region': _run_process_region,
+    'main': _run_main,
+    'main_state': _run_main_state,
+    'main_all_regions': _run_main_all_regions,
+    'plan_apply': _run_plan_apply,
+}
+
+def _measure(args, scenario, mode):
+    """Run one scenario against a fresh simulated account"""
+    world = FakeAWS(latency=args.latency / 1000, throttle=args.throttle, server_rate=args.server_rate,
+                    settle=args.settle, consistency_lag=args.consistency_lag, seed=args.seed)
+    world.populate(Inventory(**{name: getattr(args, name) for name in vars(Inventory())}),
+                   cleanup.REGIONS)
+    gc.collect()
+    baseline = _rss()
+    if args.tracemalloc:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        # Which regions the scenario covers, and whether it includes the edge track
+        regions, edge = SCENARIOS[scenario](world, args, mode)
+        elapsed = time.perf_counter() - start
+        if args.tracemalloc:
+            _, peak = tracemalloc.get_traced_memory()
+        else:
+            # ru_maxrss is in KiB on Linux
+            peak = max(0, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 - baseline)
+    finally:
+        if args.tracemalloc:
+            tracemalloc.stop()
+    in_scope = lambda r: r.region in regions and (edge or r.kind not in cleanup.EDGE_KINDS)
+    resources = [r for r in world.resources.values() if in_scope(r)]
+    left = [r for r in world.remaining() if in_scope(r)]
+    return {
+        'scenario': scenario,
+        'mode': mode,
+        'seconds': round(elapsed, 3),
+        'api_calls': sum(world.calls.values()),
+        'calls_by_service': dict(world.calls),
+        'throttled': sum(world.throttled.values()),
+        'peak_memory_mib': round(peak / 2**20, 2),
+        'resources': len(resources),
+        'left': len(left),
+    }
+
+def _rss():
+    """Current resident set size in bytes"""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+def _measure_in_child(args, scenario, mode):
+    # A fresh process per run keeps runs independent and gives each its own peak RSS
+    context = multiprocessing.get_context('fork')
+    parent, child = context.Pipe(duplex=False)
+
+    def run():
+        try:
+            child.send((_measure(args, scenario, mode), None))
+        except BaseException:
+            child.send((None, traceback.format_exc()))
+
+    process = context.Process(target=run)
+    process.start()
+    result, error = parent.recv()
+    process.join()
+    if error:
+        raise RuntimeError(f"{scenario} ({mode}) failed:\n{error}")
+    return result
+
+def bench_sim(args):
+    """Compare serial and concurrent execution against a simulated account"""
+    if args.region is None:
+        args.region = cleanup.REGIONS[0]
+    results = []
+    for scenario in args.scenarios:
+        for mode in args.modes:
+            log(f"Running {scenario} ({mode})...", Colors.OKCYAN)
+            results.append(_measure_in_child(args, scenario, mode))
+
+    log(f"\n  {'scenario':<18}{'mode':<12}{'wall':>9}{'API calls':>11}{'throttled':>11}"
+        f"{'peak MiB':>10}{'deleted':>15}", Colors.BOLD)
+    for r in results:
+        log(f"  {r['scenario']:<18}{r['mode']:<12}{r['seconds']:>8.2f}s{r['api_calls']:>11,}{r['throttled']:>11,}"
+            f"{r['peak_memory_mib']:>10.1f}{r['resources'] - r['left']:>7,}/{r['resources']:<7,}",
+            Colors.FAIL if r['left'] else Colors.OKBLUE)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'config': {k: v for k, v in vars(args).items() if k != 'func'}, 'results': results},
+                      f, indent=2)
+        log(f"\nResults written to {args.json}", Colors.OKBLUE)
+
+    if any(r['left'] for r in results):
+        log("✗ Some simulated resources were not deleted", Colors.FAIL)
+        return 1
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for cleanup.py")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    arn = commands.add_parser('arn', help="ARN classification micro-benchmark")
+    arn.add_argument('--count', type=int, default=1_000_000, help="synthetic ARNs to classify")
+    arn.add_argument('--repeat', type=int, default=3, help="runs per classifier; the best is reported")
+    arn.set_defaults(func=bench_arn)
+
+    sim = commands.add_parser('sim', help="process_region/main against a simulated account")
+    sim.add_argument('--scenarios', type=lambda v: v.split(','), default=list(SCENARIOS),
+                     help=f"comma-separated, from {', '.join(SCENARIOS)} (default: all)")
+    sim.add_argument('--modes', type=lambda v: v.split(','), default=list(MODES),
+                     help=f"comma-separated, from {', '.join(MODES)} (default: all)")
+    sim.add_argument('--region', help="region for the process_region scenario (default: the first of REGIONS)")
+    inventory = sim.add_argument_group("inventory, spread across REGIONS")
+    for name, default in vars(Inventory()).items():
+        inventory.add_argument(f"--{name.replace('_', '-')}", type=int, default=default)
+    behaviour = sim.add_argument_group("simulated AWS behaviour")
+    behaviour.add_argument('--latency', type=float, default=10, help="mean per-call latency in ms (default: 10)")
+    behaviour.add_argument('--throttle', type=float, default=0.0,
+                           help="probability that any call is throttled (default: 0)")
+    behaviour.add_argument('--server-rate', type=float, default=0,
+                           help="calls/second per service and region before AWS throttles; 0 is unlimited")
+    behaviour.add_argument('--settle', type=float, default=1.0,
+                           help="seconds the slowest asynchronous deletion (node groups) takes (default: 1)")
+    behaviour.add_argument('--consistency-lag', type=float, default=0.1,
+                           help="seconds a deleted resource keeps blocking its dependencies (default: 0.1)")
+    behaviour.add_argument('--poll-interval', type=float, default=0.1,
+                           help="cleanup.py's POLL_INTERVAL and retry base delay during the run (default: 0.1)")
+    behaviour.add_argument('--seed', type=int, default=0)
+    sim.add_argument('--tracemalloc', action='store_true',
+                     help="report peak traced Python memory instead of RSS growth (much slower)")
+    sim.add_argument('--json', help="also write the results to this file")
+    sim.add_argument('--verbose', action='store_true', help="show cleanup.py's output")
+    sim.set_defaults(func=bench_sim)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+if __name__ == "__main__":
+    main()
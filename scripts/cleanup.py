@@ -2,20 +2,187 @@
 """
 AWS Resource Cleanup Script for Terraform-managed Resources
 Deletes resources tagged with 'ManagedBy=terraform' or 'managed_by=terraform'
-Handles dependencies by deleting resources in the correct order.
+Handles dependencies by deleting each resource as soon as everything it
+depends on is gone, running independent deletions concurrently.
 """
 
+import argparse
+import asyncio
 import boto3
+import codecs
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import queue
+import random
+import re
 import time
 import sys
+import threading
+import traceback
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from fnmatch import fnmatchcase
+from botocore.config import Config
+from botocore.credentials import CredentialProvider, DeferredRefreshableCredentials
+from botocore.session import get_session as get_botocore_session
 from botocore.exceptions import ClientError
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 
 # Configuration
 REGIONS = ['us-east-1', 'eu-central-1', 'ap-south-1']
 TAG_KEY = 'ManagedBy'
 TAG_VALUES = ['terraform', 'Terraform']
-DRY_RUN = False  # Set to False to actually delete resources
+DRY_RUN = False  # Set to False to actually delete resources; `cleanup.py plan` previews without rescanning on apply
+MAX_WORKERS = 10  # Concurrent deletions per region
+REGION_WORKERS = len(REGIONS)  # Regions processed at once; 1 runs them serially
+# --all-regions replaces REGIONS with the enabled regions (listed from
+# REGION_DISCOVERY_REGION) that hold at least one tagged resource. Up to
+# REGION_PROBE_WORKERS regions are probed at once, each with a tag scan that
+# stops at its first match.
+REGION_DISCOVERY_REGION = 'us-east-1'
+REGION_PROBE_WORKERS = 16
+# CloudFront distributions, their WAF web ACLs and certificates are managed from
+# us-east-1. They are torn down on a background track alongside the regions.
+EDGE_REGION = 'us-east-1'
+
+# Multi-account runs (--role-arn / --accounts-file). Each role is assumed once, on
+# first use, and botocore refreshes its credentials shortly before they expire.
+# Every (account, region) pair is a unit of work on one pool of UNIT_WORKERS
+# threads, with at most REGION_WORKERS of an account's units running at once.
+ROLE_SESSION_NAME = 'terraform-cleanup'
+ROLE_SESSION_SECONDS = 3600
+UNIT_WORKERS = 24
+
+# Execution engine. 'threads' runs each deletion, including its state polling, on
+# one of MAX_WORKERS threads per region. 'asyncio' runs every deletion, poll and
+# retry as a task on one event loop; blocking botocore calls go to a shared pool
+# of ASYNC_CALL_WORKERS threads, with at most ASYNC_SERVICE_CONCURRENCY of them
+# in flight per (service, region).
+ENGINE = 'threads'
+ASYNC_CALL_WORKERS = 32
+ASYNC_SERVICE_CONCURRENCY = 16
+
+# botocore retry behaviour for every client ('adaptive' or 'standard')
+CLIENT_RETRY_MODE = 'adaptive'
+CLIENT_MAX_ATTEMPTS = 10
+
+# Client-side rate limits in calls/second per (service, region). Each bucket starts
+# at its baseline, halves when AWS throttles us and creeps back up (by
+# RATE_INCREASE calls/second per second) while calls succeed, up to
+# RATE_CEILING_FACTOR times the baseline.
+RATE_LIMITS = {
+    'ec2': 20,
+    'elbv2': 10,
+    'eks': 5,
+    'elasticache': 5,
+    'rds': 5,
+    'resourcegroupstaggingapi': 5,
+    's3': 100,
+}
+DEFAULT_RATE_LIMIT = 5
+RATE_FLOOR = 0.5
+RATE_INCREASE = 0.5
+RATE_CEILING_FACTOR = 4
+
+# S3 buckets are emptied before they are deleted. Object versions and delete
+# markers are listed page by page (each top-level prefix on its own lister) and
+# removed in DeleteObjects batches on a worker pool. At most
+# S3_MAX_PENDING_BATCHES batches are held at once, so memory use does not grow
+# with the size of the bucket.
+S3_BATCH_SIZE = 1000  # the DeleteObjects maximum
+S3_DELETE_WORKERS = 8
+S3_LIST_WORKERS = 4
+S3_MAX_PENDING_BATCHES = 16
+S3_PROGRESS_INTERVAL = 10  # seconds between objects/sec progress lines
+
+# Retrying deletions that fail with a retryable error: exponential backoff with
+# full jitter between attempts, until RETRY_DEADLINE seconds into the run
+RETRY_BASE_DELAY = 5
+RETRY_MAX_DELAY = 120
+RETRY_DEADLINE = 1800
+
+# Checkpoint journal, so an interrupted run can be resumed with --resume
+JOURNAL_PATH = 'cleanup-journal.jsonl'
+
+# Plans: `cleanup.py plan` writes what a run would delete, with its dependency
+# edges and start order, to PLAN_PATH; `cleanup.py apply` deletes exactly that
+# without scanning again. Apply re-checks the tags of the planned resources in
+# get_resources calls of TAG_CHECK_BATCH ARNs (the API maximum).
+PLAN_PATH = 'cleanup-plan.json'
+PLAN_VERSION = 2
+TAG_CHECK_BATCH = 100
+
+# Terraform state as the discovery source (--state / --state-key) instead of the
+# tag scan. The state is read STATE_CHUNK_SIZE characters at a time and only one
+# entry of its "resources" list is decoded at once, so large states stream in
+# bounded memory. --state-key reads from the S3 backend configured in backend.tf.
+STATE_BUCKET = 'xeltastate'
+STATE_BUCKET_REGION = 'ap-south-1'
+STATE_CHUNK_SIZE = 1 << 20
+# Region of resources created through the default, unaliased aws provider
+STATE_DEFAULT_REGION = 'us-east-1'
+# Resources listed in the state but not tagged, or the reverse, shown per region by --cross-check
+CROSS_CHECK_SAMPLES = 5
+
+# Completion tracking: how often to poll resource state and how long to wait
+# (in seconds) for each resource type to disappear before moving on
+POLL_INTERVAL = 15
+WAIT_TIMEOUTS = {
+    'eks_nodegroup': 1200,
+    'eks_cluster': 1200,
+    'elasticache_replication_group': 1800,
+    'elasticache_cluster': 1200,
+    'rds_cluster': 1800,
+    'load_balancer': 300,
+    'nat_gateway': 600,
+    'ecs_service': 600,
+    'lambda_event_source_mapping': 300,
+    'dynamodb_table': 600,
+    'cloudfront_distribution': 1800,
+}
+
+# Delete-to-gone durations per resource type, remembered across runs so the
+# longest chains of deletions can be started first. Each run's average for a type
+# is blended into the stored one with weight DURATION_SMOOTHING; types never seen
+# yet fall back to DEFAULT_DURATIONS (in seconds).
+DURATIONS_PATH = 'cleanup-durations.json'
+DURATION_SMOOTHING = 0.5
+DEFAULT_DURATION = 1
+DEFAULT_DURATIONS = {
+    'eks_nodegroup': 600,
+    'eks_cluster': 600,
+    'elasticache_replication_group': 900,
+    'elasticache_cluster': 600,
+    'rds_cluster': 900,
+    'load_balancer': 30,
+    'nat_gateway': 60,
+    'ecs_service': 120,
+    'lambda_event_source_mapping': 60,
+    'dynamodb_table': 30,
+    's3_bucket': 60,
+    'cloudfront_distribution': 900,
+}
+
+# Instrumentation written at exit: a JSON report and a Prometheus textfile
+# (for node_exporter's textfile collector). Empty paths disable either one.
+METRICS_JSON_PATH = 'cleanup-metrics.json'
+METRICS_PROM_PATH = 'cleanup-metrics.prom'
+# Histogram bucket upper bounds in seconds, wide enough for both single API
+# calls and half-hour waits on clusters
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 1800)
+
+# Progress events (--events): one JSON object per line for every deletion attempt,
+# plus the run's start and summary, written to a file or to stdout ('-') as they
+# happen. '' disables the stream; the colored output is unaffected either way.
+EVENTS_PATH = ''
+
+# When set, log() collects lines here instead of printing, so concurrently
+# processed regions can each be printed as one readable block
+_log_buffer = contextvars.ContextVar('log_buffer', default=None)
 
 # Color codes for output
 class Colors:
@@ -28,566 +195,3541 @@ class Colors:
     ENDC = '\033[0m'
     BOLD = '\033[1m'
 
-def log(message, color=None):
-    """Print colored log message"""
-    if color:
-        print(f"{color}{message}{Colors.ENDC}")
-    else:
-        print(message)
+class ConsoleRenderer:
+    """Subscriber printing the colored, human-readable log lines"""
+
+    def __init__(self, stream=None):
+        # None follows sys.stdout at write time, so redirecting it still works
+        self.stream = stream
+
+    def handle(self, event):
+        if event['event'] == 'log':
+            print('\n'.join(event['lines']), file=self.stream or sys.stdout)
+
+    def flush(self):
+        (self.stream or sys.stdout).flush()
+
+    def close(self):
+        self.flush()
+
+class JsonLinesWriter:
+    """Subscriber writing every structured event as a line of JSON, to a path or '-' for stdout"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = sys.stdout if path == '-' else open(path, 'a', encoding='utf-8')
+
+    def handle(self, event):
+        if event['event'] != 'log':
+            self.file.write(json.dumps(event, separators=(',', ':'), default=str) + '\n')
+
+    def flush(self):
+        # Once per drained batch, so a consumer tailing the file sees events promptly
+        self.file.flush()
+
+    def close(self):
+        if self.file is sys.stdout:
+            self.file.flush()
+        else:
+            self.file.close()
+
+class EventStream:
+    """Queue of log lines and structured events, fanned out to subscribers on one writer thread
+
+    emit() only enqueues, so worker threads never wait on a terminal or a file.
+    The writer drains everything queued, hands each event to every subscriber in
+    order, and flushes them before blocking again.
+    """
+
+    def __init__(self, subscribers):
+        self.subscribers = list(subscribers)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='event-writer', daemon=True)
+        self._thread.start()
+
+    def emit(self, event):
+        self._queue.put(event)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            for event in batch:
+                if event is None:
+                    continue
+                for subscriber in list(self.subscribers):
+                    self._deliver(subscriber, subscriber.handle, event)
+            for subscriber in list(self.subscribers):
+                self._deliver(subscriber, subscriber.flush)
+            for _ in batch:
+                self._queue.task_done()
+            if batch[-1] is None:
+                return
+
+    def _deliver(self, subscriber, method, *args):
+        try:
+            method(*args)
+        except Exception as e:
+            # A broken subscriber (a full disk, a closed pipe) must not stop the others
+            self.subscribers.remove(subscriber)
+            print(f"Event subscriber {type(subscriber).__name__} stopped: {e}", file=sys.stderr)
+
+    def flush(self):
+        """Block until everything emitted so far has been written"""
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        for subscriber in list(self.subscribers):
+            self._deliver(subscriber, subscriber.close)
+
+# Set by main for the duration of a run; without it log() prints directly
+event_stream = None
+
+def emit(event, **fields):
+    """Queue a structured event for the JSON-lines subscribers"""
+    if event_stream:
+        event_stream.emit({'event': event, 'time': round(time.time(), 3), **fields})
+
+def log_lines(lines):
+    """Write already formatted lines, such as a finished region's buffer, as one block"""
+    if event_stream:
+        event_stream.emit({'event': 'log', 'lines': lines})
+    else:
+        print('\n'.join(lines))
+
+def log(message, color=None):
+    """Write a colored log message, or buffer it while a region runs concurrently"""
+    line = f"{color}{message}{Colors.ENDC}" if color else message
+    buffer = _log_buffer.get()
+    if buffer is not None:
+        buffer.append(line)
+    else:
+        log_lines([line])
+
+def submit(pool, fn, *args):
+    """Submit work to a pool so that it logs into the caller's region buffer"""
+    return pool.submit(contextvars.copy_context().run, fn, *args)
+
+def client_config():
+    """botocore Config shared by all clients, sized for the configured concurrency"""
+    return Config(
+        max_pool_connections=max(MAX_WORKERS, S3_DELETE_WORKERS + S3_LIST_WORKERS, 10,
+                                 ASYNC_CALL_WORKERS if ENGINE == 'asyncio' else 0),
+        retries={'mode': CLIENT_RETRY_MODE, 'max_attempts': CLIENT_MAX_ATTEMPTS},
+    )
+
+# Error codes AWS uses when we exceed an API rate limit
+THROTTLE_ERROR_CODES = {
+    'Throttling',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+    'TooManyRequestsException',
+    'RequestThrottled',
+    'SlowDown',
+}
+
+class TokenBucket:
+    """Token bucket whose refill rate adapts with AIMD"""
+
+    def __init__(self, rate):
+        self.baseline = rate
+        self.rate = rate
+        self.ceiling = rate * RATE_CEILING_FACTOR
+        self.tokens = 1.0
+        self.calls = 0
+        self.throttles = 0
+        self._updated = time.monotonic()
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        # Allow bursts of up to one second's worth of calls
+        self.tokens = min(max(self.rate, 1.0), self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Block until a call may be made"""
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.calls += 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+    def succeeded(self):
+        """Additive increase: about RATE_INCREASE calls/second more per second of success"""
+        with self._lock:
+            self.rate = min(self.ceiling, self.rate + RATE_INCREASE / self.rate)
+
+    def throttled(self):
+        """Multiplicative decrease, at most once per second so one burst halves the rate once"""
+        with self._lock:
+            self.throttles += 1
+            now = time.monotonic()
+            if now - self._last_decrease >= 1:
+                self.rate = max(RATE_FLOOR, self.rate / 2)
+                self._last_decrease = now
+
+class RateLimiter:
+    """Token buckets per (service, region), applied to every call through botocore events"""
+
+    def __init__(self, rates=None):
+        self.rates = rates or RATE_LIMITS
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, service, region):
+        key = (service, region)
+        with self._lock:
+            if key not in self.buckets:
+                self.buckets[key] = TokenBucket(self.rates.get(service, DEFAULT_RATE_LIMIT))
+            return self.buckets[key]
+
+    def attach(self, client, service, region):
+        """Rate-limit every call the client makes"""
+        bucket = self.bucket(service, region)
+
+        def before_call(**kwargs):
+            bucket.acquire()
+
+        def needs_retry(response=None, request_dict=None, **kwargs):
+            # Sees every attempt, including the ones botocore retries internally
+            if response and response[1].get('Error', {}).get('Code') in THROTTLE_ERROR_CODES:
+                bucket.throttled()
+                request_dict['context']['throttle_seen'] = True
+
+        def after_call(parsed=None, context=None, **kwargs):
+            code = parsed.get('Error', {}).get('Code')
+            if code in THROTTLE_ERROR_CODES:
+                if not context.get('throttle_seen'):
+                    bucket.throttled()
+            elif code is None:
+                bucket.succeeded()
+
+        client.meta.events.register('before-call', before_call)
+        client.meta.events.register_first('needs-retry', needs_retry)
+        client.meta.events.register('after-call', after_call)
+
+    def log_state(self):
+        """Print each bucket's current rate and how often it was throttled"""
+        if not self.buckets:
+            return
+        log("\nRate limits:", Colors.OKCYAN)
+        for (service, region), bucket in sorted(self.buckets.items()):
+            log(f"  {service} [{region}]: {bucket.rate:.1f}/s (baseline {bucket.baseline}/s), "
+                f"{bucket.calls} calls, {bucket.throttles} throttled",
+                Colors.WARNING if bucket.throttles else Colors.OKBLUE)
+
+class Histogram:
+    """Counts of observations per LATENCY_BUCKETS bucket, plus their sum and maximum"""
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)  # the last bucket is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def cumulative(self):
+        """Observations at or below each bound, in Prometheus' le= order"""
+        running = 0
+        result = []
+        for count in self.counts:
+            running += count
+            result.append(running)
+        return result
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile"""
+        rank = q * self.count
+        for bound, running in zip(LATENCY_BUCKETS, self.cumulative()):
+            if running >= rank:
+                return min(bound, self.max)
+        return self.max
+
+class Metrics:
+    """Latency histograms for AWS calls, phases, DAG nodes, waits and retry backoff
+
+    Every observation is passed to the hooks registered with add_hook() as
+    hook(category, labels, seconds), so a profiler can be attached without
+    touching the script. Hooks run on the calling thread, so keep them cheap.
+    """
+
+    # category -> (Prometheus metric name, help text)
+    SERIES = {
+        'call': ('cleanup_aws_call_duration_seconds', "Latency of AWS API calls, including botocore retries"),
+        'phase': ('cleanup_phase_duration_seconds', "Duration of each phase of a region's cleanup"),
+        'node': ('cleanup_node_duration_seconds', "Time to delete one resource and confirm it is gone"),
+        'wait': ('cleanup_wait_duration_seconds', "Time spent polling until a deletion is confirmed"),
+        'backoff': ('cleanup_retry_backoff_seconds', "Backoff scheduled before retrying a deletion"),
+    }
+
+    def __init__(self):
+        self.started = time.time()
+        self.histograms = {}
+        self.retries = Counter()
+        self._hooks = ()
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        """Call hook(category, labels, seconds) for every observation"""
+        self._hooks += (hook,)
+
+    def record(self, category, labels, seconds, retries=0):
+        key = (category, tuple(labels.items()))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+            if retries:
+                self.retries[key] += retries
+        for hook in self._hooks:
+            hook(category, labels, seconds)
+
+    @contextmanager
+    def span(self, category, **labels):
+        """Time the enclosed block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(category, labels, time.perf_counter() - start)
+
+    def attach(self, client, service, region):
+        """Time every call the client makes, with its outcome and retry count"""
+
+        def before_call(context=None, **kwargs):
+            context['metrics_start'] = time.perf_counter()
+
+        def after_call(event_name=None, parsed=None, context=None, **kwargs):
+            labels = {
+                'service': service,
+                'operation': event_name.rsplit('.', 1)[-1],
+                'region': region,
+                'outcome': parsed.get('Error', {}).get('Code') or 'ok',
+            }
+            retries = parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+            self.record('call', labels, time.perf_counter() - context.pop('metrics_start'), retries)
+
+        def after_call_error(event_name=None, exception=None, context=None, **kwargs):
+            # Connection errors and the like, where there is no parsed response
+            labels = {
+                'service': service,
+                'operation': event_name.rsplit('.', 1)[-1],
+                'region': region,
+                'outcome': type(exception).__name__,
+            }
+            self.record('call', labels, time.perf_counter() - context.pop('metrics_start'))
+
+        client.meta.events.register('before-call', before_call)
+        client.meta.events.register('after-call', after_call)
+        client.meta.events.register('after-call-error', after_call_error)
+
+    def report(self):
+        """JSON-serialisable summary of every histogram"""
+        with self._lock:
+            items = sorted(self.histograms.items(), key=lambda item: (item[0][0], item[0][1]))
+            retries = dict(self.retries)
+        report = {'started': self.started, 'elapsed': time.time() - self.started}
+        report.update({category: [] for category in self.SERIES})
+        for key, h in items:
+            category, labels = key
+            entry = dict(labels)
+            entry.update(count=h.count, sum=round(h.total, 6), max=round(h.max, 6),
+                         p50=round(h.quantile(0.5), 6), p90=round(h.quantile(0.9), 6),
+                         p99=round(h.quantile(0.99), 6),
+                         buckets=dict(zip(_bucket_labels(), h.cumulative())))
+            if category == 'call':
+                entry['retries'] = retries.get(key, 0)
+            report[category].append(entry)
+        return report
+
+    def prometheus(self):
+        """The histograms in the Prometheus text exposition format"""
+        with self._lock:
+            items = sorted(self.histograms.items(), key=lambda item: (item[0][0], item[0][1]))
+            retries = dict(self.retries)
+        lines = []
+        for category, (name, help_text) in self.SERIES.items():
+            series = [(labels, h) for (kind, labels), h in items if kind == category]
+            if not series:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, h in series:
+                text = ','.join(f'{key}="{_prometheus_escape(value)}"' for key, value in labels)
+                prefix = text + ',' if text else ''
+                for bound, running in zip(_bucket_labels(), h.cumulative()):
+                    lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {running}')
+                lines.append(f"{name}_sum{{{text}}} {h.total:.6f}")
+                lines.append(f"{name}_count{{{text}}} {h.count}")
+        if retries:
+            lines.append("# HELP cleanup_aws_call_retries_total Retries botocore made for AWS API calls")
+            lines.append("# TYPE cleanup_aws_call_retries_total counter")
+            for (_, labels), count in sorted(retries.items()):
+                text = ','.join(f'{key}="{_prometheus_escape(value)}"' for key, value in labels)
+                lines.append(f"cleanup_aws_call_retries_total{{{text}}} {count}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, json_path=None, prom_path=None):
+        """Write the JSON report and Prometheus textfile, each replaced atomically"""
+        outputs = []
+        if json_path:
+            outputs.append((json_path, json.dumps(self.report(), indent=2) + '\n'))
+        if prom_path:
+            outputs.append((prom_path, self.prometheus()))
+        for path, content in outputs:
+            # The textfile collector may read at any moment, so never expose a partial file
+            with open(path + '.tmp', 'w') as f:
+                f.write(content)
+            os.replace(path + '.tmp', path)
+            log(f"Metrics written to {path}", Colors.OKBLUE)
+
+def _bucket_labels():
+    return [str(bound) for bound in LATENCY_BUCKETS] + ['+Inf']
+
+def _prometheus_escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# Shared by every client and region; see Metrics.add_hook to attach a profiler
+metrics = Metrics()
+
+class DurationStats:
+    """Historical delete-to-gone durations per resource type, and this run's observations"""
+
+    def __init__(self, history=None):
+        self.history = history or {}  # kind -> {'seconds': average, 'samples': count}
+        self._observed = {}           # kind -> [total seconds, count] for this run
+        self._lock = threading.Lock()
+
+    def estimate(self, kind):
+        """Expected seconds to delete one resource of a type and see it gone"""
+        entry = self.history.get(kind)
+        return entry['seconds'] if entry else DEFAULT_DURATIONS.get(kind, DEFAULT_DURATION)
+
+    def observe(self, kind, seconds):
+        with self._lock:
+            totals = self._observed.setdefault(kind, [0.0, 0])
+            totals[0] += seconds
+            totals[1] += 1
+
+    def merged(self):
+        """The history with this run's averages blended in"""
+        merged = dict(self.history)
+        with self._lock:
+            observed = dict(self._observed)
+        for kind, (total, count) in observed.items():
+            average = total / count
+            entry = self.history.get(kind)
+            if entry:
+                average = DURATION_SMOOTHING * average + (1 - DURATION_SMOOTHING) * entry['seconds']
+                count += entry['samples']
+            merged[kind] = {'seconds': round(average, 3), 'samples': count}
+        return merged
+
+    def load(self, path):
+        """Replace the history with the one saved at path, if there is one"""
+        if not path:
+            return
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.history = json.load(f)['durations']
+        except FileNotFoundError:
+            return
+        except (ValueError, KeyError, TypeError) as e:
+            log(f"Ignoring unreadable duration history {path}: {e}", Colors.WARNING)
+            return
+        log(f"Loaded deletion durations for {len(self.history)} resource types from {path}", Colors.OKBLUE)
+
+    def save(self, path):
+        """Write the merged history to path atomically, if anything was observed"""
+        if not path or not self._observed:
+            return
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'durations': self.merged()}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        os.replace(path + '.tmp', path)
+        log(f"Deletion durations written to {path}", Colors.OKBLUE)
+
+# Loaded by main() from --durations; read by DeletionGraph to order its work
+durations = DurationStats()
+
+class ClientPool:
+    """boto3 clients built lazily, once per (service, region), and shared by all helpers"""
+
+    def __init__(self, session, config=None, limiter=None):
+        self.session = session
+        self.config = config or client_config()
+        self.limiter = limiter
+        self._clients = {}
+        # Session objects are not thread-safe, so clients are created under a lock
+        self._lock = threading.Lock()
+
+    def get(self, service, region):
+        """Return the client for a service in a region, creating it on first use"""
+        key = (service, region)
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self.session.client(service, region_name=region, config=self.config)
+                    if self.limiter:
+                        self.limiter.attach(client, service, region)
+                    # Attached after the limiter so latency excludes time spent waiting for a token
+                    metrics.attach(client, service, region)
+                    self._clients[key] = client
+        return client
+
+class ResourceRecord:
+    """A classified resource: its type, the identifier its deleter takes, and its ARN"""
+    __slots__ = ('kind', 'ident', 'arn', 'region', 'vpc')
+
+    def __init__(self, kind, ident, arn, region, vpc=None):
+        self.kind = kind
+        self.ident = ident
+        self.arn = arn
+        self.region = region
+        # VPC of a subnet, route table or security group, once the network index knows it
+        self.vpc = vpc
+
+    def __repr__(self):
+        return f"ResourceRecord({self.kind!r}, {self.ident!r})"
+
+def _nodegroup_ident(resource_id, arn):
+    # nodegroup/<cluster>/<nodegroup>/<uuid>
+    cluster_name, nodegroup_name = resource_id.split('/')[:2]
+    return cluster_name, nodegroup_name
+
+def _security_group_ident(resource_id, arn):
+    return None if resource_id == 'default' else resource_id
+
+def _ecs_service_ident(resource_id, arn):
+    # service/<cluster>/<service>; old-format ARNs don't name the cluster, so are skipped
+    parts = resource_id.split('/')
+    return tuple(parts) if len(parts) == 2 else None
+
+def _web_acl_ident(resource_id, arn):
+    # webacl/<name>/<id>; other global WAF resources (IP sets, rule groups) are left alone
+    parts = resource_id.split('/')
+    return (parts[1], parts[2]) if parts[0] == 'webacl' and len(parts) == 3 else None
+
+def _sqs_queue_ident(resource_id, arn):
+    # arn:aws:sqs:<region>:<account>:<name>; the queue URL's host differs by
+    # partition, so delete_sqs_queue looks it up rather than building it here
+    _, _, _, _, account, name = arn.split(':')
+    return (name, account)
+
+# (service, resource type) from the ARN -> (our resource type, identifier builder)
+ARN_RESOURCE_TYPES = {
+    ('eks', 'cluster'): ('eks_cluster', None),
+    ('eks', 'nodegroup'): ('eks_nodegroup', _nodegroup_ident),
+    ('elasticache', 'cluster'): ('elasticache_cluster', None),
+    ('elasticache', 'replicationgroup'): ('elasticache_replication_group', None),
+    ('elasticache', 'snapshot'): ('elasticache_snapshot', None),
+    ('elasticache', 'parametergroup'): ('elasticache_parameter_group', None),
+    ('elasticache', 'subnetgroup'): ('elasticache_subnet_group', None),
+    ('rds', 'cluster'): ('rds_cluster', None),
+    ('rds', 'cluster-pg'): ('rds_parameter_group', None),
+    ('rds', 'subgrp'): ('rds_subnet_group', None),
+    ('elasticloadbalancing', 'loadbalancer'): ('load_balancer', lambda resource_id, arn: arn),
+    ('elasticloadbalancing', 'targetgroup'): ('target_group', lambda resource_id, arn: arn),
+    ('ec2', 'natgateway'): ('nat_gateway', None),
+    ('ec2', 'elastic-ip'): ('elastic_ip', None),
+    ('ec2', 'internet-gateway'): ('internet_gateway', None),
+    ('ec2', 'subnet'): ('subnet', None),
+    ('ec2', 'route-table'): ('route_table', None),
+    ('ec2', 'security-group'): ('security_group', _security_group_ident),
+    ('ec2', 'vpc'): ('vpc', None),
+    ('ec2', 'launch-template'): ('launch_template', None),
+    ('ecs', 'cluster'): ('ecs_cluster', None),
+    ('ecs', 'service'): ('ecs_service', _ecs_service_ident),
+    ('ecs', 'task-definition'): ('ecs_task_definition', None),
+    ('lambda', 'function'): ('lambda_function', None),
+    ('lambda', 'event-source-mapping'): ('lambda_event_source_mapping', None),
+    ('sqs', ''): ('sqs_queue', _sqs_queue_ident),
+    ('dynamodb', 'table'): ('dynamodb_table', None),
+    # Bucket ARNs are just arn:aws:s3:::<bucket>
+    ('s3', ''): ('s3_bucket', None),
+    # Edge stack, deleted by EdgeTeardown rather than the regional phases
+    ('cloudfront', 'distribution'): ('cloudfront_distribution', None),
+    ('wafv2', 'global'): ('waf_web_acl', _web_acl_ident),
+    ('acm', 'certificate'): ('acm_certificate', lambda resource_id, arn: arn),
+}
+EDGE_KINDS = {'cloudfront_distribution', 'waf_web_acl', 'acm_certificate'}
+# Resource type -> the service named in its ARN, which keys the asyncio engine's semaphores
+KIND_SERVICES = {kind: service for (service, _), (kind, _) in ARN_RESOURCE_TYPES.items()}
+
+def _split_arn(arn):
+    """Split an ARN into everything up to its resource type, and its resource id"""
+    # The resource part is "type/id" (ec2, eks, elbv2), "type:id" (rds, elasticache)
+    # or a bare id; ids of the types we handle never contain a colon
+    head, sep, resource_id = arn.partition('/')
+    if not sep:
+        head, _, resource_id = arn.rpartition(':')
+    return head, resource_id
+
+def _parse_head(head):
+    parts = head.split(':')
+    if parts[0] != 'arn' or len(parts) not in (5, 6):
+        return None
+    if len(parts) == 5:
+        # Bare resource id with no resource type
+        parts.append('')
+    return tuple(parts[1:])
+
+def parse_arn(arn):
+    """Split an ARN into (partition, service, region, account, resource type, resource id)"""
+    head, resource_id = _split_arn(arn)
+    parsed = _parse_head(head)
+    return None if parsed is None else parsed + (resource_id,)
+
+# ARN head ("arn:partition:service:region:account:type") -> (type, identifier builder, region).
+# There are only a handful of distinct heads per account, so each is parsed once.
+_arn_heads = {}
+
+def _resolve_head(head):
+    parsed = _parse_head(head)
+    if parsed is None:
+        return None
+    _, service, region, _, resource_type = parsed
+    handler = ARN_RESOURCE_TYPES.get((service, resource_type))
+    if handler is None:
+        return None
+    kind, build_ident = handler
+    return kind, build_ident, region
+
+def classify(arn):
+    """Return a ResourceRecord for a supported ARN, or None"""
+    head, resource_id = _split_arn(arn)
+    try:
+        resolved = _arn_heads[head]
+    except KeyError:
+        resolved = _arn_heads[head] = _resolve_head(head)
+    if resolved is None:
+        return None
+    kind, build_ident, region = resolved
+    ident = build_ident(resource_id, arn) if build_ident else resource_id
+    if ident is None:
+        return None
+    return ResourceRecord(kind, ident, arn, region)
+
+# Resource type -> the ResourceTypeFilters entry that scans for it. Web ACL ARNs
+# ("global/webacl/...") have no filter of their own, so the whole wafv2 service is
+# requested and classify() narrows it down.
+KIND_TYPE_FILTERS = {
+    kind: 'wafv2' if kind == 'waf_web_acl' else f"{service}:{resource_type}" if resource_type else service
+    for (service, resource_type), (kind, _) in ARN_RESOURCE_TYPES.items()
+}
+# Resource types requested from the tagging API; everything else is filtered server-side
+RESOURCE_TYPE_FILTERS = [resource_type for kind, resource_type in KIND_TYPE_FILTERS.items() if kind not in EDGE_KINDS]
+# The edge track's scan of EDGE_REGION
+EDGE_RESOURCE_TYPE_FILTERS = [resource_type for kind, resource_type in KIND_TYPE_FILTERS.items() if kind in EDGE_KINDS]
+
+_SELECTOR_TOKEN = re.compile(r'\s*("[^"]*"|\(|\)|!=|=|[^\s()=!"]+)')
+
+class Selector:
+    """A --select expression narrowing which Terraform-managed resources are processed
+
+    Terms are combined with and, or, not and parentheses:
+      Key              the tag is present
+      Key=Value        the tag has a value matching the glob (quote either side to
+                       include spaces, parentheses, = or !, or to use and, or, not,
+                       arn: or type: as a tag key)
+      Key!=Value       not Key=Value
+      arn:<glob>       the ARN matches the glob
+      type:<glob>      the resource type (e.g. eks_cluster, s3_bucket) matches the glob
+    e.g. 'Environment=dev and not (Protected=true or type:rds_*)'.
+    """
+
+    def __init__(self, expression):
+        self.expression = expression
+        self._tokens = []
+        position, end = 0, len(expression.rstrip())
+        while position < end:
+            match = _SELECTOR_TOKEN.match(expression, position)
+            if match is None:
+                raise ValueError(f"cannot parse {expression[position:].strip()!r} in {expression!r}")
+            self._tokens.append(match.group(1))
+            position = match.end()
+        if not self._tokens:
+            raise ValueError("empty selector")
+        self._position = 0
+        self.tree = self._or()
+        if self._position != len(self._tokens):
+            raise ValueError(f"unexpected {self._tokens[self._position]!r} in {expression!r}")
+
+    # Recursive descent: or binds loosest, then and, then not
+
+    def _peek(self):
+        return self._tokens[self._position] if self._position < len(self._tokens) else None
+
+    def _take(self):
+        token = self._peek()
+        if token is None:
+            raise ValueError(f"{self.expression!r} ends unexpectedly")
+        self._position += 1
+        return token
+
+    def _or(self):
+        terms = [self._and()]
+        while self._peek() == 'or':
+            self._take()
+            terms.append(self._and())
+        return terms[0] if len(terms) == 1 else ('or', terms)
+
+    def _and(self):
+        terms = [self._not()]
+        while self._peek() == 'and':
+            self._take()
+            terms.append(self._not())
+        return terms[0] if len(terms) == 1 else ('and', terms)
+
+    def _not(self):
+        if self._peek() == 'not':
+            self._take()
+            return ('not', self._not())
+        return self._term()
+
+    def _term(self):
+        token = self._take()
+        if token == '(':
+            tree = self._or()
+            if self._take() != ')':
+                raise ValueError(f"missing ')' in {self.expression!r}")
+            return tree
+        if token in (')', '=', '!=', 'and', 'or', 'not'):
+            raise ValueError(f"unexpected {token!r} in {self.expression!r}")
+        quoted = token.startswith('"')
+        word = token.strip('"')
+        if self._peek() in ('=', '!='):
+            operator = self._take()
+            value = self._take()
+            if value in ('(', ')', '=', '!='):
+                raise ValueError(f"missing value after {word}{operator} in {self.expression!r}")
+            tree = ('tag', word, value.strip('"'))
+            return ('not', tree) if operator == '!=' else tree
+        if not quoted and word.startswith('arn:'):
+            return ('arn', word)
+        if not quoted and word.startswith('type:'):
+            return ('type', word[len('type:'):])
+        return ('tag', word, None)
+
+    def _conjuncts(self):
+        return self.tree[1] if self.tree[0] == 'and' else [self.tree]
+
+    def tag_filters(self):
+        """Extra TagFilters implied by the expression, for the API to apply server-side
+
+        Only terms every match must satisfy are pushed down: top-level conjuncts
+        that test a tag's presence or exact value, or an or of exact values of one
+        key. Globs are left to the index.
+        """
+        filters = {}
+        for term in self._conjuncts():
+            if term[0] == 'or' and all(t[0] == 'tag' and t[2] is not None for t in term[1]):
+                keys = {t[1] for t in term[1]}
+                values = [t[2] for t in term[1]]
+                if len(keys) != 1 or any(_is_glob(value) for value in values):
+                    continue
+                key = keys.pop()
+            elif term[0] == 'tag' and (term[2] is None or not _is_glob(term[2])):
+                key, values = term[1], [term[2]] if term[2] is not None else []
+            else:
+                continue
+            # One filter per key; TAG_KEY is already filtered on
+            if key != TAG_KEY and key not in filters:
+                filters[key] = values
+        return [{'Key': key, 'Values': values} if values else {'Key': key} for key, values in filters.items()]
+
+    def resource_types(self, resource_types):
+        """resource_types narrowed to the types a top-level type: term allows"""
+        for term in self._conjuncts():
+            if term[0] == 'type':
+                allowed = {KIND_TYPE_FILTERS[kind] for kind in KIND_TYPE_FILTERS if fnmatchcase(kind, term[1])}
+                resource_types = [resource_type for resource_type in resource_types if resource_type in allowed]
+        return resource_types
+
+    def select(self, resources):
+        """ARNs of the resources (get_resources mappings) the expression matches, in order"""
+        return TagIndex(resources).select(self.tree)
+
+def _is_glob(pattern):
+    return any(char in pattern for char in '*?[')
+
+class TagIndex:
+    """Inverted index of one scan: which resources carry each tag key and key=value pair
+
+    Built once from the Tags that get_resources returns with each resource, so
+    a selector is evaluated with set operations and no further API calls.
+    """
+
+    def __init__(self, resources):
+        self.arns = []     # position -> ARN, in scan order
+        self.by_key = {}   # key -> {value: set of positions}
+        for resource in resources:
+            position = len(self.arns)
+            self.arns.append(resource['ResourceARN'])
+            for tag in resource.get('Tags', ()):
+                self.by_key.setdefault(tag['Key'], {}).setdefault(tag['Value'], set()).add(position)
+        self.everything = set(range(len(self.arns)))
+        self._by_kind = None
+
+    def _kinds(self):
+        if self._by_kind is None:
+            self._by_kind = {}
+            for position, arn in enumerate(self.arns):
+                record = classify(arn)
+                if record is not None:
+                    self._by_kind.setdefault(record.kind, set()).add(position)
+        return self._by_kind
+
+    def evaluate(self, tree):
+        """Positions of the resources a parsed selector matches"""
+        operator = tree[0]
+        if operator == 'and':
+            matched = self.evaluate(tree[1][0])
+            for term in tree[1][1:]:
+                if not matched:
+                    break
+                matched = matched & self.evaluate(term)
+            return matched
+        if operator == 'or':
+            return set().union(*(self.evaluate(term) for term in tree[1]))
+        if operator == 'not':
+            return self.everything - self.evaluate(tree[1])
+        if operator == 'tag':
+            _, key, pattern = tree
+            values = self.by_key.get(key, {})
+            if pattern is None:
+                return set().union(*values.values())
+            if not _is_glob(pattern):
+                return set(values.get(pattern, ()))
+            return set().union(*(positions for value, positions in values.items() if fnmatchcase(value, pattern)))
+        if operator == 'arn':
+            return {position for position, arn in enumerate(self.arns) if fnmatchcase(arn, tree[1])}
+        # type
+        return set().union(*(positions for kind, positions in self._kinds().items() if fnmatchcase(kind, tree[1])))
+
+    def select(self, tree):
+        return [self.arns[position] for position in sorted(self.evaluate(tree))]
+
+# Set by main() from --select
+resource_selector = None
+
+def tag_scan_filters(resource_types=None):
+    """get_resources filters for a scan, narrowed by the selector; None if nothing can match"""
+    tag_filters = [{'Key': TAG_KEY, 'Values': TAG_VALUES}]
+    resource_types = resource_types or RESOURCE_TYPE_FILTERS
+    if resource_selector is not None:
+        tag_filters += resource_selector.tag_filters()
+        resource_types = resource_selector.resource_types(resource_types)
+        if not resource_types:
+            return None
+    return {'TagFilters': tag_filters, 'ResourceTypeFilters': resource_types}
+
+def iter_tagged_resources(clients, region, resource_types=None):
+    """Yield each resource with a terraform tag once, page by page as the scan progresses"""
+    client = clients.get('resourcegroupstaggingapi', region)
+    seen = set()
+    filters = tag_scan_filters(resource_types)
+    if filters is None:
+        return
+    
+    try:
+        paginator = client.get_paginator('get_resources')
+        # Values within one tag filter are ORed, so a single scan covers every spelling
+        for page in paginator.paginate(**filters):
+            for resource in page['ResourceTagMappingList']:
+                if resource['ResourceARN'] not in seen:
+                    seen.add(resource['ResourceARN'])
+                    yield resource
+    except ClientError as e:
+        # A partial scan must not look complete to the journal, so the region is aborted
+        log(f"Error getting tagged resources in {region}: {e}", Colors.FAIL)
+        raise
+
+def probe_region(clients, region):
+    """Whether a region holds any resource the tag scan would find; True if the probe fails"""
+    filters = tag_scan_filters()
+    if filters is None:
+        return False
+    paginator = clients.get('resourcegroupstaggingapi', region).get_paginator('get_resources')
+    try:
+        for page in paginator.paginate(**filters):
+            # Pages can come back empty before the first match, so keep going until one doesn't
+            resources = page['ResourceTagMappingList']
+            if resources and (resource_selector is None or resource_selector.select(resources)):
+                return True
+    except ClientError as e:
+        # Processing the region reports the same error rather than silently skipping it
+        log(f"  Could not probe {region} ({e.response['Error']['Code']}); including it", Colors.WARNING)
+        return True
+    return False
+
+def discover_regions(clients):
+    """The enabled regions that hold tagged resources, probed in parallel"""
+    started = time.monotonic()
+    try:
+        # Without AllRegions, only regions enabled for the account are listed
+        response = clients.get('ec2', REGION_DISCOVERY_REGION).describe_regions()
+    except ClientError as e:
+        log(f"Could not list regions ({e}); using {', '.join(REGIONS)}", Colors.FAIL)
+        return REGIONS
+    enabled = sorted(region['RegionName'] for region in response['Regions'])
+    with ThreadPoolExecutor(max_workers=min(REGION_PROBE_WORKERS, len(enabled)) or 1) as pool:
+        futures = {region: submit(pool, probe_region, clients, region) for region in enabled}
+        regions = [region for region, future in futures.items() if future.result()]
+    log(f"Probed {len(enabled)} enabled regions in {time.monotonic() - started:.1f}s; "
+        f"{len(regions)} have Terraform-managed resources: {', '.join(regions) or 'none'}", Colors.OKBLUE)
+    return regions
+
+def discover_resources(clients, region, preflight=True):
+    """Yield a ResourceRecord for every deletable resource as it is found
+
+    With preflight=False the network blockers are only looked up, not released,
+    for planning.
+    """
+    # Gateways and addresses are held back until the index knows their attachments, and
+    # subnets, route tables and groups until it knows their VPCs. All of them wait for
+    # discovery to finish anyway, so holding them back delays nothing.
+    held = {'internet_gateway': {}, 'elastic_ip': {}, **{kind: {} for kind in NetworkIndex.MEMBERS}}
+    found = {kind: set() for kind in NetworkIndex.KINDS}
+    for arn in discovered_arns(clients, region):
+        record = classify(arn)
+        # The edge stack belongs to EdgeTeardown; only a state lists it here
+        if record is None or record.kind in EDGE_KINDS:
+            continue
+        # S3 ARNs carry no region; the bucket lives in the region that reported it
+        record.region = record.region or region
+        if record.kind in found:
+            found[record.kind].add(record.ident)
+        if record.kind in held:
+            held[record.kind][record.ident] = record
+        else:
+            yield record
+    
+    # Nothing that depends on the network has started yet, so blockers are cleared first
+    index = NetworkIndex(clients, region).build(found)
+    if preflight:
+        index.release_blockers()
+    
+    # Internet gateways are deleted as (igw_id, vpc_id) so they can be detached first,
+    # and Elastic IPs as (allocation_id, association_id) so they can be disassociated.
+    # Ones the index could not describe (most likely already gone) are still yielded,
+    # unattached, so their outcome is reported.
+    for kind, attachments in (('internet_gateway', index.igw_vpcs), ('elastic_ip', index.address_associations)):
+        for ident, record in held[kind].items():
+            record.ident = (ident, attachments.get(ident))
+            yield record
+    for kind in NetworkIndex.MEMBERS:
+        for ident, record in held[kind].items():
+            record.vpc = index.vpcs.get(ident)
+            yield record
+
+def discover_edge_resources(clients, region):
+    """Yield a ResourceRecord for each distribution, web ACL and certificate found"""
+    for arn in discovered_arns(clients, region, edge=True):
+        record = classify(arn)
+        if record is None or record.kind not in EDGE_KINDS:
+            continue
+        # Distribution ARNs carry no region
+        record.region = region
+        yield record
+
+class _JSONStream:
+    """Decode JSON values one at a time from a text stream, reading only as far as needed"""
+
+    def __init__(self, stream, chunk_size=None):
+        self.stream = stream
+        self.chunk_size = chunk_size or STATE_CHUNK_SIZE
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        # A value longer than the buffer doubles the read, so decoding it stays linear
+        chunk = self.stream.read(max(self.chunk_size, len(self.buffer) - self.pos))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """The next non-whitespace character, without consuming it; '' at the end"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} but found {found or 'end of file'!r} in state")
+        self.pos += 1
+
+    def skip(self, char):
+        """Consume char if it is next; returns whether it was"""
+        if self.peek() == char:
+            self.pos += 1
+            return True
+        return False
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # Most likely cut off by the end of the buffer
+                if self._fill():
+                    continue
+                raise
+            # A number at the very end of the buffer may go on in the next chunk
+            if end == len(self.buffer) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
+
+def iter_state_resources(stream, chunk_size=None):
+    """Yield the entries of a Terraform state's "resources" list one at a time
+
+    Other top-level values (outputs, check results) are decoded and dropped
+    one by one, so memory use is bounded by the largest single entry rather
+    than by the size of the state.
+    """
+    reader = _JSONStream(stream, chunk_size)
+    reader.expect('{')
+    while not reader.skip('}'):
+        key = reader.value()
+        reader.expect(':')
+        if key != 'resources':
+            reader.value()
+        else:
+            reader.expect('[')
+            while not reader.skip(']'):
+                yield reader.value()
+                reader.skip(',')
+        reader.skip(',')
+
+@contextmanager
+def open_state(clients, source):
+    """Open a local state file, or an s3://bucket/key object, as a text stream"""
+    if not source.startswith('s3://'):
+        with open(source, encoding='utf-8') as f:
+            yield f
+        return
+    bucket, _, key = source[len('s3://'):].partition('/')
+    # Streamed straight from the response body; nothing is written to disk
+    body = clients.get('s3', STATE_BUCKET_REGION).get_object(Bucket=bucket, Key=key)['Body']
+    try:
+        yield codecs.getreader('utf-8')(body)
+    finally:
+        body.close()
+
+# Terraform types whose state attributes hold no ARN: (service, resource part
+# with the attribute holding its id). The ARN is built from the state's account.
+STATE_ARN_TEMPLATES = {
+    'aws_nat_gateway': ('ec2', 'natgateway/{id}'),
+    'aws_eip': ('ec2', 'elastic-ip/{id}'),
+    'aws_lambda_event_source_mapping': ('lambda', 'event-source-mapping:{uuid}'),
+}
+
+def _provider_region(provider):
+    # provider["registry.terraform.io/hashicorp/aws"].eu_central_1 -> eu-central-1;
+    # the aliases in version.tf are named after their regions
+    alias = provider.rpartition('"]')[2].lstrip('.')
+    return alias.replace('_', '-') if alias else STATE_DEFAULT_REGION
+
+class StateInventory:
+    """The ARNs of every resource in a Terraform state that can be deleted, by region"""
+
+    def __init__(self, source, cross_check=False):
+        self.source = source
+        self.cross_check = cross_check
+        self.by_region = {}
+        self.resources = 0
+        self.partition = 'aws'
+        self.account = None
+        self._templated = []  # (service, resource part, region) waiting for the account
+
+    @classmethod
+    def load(cls, clients, source, cross_check=False):
+        """Read a state once, from a path or s3://bucket/key, and index its resources"""
+        inventory = cls(source, cross_check)
+        started = time.monotonic()
+        with metrics.span('phase', phase='state', region=STATE_BUCKET_REGION):
+            with open_state(clients, source) as stream:
+                for resource in iter_state_resources(stream):
+                    inventory.add(resource)
+        inventory._resolve_templated()
+        
+        total = sum(len(arns) for arns in inventory.by_region.values())
+        log(f"Read {inventory.resources:,} resources from {source} in {time.monotonic() - started:.1f}s; "
+            f"{total:,} can be deleted", Colors.OKBLUE)
+        return inventory
+
+    def add(self, resource):
+        """Index one entry of the state's "resources" list"""
+        resource_type = resource.get('type', '')
+        # Data sources are only read, and aws_default_* resources are adopted rather than created
+        if (resource.get('mode') != 'managed' or not resource_type.startswith('aws_')
+                or resource_type.startswith('aws_default_')):
+            return
+        provider_region = _provider_region(resource.get('provider', ''))
+        for instance in resource.get('instances', ()):
+            self.resources += 1
+            attributes = instance.get('attributes') or {}
+            region = attributes.get('region') or provider_region
+            arn = attributes.get('arn') or attributes.get('id') or ''
+            if arn.startswith('arn:'):
+                self._add_arn(arn, region)
+            elif resource_type in STATE_ARN_TEMPLATES:
+                service, resource_part = STATE_ARN_TEMPLATES[resource_type]
+                try:
+                    self._templated.append((service, resource_part.format(**attributes), region))
+                except KeyError:
+                    continue
+
+    def _add_arn(self, arn, region):
+        record = classify(arn)
+        if record is None:
+            return
+        if self.account is None:
+            partition, _, _, account = parse_arn(arn)[:4]
+            if account:
+                self.partition, self.account = partition, account
+        # Distribution and bucket ARNs carry no region
+        if not record.region:
+            record.region = EDGE_REGION if record.kind in EDGE_KINDS else region
+        self.by_region.setdefault(record.region, []).append(arn)
+
+    def _resolve_templated(self):
+        if self._templated and self.account is None:
+            log(f"No account found in {self.source}; skipping {len(self._templated)} resources "
+                f"without an ARN", Colors.WARNING)
+            return
+        for service, resource_part, region in self._templated:
+            self._add_arn(f"arn:{self.partition}:{service}:{region}:{self.account}:{resource_part}", region)
+        self._templated = []
+
+    def arns(self, clients, region, edge=False):
+        """Yield the region's ARNs from the state, and with --cross-check any only the tag scan found"""
+        listed = [arn for arn in self.by_region.get(region, ()) if _is_edge(arn) == edge]
+        if not self.cross_check:
+            yield from listed
+            return
+        
+        # Scanned in full before anything is yielded, so no deletion can make the
+        # two sources disagree
+        tagged = []
+        resource_types = EDGE_RESOURCE_TYPE_FILTERS if edge else None
+        for resource in iter_tagged_resources(clients, region, resource_types):
+            arn = resource['ResourceARN']
+            if classify(arn) is not None and _is_edge(arn) == edge:
+                tagged.append(arn)
+        in_state, in_scan = set(listed), set(tagged)
+        untracked = [arn for arn in tagged if arn not in in_state]
+        untagged = [arn for arn in listed if arn not in in_scan]
+        
+        scope = f"{region} (edge)" if edge else region
+        if not untracked and not untagged:
+            log(f"Cross-check {scope}: state and tag scan agree on {len(listed):,} resources", Colors.OKGREEN)
+        # Both lists are deleted; these are the resources one source alone would have missed
+        for arns, description in ((untracked, "tagged but not in the state"),
+                                  (untagged, "in the state but not tagged (or already gone)")):
+            if arns:
+                log(f"Cross-check {scope}: {len(arns):,} {description}", Colors.WARNING)
+                for arn in arns[:CROSS_CHECK_SAMPLES]:
+                    log(f"    {arn}", Colors.WARNING)
+                if len(arns) > CROSS_CHECK_SAMPLES:
+                    log(f"    … and {len(arns) - CROSS_CHECK_SAMPLES:,} more", Colors.WARNING)
+        yield from listed
+        yield from untracked
+
+def _is_edge(arn):
+    return classify(arn).kind in EDGE_KINDS
+
+# Set by main() from --state / --state-key; when present it replaces the tag scan
+state_inventory = None
+
+def resolve_regions(clients, all_regions=False):
+    """The regions to process: REGIONS, or with all_regions every enabled region with work"""
+    if state_inventory is not None:
+        # The state already says where its resources are
+        if all_regions:
+            return sorted(state_inventory.by_region)
+        elsewhere = sorted(set(state_inventory.by_region) - set(REGIONS))
+        if elsewhere:
+            log(f"Ignoring state resources in regions not in REGIONS: {', '.join(elsewhere)} "
+                f"(--all-regions includes them)", Colors.WARNING)
+        return REGIONS
+    return discover_regions(clients) if all_regions else REGIONS
+
+def discovered_arns(clients, region, edge=False):
+    """Yield the ARNs to consider in a region: from the state if one was loaded, else the tag scan"""
+    if state_inventory is not None:
+        yield from state_inventory.arns(clients, region, edge)
+        return
+    resources = iter_tagged_resources(clients, region, EDGE_RESOURCE_TYPE_FILTERS if edge else None)
+    if resource_selector is None:
+        for resource in resources:
+            yield resource['ResourceARN']
+        return
+    # Evaluated against an index of the whole scan, so selection waits for the last page
+    resources = list(resources)
+    selected = resource_selector.select(resources)
+    log(f"  Selected {len(selected):,} of {len(resources):,} Terraform-managed resources"
+        f"{' on the edge track' if edge else ''} in {region}", Colors.OKBLUE)
+    yield from selected
+
+def delete_eks_nodegroup(clients, region, nodegroup):
+    """Delete an EKS node group"""
+    cluster_name, nodegroup_name = nodegroup
+    log(f"  Deleting EKS nodegroup: {nodegroup_name} from cluster {cluster_name}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    eks = clients.get('eks', region)
+    eks.delete_nodegroup(clusterName=cluster_name, nodegroupName=nodegroup_name)
+    log(f"  ✓ Initiated deletion of nodegroup: {nodegroup_name}", Colors.OKGREEN)
+
+def delete_eks_cluster(clients, region, cluster_name):
+    """Delete an EKS cluster"""
+    log(f"  Deleting EKS cluster: {cluster_name}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    eks = clients.get('eks', region)
+    eks.delete_cluster(name=cluster_name)
+    log(f"  ✓ Initiated deletion of cluster: {cluster_name}", Colors.OKGREEN)
+
+def delete_elasticache_cluster(clients, region, cluster_id):
+    """Delete an ElastiCache cluster"""
+    log(f"  Deleting ElastiCache cluster: {cluster_id}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    elasticache = clients.get('elasticache', region)
+    elasticache.delete_cache_cluster(CacheClusterId=cluster_id)
+    log(f"  ✓ Initiated deletion of ElastiCache cluster: {cluster_id}", Colors.OKGREEN)
+
+def delete_elasticache_replication_group(clients, region, group_id):
+    """Delete an ElastiCache replication group"""
+    log(f"  Deleting ElastiCache replication group: {group_id}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    elasticache = clients.get('elasticache', region)
+    elasticache.delete_replication_group(
+        ReplicationGroupId=group_id,
+        RetainPrimaryCluster=False
+    )
+    log(f"  ✓ Initiated deletion of replication group: {group_id}", Colors.OKGREEN)
+
+def delete_rds_cluster(clients, region, cluster_id):
+    """Delete an RDS cluster"""
+    log(f"  Deleting RDS cluster: {cluster_id}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    rds = clients.get('rds', region)
+    rds.delete_db_cluster(
+        DBClusterIdentifier=cluster_id,
+        SkipFinalSnapshot=True
+    )
+    log(f"  ✓ Initiated deletion of RDS cluster: {cluster_id}", Colors.OKGREEN)
+
+def delete_load_balancer(clients, region, lb_arn):
+    """Delete a load balancer"""
+    log(f"  Deleting load balancer: {lb_arn.split('/')[-1]}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    elbv2 = clients.get('elbv2', region)
+    elbv2.delete_load_balancer(LoadBalancerArn=lb_arn)
+    log(f"  ✓ Initiated deletion of load balancer: {lb_arn.split('/')[-1]}", Colors.OKGREEN)
+
+def delete_target_group(clients, region, tg_arn):
+    """Delete a target group"""
+    log(f"  Deleting target group: {tg_arn.split('/')[-1]}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    elbv2 = clients.get('elbv2', region)
+    elbv2.delete_target_group(TargetGroupArn=tg_arn)
+    log(f"  ✓ Deleted target group: {tg_arn.split('/')[-1]}", Colors.OKGREEN)
+
+def delete_nat_gateway(clients, region, nat_id):
+    """Delete a NAT gateway"""
+    log(f"  Deleting NAT gateway: {nat_id}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    ec2 = clients.get('ec2', region)
+    ec2.delete_nat_gateway(NatGatewayId=nat_id)
+    log(f"  ✓ Initiated deletion of NAT gateway: {nat_id}", Colors.OKGREEN)
+
+def release_elastic_ip(clients, region, address):
+    """Disassociate and release an Elastic IP"""
+    allocation_id, association_id = address
+    log(f"  Releasing Elastic IP: {allocation_id}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    ec2 = clients.get('ec2', region)
+    if association_id:
+        try:
+            ec2.disassociate_address(AssociationId=association_id)
+        except ClientError as e:
+            # Addresses of NAT gateways are freed when the gateway goes
+            if e.response['Error']['Code'] != 'InvalidAssociationID.NotFound':
+                raise
+    ec2.release_address(AllocationId=allocation_id)
+    log(f"  ✓ Released Elastic IP: {allocation_id}", Colors.OKGREEN)
+
+def delete_internet_gateway(clients, region, igw):
+    """Detach and delete an internet gateway"""
+    igw_id, vpc_id = igw
+    log(f"  Deleting internet gateway: {igw_id}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    ec2 = clients.get('ec2', region)
+    if vpc_id:
+        try:
+            ec2.detach_internet_gateway(InternetGatewayId=igw_id, VpcId=vpc_id)
+        except ClientError as e:
+            # Already detached by an earlier attempt
+            if e.response['Error']['Code'] != 'Gateway.NotAttached':
+                raise
+    ec2.delete_internet_gateway(InternetGatewayId=igw_id)
+    log(f"  ✓ Deleted internet gateway: {igw_id}", Colors.OKGREEN)
+
+def delete_subnet(clients, region, subnet_id):
+    """Delete a subnet"""
+    log(f"  Deleting subnet: {subnet_id}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    ec2 = clients.get('ec2', region)
+    try:
+        ec2.delete_subnet(SubnetId=subnet_id)
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'DependencyViolation':
+            _delete_detached_interfaces(ec2, 'subnet-id', subnet_id)
+        raise
+    log(f"  ✓ Deleted subnet: {subnet_id}", Colors.OKGREEN)
+
+def delete_route_table(clients, region, rt_id):
+    """Delete a route table"""
+    log(f"  Deleting route table: {rt_id}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    ec2 = clients.get('ec2', region)
+    ec2.delete_route_table(RouteTableId=rt_id)
+    log(f"  ✓ Deleted route table: {rt_id}", Colors.OKGREEN)
+
+def delete_security_group(clients, region, sg_id):
+    """Delete a security group"""
+    log(f"  Deleting security group: {sg_id}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    ec2 = clients.get('ec2', region)
+    try:
+        ec2.delete_security_group(GroupId=sg_id)
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'DependencyViolation':
+            _delete_detached_interfaces(ec2, 'group-id', sg_id)
+        raise
+    log(f"  ✓ Deleted security group: {sg_id}", Colors.OKGREEN)
+
+def _delete_detached_interfaces(ec2, filter_name, value):
+    # ENIs of Lambda functions, EKS and load balancers are detached some time after
+    # their owner goes; remove any that have been, so the retry can succeed
+    paginator = ec2.get_paginator('describe_network_interfaces')
+    for page in paginator.paginate(Filters=[{'Name': filter_name, 'Values': [value]},
+                                            {'Name': 'status', 'Values': ['available']}]):
+        for interface in page['NetworkInterfaces']:
+            try:
+                ec2.delete_network_interface(NetworkInterfaceId=interface['NetworkInterfaceId'])
+                log(f"  ✓ Deleted detached network interface {interface['NetworkInterfaceId']} "
+                    f"holding {value}", Colors.OKGREEN)
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'InvalidNetworkInterfaceID.NotFound':
+                    log(f"  ✗ Could not delete network interface {interface['NetworkInterfaceId']}: {e}",
+                        Colors.FAIL)
+
+def delete_vpc(clients, region, vpc_id):
+    """Delete a VPC"""
+    log(f"  Deleting VPC: {vpc_id}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    ec2 = clients.get('ec2', region)
+    ec2.delete_vpc(VpcId=vpc_id)
+    log(f"  ✓ Deleted VPC: {vpc_id}", Colors.OKGREEN)
+
+def delete_launch_template(clients, region, lt_id):
+    """Delete a launch template"""
+    log(f"  Deleting launch template: {lt_id}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    ec2 = clients.get('ec2', region)
+    ec2.delete_launch_template(LaunchTemplateId=lt_id)
+    log(f"  ✓ Deleted launch template: {lt_id}", Colors.OKGREEN)
+
+def delete_elasticache_snapshot(clients, region, snapshot_name):
+    """Delete an ElastiCache snapshot"""
+    log(f"  Deleting ElastiCache snapshot: {snapshot_name}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    elasticache = clients.get('elasticache', region)
+    elasticache.delete_snapshot(SnapshotName=snapshot_name)
+    log(f"  ✓ Deleted snapshot: {snapshot_name}", Colors.OKGREEN)
+
+def delete_elasticache_parameter_group(clients, region, pg_name):
+    """Delete an ElastiCache parameter group"""
+    log(f"  Deleting ElastiCache parameter group: {pg_name}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    elasticache = clients.get('elasticache', region)
+    elasticache.delete_cache_parameter_group(CacheParameterGroupName=pg_name)
+    log(f"  ✓ Deleted parameter group: {pg_name}", Colors.OKGREEN)
+
+def delete_elasticache_subnet_group(clients, region, sg_name):
+    """Delete an ElastiCache subnet group"""
+    log(f"  Deleting ElastiCache subnet group: {sg_name}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    elasticache = clients.get('elasticache', region)
+    elasticache.delete_cache_subnet_group(CacheSubnetGroupName=sg_name)
+    log(f"  ✓ Deleted subnet group: {sg_name}", Colors.OKGREEN)
+
+def delete_rds_parameter_group(clients, region, pg_name):
+    """Delete an RDS cluster parameter group"""
+    log(f"  Deleting RDS parameter group: {pg_name}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    rds = clients.get('rds', region)
+    rds.delete_db_cluster_parameter_group(DBClusterParameterGroupName=pg_name)
+    log(f"  ✓ Deleted parameter group: {pg_name}", Colors.OKGREEN)
+
+def delete_rds_subnet_group(clients, region, sg_name):
+    """Delete an RDS subnet group"""
+    log(f"  Deleting RDS subnet group: {sg_name}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    rds = clients.get('rds', region)
+    rds.delete_db_subnet_group(DBSubnetGroupName=sg_name)
+    log(f"  ✓ Deleted subnet group: {sg_name}", Colors.OKGREEN)
+
+def delete_ecs_service(clients, region, service):
+    """Scale an ECS service to zero; finish_ecs_service deletes it once its tasks have drained"""
+    cluster_name, service_name = service
+    log(f"  Deleting ECS service: {service_name} from cluster {cluster_name}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    ecs = clients.get('ecs', region)
+    # Otherwise autoscaling would put the tasks straight back
+    autoscaling = clients.get('application-autoscaling', region)
+    try:
+        autoscaling.deregister_scalable_target(
+            ServiceNamespace='ecs',
+            ResourceId=f"service/{cluster_name}/{service_name}",
+            ScalableDimension='ecs:service:DesiredCount'
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ObjectNotFoundException':
+            raise
+    try:
+        ecs.update_service(cluster=cluster_name, service=service_name, desiredCount=0)
+    except ClientError as e:
+        # Already being deleted by an earlier attempt
+        if e.response['Error']['Code'] != 'ServiceNotActiveException':
+            raise
+
+def finish_ecs_service(clients, region, service):
+    """Delete an ECS service scaled to zero by delete_ecs_service"""
+    cluster_name, service_name = service
+    if DRY_RUN:
+        return
+    # force=True stops whatever is left if the drain timed out
+    clients.get('ecs', region).delete_service(cluster=cluster_name, service=service_name, force=True)
+    log(f"  ✓ Initiated deletion of ECS service: {service_name}", Colors.OKGREEN)
+
+def delete_ecs_cluster(clients, region, cluster_name):
+    """Delete an ECS cluster"""
+    log(f"  Deleting ECS cluster: {cluster_name}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    ecs = clients.get('ecs', region)
+    ecs.delete_cluster(cluster=cluster_name)
+    log(f"  ✓ Deleted ECS cluster: {cluster_name}", Colors.OKGREEN)
+
+def delete_ecs_task_definition(clients, region, task_definition):
+    """Deregister and delete an ECS task definition revision"""
+    log(f"  Deregistering ECS task definition: {task_definition}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    ecs = clients.get('ecs', region)
+    ecs.deregister_task_definition(taskDefinition=task_definition)
+    # Deregistered revisions stay around as INACTIVE until they are deleted
+    failures = ecs.delete_task_definitions(taskDefinitions=[task_definition]).get('failures', [])
+    if failures:
+        log(f"  ✗ Deregistered but could not delete {task_definition}: {failures[0].get('reason')}", Colors.FAIL)
+        return
+    log(f"  ✓ Deleted ECS task definition: {task_definition}", Colors.OKGREEN)
+
+def delete_lambda_event_source_mapping(clients, region, mapping_uuid):
+    """Delete a Lambda event source mapping"""
+    log(f"  Deleting Lambda event source mapping: {mapping_uuid}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    lambda_client = clients.get('lambda', region)
+    lambda_client.delete_event_source_mapping(UUID=mapping_uuid)
+    log(f"  ✓ Initiated deletion of event source mapping: {mapping_uuid}", Colors.OKGREEN)
+
+def delete_lambda_function(clients, region, function_name):
+    """Delete a Lambda function, removing any untagged event source mappings first"""
+    log(f"  Deleting Lambda function: {function_name}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    lambda_client = clients.get('lambda', region)
+    paginator = lambda_client.get_paginator('list_event_source_mappings')
+    for page in paginator.paginate(FunctionName=function_name):
+        for mapping in page['EventSourceMappings']:
+            if mapping['State'] != 'Deleting':
+                lambda_client.delete_event_source_mapping(UUID=mapping['UUID'])
+                log(f"  ✓ Deleted event source mapping {mapping['UUID']} of {function_name}", Colors.OKGREEN)
+    lambda_client.delete_function(FunctionName=function_name)
+    log(f"  ✓ Deleted Lambda function: {function_name}", Colors.OKGREEN)
+
+def delete_sqs_queue(clients, region, queue):
+    """Delete an SQS queue"""
+    queue_name, account = queue
+    log(f"  Deleting SQS queue: {queue_name}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    sqs = clients.get('sqs', region)
+    queue_url = sqs.get_queue_url(QueueName=queue_name, QueueOwnerAWSAccountId=account)['QueueUrl']
+    sqs.delete_queue(QueueUrl=queue_url)
+    log(f"  ✓ Deleted SQS queue: {queue_name}", Colors.OKGREEN)
+
+def delete_dynamodb_table(clients, region, table_name):
+    """Delete a DynamoDB table"""
+    log(f"  Deleting DynamoDB table: {table_name}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    dynamodb = clients.get('dynamodb', region)
+    dynamodb.delete_table(TableName=table_name)
+    log(f"  ✓ Initiated deletion of DynamoDB table: {table_name}", Colors.OKGREEN)
+
+class BucketEmptier:
+    """Delete every object version, delete marker and incomplete multipart upload in a bucket"""
+
+    def __init__(self, s3, bucket):
+        self.s3 = s3
+        self.bucket = bucket
+        self.deleted = 0
+        self.errors = 0
+        self.failure = None
+        self.started = time.monotonic()
+        self._last_progress = self.started
+        self._lock = threading.Lock()
+        # Listing blocks while this many batches are waiting for a delete worker
+        self._pending = threading.BoundedSemaphore(S3_MAX_PENDING_BATCHES)
+        self._listers = threading.BoundedSemaphore(S3_LIST_WORKERS)
+
+    def run(self):
+        """Empty the bucket; raises the first error that stopped a lister or delete worker"""
+        self._delete_pool = ThreadPoolExecutor(max_workers=S3_DELETE_WORKERS)
+        self._list_pool = ThreadPoolExecutor(max_workers=S3_LIST_WORKERS)
+        # Listers shut down first, so every batch is queued before the delete pool drains
+        with self._delete_pool, self._list_pool:
+            self._guard(self._abort_uploads)
+            # Keys directly under the root are deleted here; each top-level prefix
+            # is handed to a lister of its own
+            self._guard(self._list, '', '/')
+        if self.failure:
+            raise self.failure
+        if self.errors:
+            log(f"  ✗ {self.errors:,} objects in {self.bucket} could not be deleted", Colors.FAIL)
+        return self.deleted
+
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.deleted / elapsed if elapsed > 0 else 0.0
+
+    def _fail(self, error):
+        with self._lock:
+            self.failure = self.failure or error
+
+    def _guard(self, fn, *args):
+        try:
+            fn(*args)
+        except Exception as e:
+            self._fail(e)
+
+    def _abort_uploads(self):
+        paginator = self.s3.get_paginator('list_multipart_uploads')
+        for page in paginator.paginate(Bucket=self.bucket):
+            for upload in page.get('Uploads', ()):
+                self._pending.acquire()
+                submit(self._delete_pool, self._abort_upload, upload['Key'], upload['UploadId'])
+
+    def _abort_upload(self, key, upload_id):
+        try:
+            self.s3.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'NoSuchUpload':
+                self._fail(e)
+        finally:
+            self._pending.release()
+
+    def _list(self, prefix, delimiter=''):
+        paginator = self.s3.get_paginator('list_object_versions')
+        batch = []
+        pages = paginator.paginate(Bucket=self.bucket, Prefix=prefix, Delimiter=delimiter,
+                                   PaginationConfig={'PageSize': S3_BATCH_SIZE})
+        for page in pages:
+            if self.failure:
+                return
+            for entry in itertools.chain(page.get('Versions', ()), page.get('DeleteMarkers', ())):
+                batch.append({'Key': entry['Key'], 'VersionId': entry['VersionId']})
+                if len(batch) == S3_BATCH_SIZE:
+                    self._submit_batch(batch)
+                    batch = []
+            for common_prefix in page.get('CommonPrefixes', ()):
+                self._listers.acquire()
+                submit(self._list_pool, self._list_prefix, common_prefix['Prefix'])
+            self._log_progress()
+        if batch:
+            self._submit_batch(batch)
+
+    def _list_prefix(self, prefix):
+        try:
+            self._guard(self._list, prefix)
+        finally:
+            self._listers.release()
+
+    def _submit_batch(self, batch):
+        self._pending.acquire()
+        submit(self._delete_pool, self._delete_batch, batch)
+
+    def _delete_batch(self, batch):
+        try:
+            response = self.s3.delete_objects(Bucket=self.bucket, Delete={'Objects': batch, 'Quiet': True})
+            # Quiet mode only reports the keys that failed
+            errors = response.get('Errors', [])
+            with self._lock:
+                self.deleted += len(batch) - len(errors)
+                self.errors += len(errors)
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._pending.release()
+
+    def _log_progress(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_progress < S3_PROGRESS_INTERVAL:
+                return
+            self._last_progress = now
+        log(f"  … {self.bucket}: {self.deleted:,} objects deleted ({self.rate():,.0f} objects/s)", Colors.OKCYAN)
+
+def delete_s3_bucket(clients, region, bucket):
+    """Empty and delete an S3 bucket"""
+    log(f"  Deleting S3 bucket: {bucket}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    s3 = clients.get('s3', region)
+    emptier = BucketEmptier(s3, bucket)
+    with metrics.span('phase', phase='s3_empty', region=region):
+        deleted = emptier.run()
+    log(f"  ✓ Emptied S3 bucket {bucket}: {deleted:,} objects in {time.monotonic() - emptier.started:.1f}s "
+        f"({emptier.rate():,.0f} objects/s)", Colors.OKGREEN)
+    s3.delete_bucket(Bucket=bucket)
+    log(f"  ✓ Deleted S3 bucket: {bucket}", Colors.OKGREEN)
+
+def delete_cloudfront_distribution(clients, region, distribution_id):
+    """Disable a CloudFront distribution; finish_cloudfront_distribution deletes it once deployed"""
+    log(f"  Deleting CloudFront distribution: {distribution_id}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    cloudfront = clients.get('cloudfront', region)
+    response = cloudfront.get_distribution_config(Id=distribution_id)
+    config = response['DistributionConfig']
+    if config['Enabled']:
+        config['Enabled'] = False
+        cloudfront.update_distribution(Id=distribution_id, IfMatch=response['ETag'], DistributionConfig=config)
+        log(f"  Disabled CloudFront distribution {distribution_id}; waiting for it to deploy...", Colors.OKCYAN)
+
+def finish_cloudfront_distribution(clients, region, distribution_id):
+    """Delete a CloudFront distribution disabled by delete_cloudfront_distribution"""
+    if DRY_RUN:
+        return
+    cloudfront = clients.get('cloudfront', region)
+    etag = cloudfront.get_distribution(Id=distribution_id)['ETag']
+    # A timed-out wait leaves the delete to fail with DistributionNotDisabled and be retried
+    cloudfront.delete_distribution(Id=distribution_id, IfMatch=etag)
+    log(f"  ✓ Deleted CloudFront distribution: {distribution_id}", Colors.OKGREEN)
+
+def delete_waf_web_acl(clients, region, web_acl):
+    """Delete a CloudFront-scoped WAFv2 web ACL"""
+    name, web_acl_id = web_acl
+    log(f"  Deleting WAF web ACL: {name}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    wafv2 = clients.get('wafv2', region)
+    # Deletes have to quote the ACL's current lock token
+    lock_token = wafv2.get_web_acl(Name=name, Scope='CLOUDFRONT', Id=web_acl_id)['LockToken']
+    wafv2.delete_web_acl(Name=name, Scope='CLOUDFRONT', Id=web_acl_id, LockToken=lock_token)
+    log(f"  ✓ Deleted WAF web ACL: {name}", Colors.OKGREEN)
+
+def delete_acm_certificate(clients, region, certificate_arn):
+    """Delete an ACM certificate"""
+    certificate_id = certificate_arn.rsplit('/', 1)[-1]
+    log(f"  Deleting ACM certificate: {certificate_id}...", Colors.WARNING)
+    if DRY_RUN:
+        return
+    acm = clients.get('acm', region)
+    acm.delete_certificate(CertificateArn=certificate_arn)
+    log(f"  ✓ Deleted ACM certificate: {certificate_id}", Colors.OKGREEN)
+
+# EC2 filters take at most 200 values
+EC2_FILTER_LIMIT = 200
+
+def _chunks(items, size):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+class NetworkIndex:
+    """Who references whom in a region's VPCs, from one pass of bulk describe calls
+
+    Built once discovery has found every tagged network resource, before anything
+    that depends on them is deleted. It records the attachments of internet
+    gateways and Elastic IPs, the VPC of each subnet, route table and security
+    group (so their dependency edges stay within it), and the blockers outside
+    the deletion graph that would otherwise only show up as DependencyViolation
+    retries: detached ENIs and VPC endpoints in the VPCs being deleted, security
+    group rules that reference a group being deleted, and associations between
+    route tables being deleted and subnets that are staying.
+    """
+
+    KINDS = ('vpc', 'subnet', 'route_table', 'security_group', 'internet_gateway', 'elastic_ip')
+    # Resource types whose VPC is looked up, so their dependency edges stay within it:
+    # kind -> (describe call, response key, id parameter, id field, not-found code)
+    MEMBERS = {
+        'subnet': ('describe_subnets', 'Subnets', 'SubnetIds', 'SubnetId', 'InvalidSubnetID.NotFound'),
+        'route_table': ('describe_route_tables', 'RouteTables', 'RouteTableIds', 'RouteTableId',
+                        'InvalidRouteTableID.NotFound'),
+        'security_group': ('describe_security_groups', 'SecurityGroups', 'GroupIds', 'GroupId',
+                           'InvalidGroup.NotFound'),
+    }
+
+    def __init__(self, clients, region):
+        self.ec2 = clients.get('ec2', region)
+        self.region = region
+        self.igw_vpcs = {}              # igw id -> attached VPC id, or None
+        self.address_associations = {}  # allocation id -> association id, or None
+        self.interfaces = []            # detached ENI ids
+        self.endpoints = []             # VPC endpoint ids
+        self.group_references = {}      # group id -> (ingress, egress) permissions to revoke
+        self.associations = []          # (route table id, association id) to disassociate
+        self.vpcs = {}                  # subnet, route table or group id -> its VPC id
+
+    def _describe(self, operation, key, **kwargs):
+        """All items of a paginated describe call; on failure, log and return what was read"""
+        items = []
+        try:
+            for page in self.ec2.get_paginator(operation).paginate(**kwargs):
+                items.extend(page[key])
+        except ClientError as e:
+            log(f"  Error in {operation} for the network pre-flight: {e}", Colors.FAIL)
+        return items
+
+    def _describe_ids(self, operation, key, id_param, ids, not_found):
+        """Items for a list of ids; one gone id fails the whole call, so then each is described alone"""
+        call = getattr(self.ec2, operation)
+        try:
+            return call(**{id_param: list(ids)})[key]
+        except ClientError as e:
+            if e.response['Error']['Code'] != not_found:
+                log(f"  Error in {operation} for the network pre-flight: {e}", Colors.FAIL)
+                return []
+        items = []
+        for ident in ids:
+            try:
+                items.extend(call(**{id_param: [ident]})[key])
+            except ClientError as e:
+                # An id that is already gone is simply left out
+                if e.response['Error']['Code'] != not_found:
+                    log(f"  Error in {operation} for {ident} in the network pre-flight: {e}", Colors.FAIL)
+        return items
+
+    def _in_vpcs(self, operation, key, vpc_ids):
+        items = []
+        for chunk in _chunks(vpc_ids, EC2_FILTER_LIMIT):
+            items.extend(self._describe(operation, key, Filters=[{'Name': 'vpc-id', 'Values': chunk}]))
+        return items
+
+    def build(self, found):
+        """Index the VPCs, gateways and addresses found by discovery: {kind: set of ids}"""
+        vpc_ids = found['vpc']
+        for kind, (operation, key, id_param, id_field, not_found) in self.MEMBERS.items():
+            for chunk in _chunks(sorted(found[kind]), EC2_FILTER_LIMIT):
+                for item in self._describe_ids(operation, key, id_param, chunk, not_found):
+                    self.vpcs[item[id_field]] = item['VpcId']
+        if found['internet_gateway']:
+            for igw in self._describe_ids('describe_internet_gateways', 'InternetGateways', 'InternetGatewayIds',
+                                          found['internet_gateway'], 'InvalidInternetGatewayID.NotFound'):
+                attachments = igw['Attachments']
+                self.igw_vpcs[igw['InternetGatewayId']] = attachments[0]['VpcId'] if attachments else None
+        if found['elastic_ip']:
+            for address in self._describe_ids('describe_addresses', 'Addresses', 'AllocationIds',
+                                              found['elastic_ip'], 'InvalidAllocationID.NotFound'):
+                self.address_associations[address['AllocationId']] = address.get('AssociationId')
+        if not vpc_ids:
+            return self
+
+        self.interfaces = [
+            interface['NetworkInterfaceId']
+            for interface in self._in_vpcs('describe_network_interfaces', 'NetworkInterfaces', vpc_ids)
+            if interface['Status'] == 'available'
+        ]
+        self.endpoints = [
+            endpoint['VpcEndpointId']
+            for endpoint in self._in_vpcs('describe_vpc_endpoints', 'VpcEndpoints', vpc_ids)
+            if endpoint['State'].lower() not in ('deleting', 'deleted')
+        ]
+        for table in self._in_vpcs('describe_route_tables', 'RouteTables', vpc_ids):
+            if table['RouteTableId'] not in found['route_table']:
+                continue
+            for association in table.get('Associations', []):
+                # Associations with subnets being deleted go with the subnet
+                if not association.get('Main') and association.get('SubnetId') not in found['subnet']:
+                    self.associations.append((table['RouteTableId'], association['RouteTableAssociationId']))
+        doomed = found['security_group']
+        for group in self._in_vpcs('describe_security_groups', 'SecurityGroups', vpc_ids):
+            ingress = _referencing(group['IpPermissions'], doomed)
+            egress = _referencing(group['IpPermissionsEgress'], doomed)
+            if ingress or egress:
+                self.group_references[group['GroupId']] = (ingress, egress)
+        return self
+
+    def release_blockers(self):
+        """Remove the indexed blockers, in as few calls as the APIs allow"""
+        rules = sum(len(ingress) + len(egress) for ingress, egress in self.group_references.values())
+        if not (self.endpoints or self.interfaces or self.associations or rules):
+            return
+        log(f"\nNetwork pre-flight: {len(self.endpoints)} VPC endpoints, {len(self.interfaces)} detached "
+            f"network interfaces, {rules} security group rules and {len(self.associations)} route table "
+            f"associations blocking deletions", Colors.OKCYAN)
+        if DRY_RUN:
+            return
+        # Endpoint ENIs take a while to go, so endpoints are deleted first
+        for chunk in _chunks(self.endpoints, 25):
+            self._release("VPC endpoints", ', '.join(chunk), self.ec2.delete_vpc_endpoints, VpcEndpointIds=chunk)
+        for group_id, (ingress, egress) in self.group_references.items():
+            if ingress:
+                self._release("ingress rules of", group_id, self.ec2.revoke_security_group_ingress,
+                              GroupId=group_id, IpPermissions=ingress)
+            if egress:
+                self._release("egress rules of", group_id, self.ec2.revoke_security_group_egress,
+                              GroupId=group_id, IpPermissions=egress)
+        for table_id, association_id in self.associations:
+            self._release("route table association", f"{association_id} ({table_id})",
+                          self.ec2.disassociate_route_table, AssociationId=association_id)
+        for interface_id in self.interfaces:
+            self._release("network interface", interface_id, self.ec2.delete_network_interface,
+                          NetworkInterfaceId=interface_id)
+
+    def _release(self, what, name, call, **kwargs):
+        try:
+            call(**kwargs)
+            log(f"  ✓ Released {what} {name}", Colors.OKGREEN)
+        except ClientError as e:
+            # The deletions it blocks are retried anyway, so this is not fatal
+            log(f"  ✗ Could not release {what} {name}: {e}", Colors.FAIL)
+
+def _referencing(permissions, group_ids):
+    """The parts of security group rules that reference one of group_ids"""
+    matched = []
+    for permission in permissions:
+        pairs = [pair for pair in permission.get('UserIdGroupPairs', []) if pair.get('GroupId') in group_ids]
+        if pairs:
+            rule = {key: permission[key] for key in ('IpProtocol', 'FromPort', 'ToPort') if key in permission}
+            rule['UserIdGroupPairs'] = [{'GroupId': pair['GroupId']} for pair in pairs]
+            matched.append(rule)
+    return matched
+
+# Error codes that mean a resource no longer exists
+NOT_FOUND_CODES = {
+    'ResourceNotFoundException',
+    'ReplicationGroupNotFoundFault',
+    'CacheClusterNotFound',
+    'CacheParameterGroupNotFound',
+    'CacheSubnetGroupNotFoundFault',
+    'SnapshotNotFoundFault',
+    'DBClusterNotFoundFault',
+    'DBClusterParameterGroupNotFound',
+    'DBSubnetGroupNotFoundFault',
+    'LoadBalancerNotFound',
+    'TargetGroupNotFound',
+    'NatGatewayNotFound',
+    'InvalidInternetGatewayID.NotFound',
+    'InvalidSubnetID.NotFound',
+    'InvalidRouteTableID.NotFound',
+    'InvalidGroup.NotFound',
+    'InvalidVpcID.NotFound',
+    'InvalidLaunchTemplateId.NotFound',
+    'InvalidAllocationID.NotFound',
+    'NoSuchBucket',
+    'ClusterNotFoundException',
+    'ServiceNotFoundException',
+    'AWS.SimpleQueueService.NonExistentQueue',
+    'QueueDoesNotExist',
+    'NoSuchDistribution',
+    'WAFNonexistentItemException',
+}
+
+# Error codes that mean "not yet": something still depends on the resource, it is
+# mid-transition, or we are being throttled. These are retried with backoff.
+RETRYABLE_ERROR_CODES = {
+    'DependencyViolation',
+    'ResourceInUse',
+    'ResourceInUseException',
+    'InvalidCacheClusterState',
+    'InvalidReplicationGroupState',
+    'InvalidCacheParameterGroupState',
+    'CacheSubnetGroupInUse',
+    'InvalidDBClusterStateFault',
+    'InvalidDBParameterGroupState',
+    'InvalidDBSubnetGroupStateFault',
+    'InvalidDBSubnetStateFault',
+    'IncorrectState',
+    'InvalidIPAddress.InUse',
+    'BucketNotEmpty',
+    'ClusterContainsServicesException',
+    'ClusterContainsTasksException',
+    'ResourceConflictException',
+    'DistributionNotDisabled',
+    'PreconditionFailed',
+    'WAFAssociatedItemException',
+    'WAFOptimisticLockException',
+} | THROTTLE_ERROR_CODES
+
+# Statuses that mean a deletion has stopped and will never complete
+FAILED_STATES = {'DELETE_FAILED', 'FAILED', 'incompatible-network'}
+
+def _nodegroup_state(clients, region, nodegroup):
+    cluster_name, nodegroup_name = nodegroup
+    eks = clients.get('eks', region)
+    response = eks.describe_nodegroup(clusterName=cluster_name, nodegroupName=nodegroup_name)
+    return response['nodegroup']['status']
+
+def _eks_cluster_state(clients, region, cluster_name):
+    eks = clients.get('eks', region)
+    return eks.describe_cluster(name=cluster_name)['cluster']['status']
+
+def _replication_group_state(clients, region, group_id):
+    elasticache = clients.get('elasticache', region)
+    response = elasticache.describe_replication_groups(ReplicationGroupId=group_id)
+    return response['ReplicationGroups'][0]['Status']
+
+def _cache_cluster_state(clients, region, cluster_id):
+    elasticache = clients.get('elasticache', region)
+    response = elasticache.describe_cache_clusters(CacheClusterId=cluster_id)
+    return response['CacheClusters'][0]['CacheClusterStatus']
+
+def _rds_cluster_state(clients, region, cluster_id):
+    rds = clients.get('rds', region)
+    response = rds.describe_db_clusters(DBClusterIdentifier=cluster_id)
+    return response['DBClusters'][0]['Status']
+
+def _load_balancer_state(clients, region, lb_arn):
+    elbv2 = clients.get('elbv2', region)
+    response = elbv2.describe_load_balancers(LoadBalancerArns=[lb_arn])
+    return response['LoadBalancers'][0]['State']['Code']
+
+def _nat_gateway_state(clients, region, nat_id):
+    ec2 = clients.get('ec2', region)
+    response = ec2.describe_nat_gateways(NatGatewayIds=[nat_id])
+    state = response['NatGateways'][0]['State'] if response['NatGateways'] else 'deleted'
+    # Deleted NAT gateways stay visible for a while in the 'deleted' state
+    return None if state in ('deleted', 'failed') else state
+
+def _ecs_service_state(clients, region, service):
+    cluster_name, service_name = service
+    ecs = clients.get('ecs', region)
+    services = ecs.describe_services(cluster=cluster_name, services=[service_name])['services']
+    # Deleted services linger as INACTIVE
+    return services[0]['status'] if services and services[0]['status'] != 'INACTIVE' else None
+
+def _event_source_mapping_state(clients, region, mapping_uuid):
+    lambda_client = clients.get('lambda', region)
+    return lambda_client.get_event_source_mapping(UUID=mapping_uuid)['State']
+
+def _dynamodb_table_state(clients, region, table_name):
+    dynamodb = clients.get('dynamodb', region)
+    return dynamodb.describe_table(TableName=table_name)['Table']['TableStatus']
+
+# Resource type -> function returning its current state, or None once gone
+STATE_CHECKS = {
+    'eks_nodegroup': _nodegroup_state,
+    'eks_cluster': _eks_cluster_state,
+    'elasticache_replication_group': _replication_group_state,
+    'elasticache_cluster': _cache_cluster_state,
+    'rds_cluster': _rds_cluster_state,
+    'load_balancer': _load_balancer_state,
+    'nat_gateway': _nat_gateway_state,
+    'ecs_service': _ecs_service_state,
+    'lambda_event_source_mapping': _event_source_mapping_state,
+    'dynamodb_table': _dynamodb_table_state,
+}
+
+def _ecs_service_drain_state(clients, region, service):
+    cluster_name, service_name = service
+    ecs = clients.get('ecs', region)
+    services = ecs.describe_services(cluster=cluster_name, services=[service_name])['services']
+    # A service that is no longer ACTIVE is already being deleted and has nothing to drain
+    if not services or services[0]['status'] != 'ACTIVE':
+        return None
+    tasks = services[0]['runningCount'] + services[0]['pendingCount']
+    return f"{tasks} tasks" if tasks else None
+
+def _distribution_deploy_state(clients, region, distribution_id):
+    cloudfront = clients.get('cloudfront', region)
+    status = cloudfront.get_distribution(Id=distribution_id)['Distribution']['Status']
+    return None if status == 'Deployed' else status
+
+# Resource type -> (what to wait for, state check, last step) for deletions that
+# have to wait part-way through. The deleter in RESOURCE_TYPES starts the deletion,
+# the tracker polls the check (state, or None once done) like a STATE_CHECKS entry,
+# and the last step then finishes the deletion.
+STAGED_DELETES = {
+    'ecs_service': ('drain', _ecs_service_drain_state, finish_ecs_service),
+    'cloudfront_distribution': ('deploy', _distribution_deploy_state, finish_cloudfront_distribution),
+}
+
+class CompletionTracker:
+    """Poll actual resource state until deletions are confirmed"""
+
+    def __init__(self, clients, region, poll_interval=None, timeouts=None):
+        self.clients = clients
+        self.region = region
+        self.poll_interval = poll_interval or POLL_INTERVAL
+        self.timeouts = timeouts or WAIT_TIMEOUTS
+
+    def state(self, kind, ident):
+        """Return the current state of a resource, or None if it is gone"""
+        try:
+            return STATE_CHECKS[kind](self.clients, self.region, ident)
+        except ClientError as e:
+            if e.response['Error']['Code'] in NOT_FOUND_CODES:
+                return None
+            raise
+
+    def wait(self, kind, idents, staged=False):
+        """Block until all resources are gone; returns those still present at the deadline
+
+        With staged, wait instead until they are ready for the last step of a STAGED_DELETES deletion.
+        """
+        with metrics.span('wait', kind=self._span_kind(kind, staged), region=self.region):
+            return self._wait(kind, idents, staged)
+
+    def _wait(self, kind, idents, staged):
+        pending = list(idents)
+        deadline = time.monotonic() + self.timeouts[kind]
+        done = self.ready if staged else self.settled
+
+        while pending:
+            pending = [ident for ident in pending if not done(kind, ident)]
+            delay = self._next_poll(kind, pending, deadline, staged)
+            if delay is None:
+                break
+            time.sleep(delay)
+
+        return pending
+
+    async def wait_async(self, engine, kind, idents, staged=False):
+        """wait() for the asyncio engine: polls go through the engine, sleeps don't hold a thread"""
+        with metrics.span('wait', kind=self._span_kind(kind, staged), region=self.region):
+            pending = list(idents)
+            deadline = time.monotonic() + self.timeouts[kind]
+            service = KIND_SERVICES[kind]
+            done = self.ready if staged else self.settled
+
+            while pending:
+                results = await asyncio.gather(*(
+                    engine.call(service, self.region, done, kind, ident) for ident in pending
+                ))
+                pending = [ident for ident, finished in zip(pending, results) if not finished]
+                delay = self._next_poll(kind, pending, deadline, staged)
+                if delay is None:
+                    break
+                await asyncio.sleep(delay)
+
+            return pending
+
+    def _span_kind(self, kind, staged):
+        return f"{kind}_{STAGED_DELETES[kind][0]}" if staged else kind
+
+    def ready(self, kind, ident):
+        """Poll a staged deletion once; True if the resource is ready for its last step"""
+        what, check, _ = STAGED_DELETES[kind]
+        try:
+            return check(self.clients, self.region, ident) is None
+        except ClientError as e:
+            # Gone already: the last step reports it as deleted
+            if e.response['Error']['Code'] in NOT_FOUND_CODES:
+                return True
+            log(f"  ✗ Error checking {what} of {kind} {display_name(kind, ident)}: {e}", Colors.FAIL)
+            return False
+
+    def settled(self, kind, ident):
+        """Poll a resource once; True if it is gone or its deletion has failed"""
+        try:
+            state = self.state(kind, ident)
+        except ClientError as e:
+            log(f"  ✗ Error checking {kind} {display_name(kind, ident)}: {e}", Colors.FAIL)
+            return False
+        if state is None:
+            log(f"  ✓ Confirmed {kind} deleted: {display_name(kind, ident)}", Colors.OKGREEN)
+            return True
+        if state in FAILED_STATES:
+            log(f"  ✗ Deletion of {kind} {display_name(kind, ident)} failed (status: {state})", Colors.FAIL)
+            return True
+        return False
+
+    def _next_poll(self, kind, pending, deadline, staged=False):
+        # Seconds until the next poll, or None once nothing is pending or time is up
+        if not pending:
+            return None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            for ident in pending:
+                if staged:
+                    log(f"  ✗ Timed out waiting for {kind} {display_name(kind, ident)} to "
+                        f"{STAGED_DELETES[kind][0]}; finishing its deletion anyway", Colors.FAIL)
+                else:
+                    log(f"  ✗ Timed out waiting for {kind} {display_name(kind, ident)} to be deleted", Colors.FAIL)
+            return None
+        return min(self.poll_interval, remaining)
+
+def display_name(kind, ident):
+    """Short human-readable name for a resource identifier"""
+    if kind == 'eks_nodegroup':
+        return f"{ident[1]} (cluster {ident[0]})"
+    if kind in ('internet_gateway', 'elastic_ip'):
+        return ident[0]
+    if kind in ('load_balancer', 'target_group'):
+        return ident.split('/')[-2]
+    if kind == 'ecs_service':
+        return f"{ident[1]} (cluster {ident[0]})"
+    if kind == 'acm_certificate':
+        return ident.rsplit('/', 1)[-1]
+    if kind in ('waf_web_acl', 'sqs_queue'):
+        return ident[0]
+    return ident
+
+# Resource types in display order: (heading, label, single-resource deleter)
+RESOURCE_TYPES = {
+    'eks_cluster': ("EKS Clusters", "EKS cluster", delete_eks_cluster),
+    'eks_nodegroup': ("EKS Node Groups", "EKS nodegroup", delete_eks_nodegroup),
+    'elasticache_cluster': ("ElastiCache Clusters", "ElastiCache cluster", delete_elasticache_cluster),
+    'elasticache_replication_group': ("ElastiCache Replication Groups", "ElastiCache replication group", delete_elasticache_replication_group),
+    'elasticache_snapshot': ("ElastiCache Snapshots", "ElastiCache snapshot", delete_elasticache_snapshot),
+    'elasticache_parameter_group': ("ElastiCache Parameter Groups", "ElastiCache parameter group", delete_elasticache_parameter_group),
+    'elasticache_subnet_group': ("ElastiCache Subnet Groups", "ElastiCache subnet group", delete_elasticache_subnet_group),
+    'rds_cluster': ("RDS Clusters", "RDS cluster", delete_rds_cluster),
+    'rds_parameter_group': ("RDS Parameter Groups", "RDS parameter group", delete_rds_parameter_group),
+    'rds_subnet_group': ("RDS Subnet Groups", "RDS subnet group", delete_rds_subnet_group),
+    'load_balancer': ("Load Balancers", "load balancer", delete_load_balancer),
+    'target_group': ("Target Groups", "target group", delete_target_group),
+    'nat_gateway': ("NAT Gateways", "NAT gateway", delete_nat_gateway),
+    'elastic_ip': ("Elastic IPs", "Elastic IP", release_elastic_ip),
+    'internet_gateway': ("Internet Gateways", "internet gateway", delete_internet_gateway),
+    'subnet': ("Subnets", "subnet", delete_subnet),
+    'route_table': ("Route Tables", "route table", delete_route_table),
+    'security_group': ("Security Groups", "security group", delete_security_group),
+    'vpc': ("VPCs", "VPC", delete_vpc),
+    'launch_template': ("Launch Templates", "launch template", delete_launch_template),
+    'ecs_cluster': ("ECS Clusters", "ECS cluster", delete_ecs_cluster),
+    'ecs_service': ("ECS Services", "ECS service", delete_ecs_service),
+    'ecs_task_definition': ("ECS Task Definitions", "ECS task definition", delete_ecs_task_definition),
+    'lambda_event_source_mapping': ("Lambda Event Source Mappings", "event source mapping", delete_lambda_event_source_mapping),
+    'lambda_function': ("Lambda Functions", "Lambda function", delete_lambda_function),
+    'sqs_queue': ("SQS Queues", "SQS queue", delete_sqs_queue),
+    'dynamodb_table': ("DynamoDB Tables", "DynamoDB table", delete_dynamodb_table),
+    's3_bucket': ("S3 Buckets", "S3 bucket", delete_s3_bucket),
+    'cloudfront_distribution': ("CloudFront Distributions", "CloudFront distribution", delete_cloudfront_distribution),
+    'waf_web_acl': ("WAF Web ACLs", "WAF web ACL", delete_waf_web_acl),
+    'acm_certificate': ("ACM Certificates", "ACM certificate", delete_acm_certificate),
+}
+
+class RegionCheckpoint:
+    """What an earlier run recorded for one region"""
+
+    def __init__(self):
+        self.records = {}
+        self.issued = set()
+        self.gone = set()
+        self.discovery_complete = False
+
+    def pending(self):
+        """Records from the journal that are not confirmed deleted yet"""
+        return [record for arn, record in self.records.items() if arn not in self.gone]
+
+class Journal:
+    """Append-only JSON-lines log of discovered, in-flight and confirmed-deleted resources"""
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.checkpoints = self._load(path) if resume else {}
+        self._file = open(path, 'a' if resume else 'w', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _load(path):
+        checkpoints = {}
+        try:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # The last line may be cut short if the previous run was killed mid-write
+                        continue
+                    checkpoint = checkpoints.setdefault(entry['region'], RegionCheckpoint())
+                    event = entry['event']
+                    if event == 'discovered':
+                        ident = entry['ident']
+                        ident = tuple(ident) if isinstance(ident, list) else ident
+                        checkpoint.records[entry['arn']] = ResourceRecord(entry['kind'], ident, entry['arn'], entry['region'])
+                    elif event == 'discovery_complete':
+                        checkpoint.discovery_complete = True
+                    elif event == 'delete_issued':
+                        checkpoint.issued.add(entry['arn'])
+                    elif event == 'gone':
+                        checkpoint.gone.add(entry['arn'])
+        except FileNotFoundError:
+            pass
+        return checkpoints
+
+    def checkpoint(self, region):
+        return self.checkpoints.get(region)
+
+    def _write(self, event, region, **fields):
+        line = json.dumps(dict(event=event, region=region, time=time.time(), **fields))
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def discovered(self, record):
+        self._write('discovered', record.region, arn=record.arn, kind=record.kind, ident=record.ident)
+
+    def discovery_complete(self, region):
+        self._write('discovery_complete', region)
 
-def get_tagged_resources(session, region):
-    """Get all resources with terraform tag"""
-    client = session.client('resourcegroupstaggingapi', region_name=region)
-    resources = []
-    
-    for tag_value in TAG_VALUES:
+    def delete_issued(self, record):
+        self._write('delete_issued', record.region, arn=record.arn)
+
+    def gone(self, record):
+        self._write('gone', record.region, arn=record.arn)
+
+    def close(self):
+        self._file.close()
+
+# Resource type -> types that must be gone before it can be deleted
+DEPENDENCIES = {
+    'eks_cluster': ['eks_nodegroup'],
+    'launch_template': ['eks_nodegroup'],
+    'elasticache_cluster': ['elasticache_replication_group'],
+    'elasticache_subnet_group': ['elasticache_replication_group', 'elasticache_cluster'],
+    'elasticache_parameter_group': ['elasticache_replication_group', 'elasticache_cluster'],
+    'rds_subnet_group': ['rds_cluster'],
+    'rds_parameter_group': ['rds_cluster'],
+    'target_group': ['load_balancer', 'ecs_service'],
+    # Addresses mapped in the VPC keep the gateway from detaching
+    'internet_gateway': ['nat_gateway', 'load_balancer', 'elastic_ip'],
+    'elastic_ip': ['nat_gateway'],
+    'subnet': ['nat_gateway', 'internet_gateway', 'load_balancer', 'eks_cluster', 'eks_nodegroup',
+               'elasticache_replication_group', 'elasticache_cluster', 'rds_cluster',
+               'ecs_service', 'lambda_function'],
+    'route_table': ['subnet'],
+    'security_group': ['load_balancer', 'eks_cluster', 'eks_nodegroup',
+                       'elasticache_replication_group', 'elasticache_cluster', 'rds_cluster',
+                       'ecs_service', 'lambda_function'],
+    'ecs_cluster': ['ecs_service'],
+    'ecs_task_definition': ['ecs_service'],
+    # Mappings poll their source, so they go before both ends
+    'lambda_function': ['lambda_event_source_mapping'],
+    'sqs_queue': ['lambda_event_source_mapping'],
+    'dynamodb_table': ['lambda_event_source_mapping'],
+    'waf_web_acl': ['cloudfront_distribution'],
+    'acm_certificate': ['cloudfront_distribution'],
+    'vpc': ['nat_gateway', 'internet_gateway', 'subnet', 'route_table', 'security_group'],
+}
+
+# Resource type -> types that wait for it, the inverse of DEPENDENCIES
+DEPENDENT_KINDS = {
+    kind: [dependent for dependent, prereq_kinds in DEPENDENCIES.items() if kind in prereq_kinds]
+    for kind in RESOURCE_TYPES
+}
+
+def _in_vpc(vpc, member):
+    # A member whose VPC is unknown (resumed from a journal, or not described) keeps the type-level edge
+    return member.vpc is None or member.vpc == vpc.ident
+
+def _same_vpc(record, prereq):
+    return record.vpc is None or prereq.vpc is None or record.vpc == prereq.vpc
+
+# Narrow a type-level dependency to the resources that actually belong together;
+# each matcher takes the dependent's ResourceRecord and the prerequisite's
+DEPENDENCY_MATCHERS = {
+    ('eks_cluster', 'eks_nodegroup'): lambda cluster, nodegroup: nodegroup.ident[0] == cluster.ident,
+    ('vpc', 'internet_gateway'): lambda vpc, igw: igw.ident[1] == vpc.ident,
+    ('vpc', 'subnet'): _in_vpc,
+    ('vpc', 'route_table'): _in_vpc,
+    ('vpc', 'security_group'): _in_vpc,
+    ('route_table', 'subnet'): _same_vpc,
+    ('ecs_cluster', 'ecs_service'): lambda cluster, service: service.ident[0] == cluster.ident,
+}
+
+class DeletionGraph:
+    """Dependency graph of resources to delete, run on a bounded worker pool
+
+    Ready work is started longest critical path first: the estimated time (from
+    `durations`) to delete a resource plus everything that waits on it. Slow
+    chains such as node group -> cluster -> subnet -> VPC get going early, and
+    quick deletions fill the remaining workers.
+    """
+
+    def __init__(self, journal=None, in_flight=(), edges=None):
+        self.journal = journal
+        # ARNs whose deletion an earlier run already started; these are only polled
+        self.in_flight = set(in_flight)
+        # (node, prerequisite) pairs from a plan, used by link() instead of DEPENDENCIES
+        self.edges = edges
+        self.records = {}
+        self.prerequisites = {}
+        self.dependents = {}
+        self.by_kind = {kind: [] for kind in RESOURCE_TYPES}
+        self.linked = False
+        self._ranks = {}
+        self._kind_ranks = {}
+
+    def add(self, record):
+        """Add a resource; returns False if it is already in the graph"""
+        node = (record.kind, record.ident)
+        if node in self.prerequisites:
+            return False
+        self.records[node] = record
+        self.prerequisites[node] = set()
+        self.dependents[node] = set()
+        self.by_kind[record.kind].append(record.ident)
+        return True
+
+    def link(self):
+        """Add dependency edges once every resource is known"""
+        if self.edges is not None:
+            for node, prereq in self.edges:
+                # Resources a resumed or re-checked plan no longer holds are skipped
+                if node in self.prerequisites and prereq in self.prerequisites:
+                    self.prerequisites[node].add(prereq)
+                    self.dependents[prereq].add(node)
+            self.linked = True
+            return
+        for kind, prereq_kinds in DEPENDENCIES.items():
+            for ident in self.by_kind[kind]:
+                record = self.records[(kind, ident)]
+                for prereq_kind in prereq_kinds:
+                    matches = DEPENDENCY_MATCHERS.get((kind, prereq_kind))
+                    for prereq in self.by_kind[prereq_kind]:
+                        if matches is None or matches(record, self.records[(prereq_kind, prereq)]):
+                            self.prerequisites[(kind, ident)].add((prereq_kind, prereq))
+                            self.dependents[(prereq_kind, prereq)].add((kind, ident))
+        self.linked = True
+
+    def _kind_rank(self, kind):
+        # Critical path estimate from the type-level dependencies alone
+        if kind not in self._kind_ranks:
+            self._kind_ranks[kind] = durations.estimate(kind) + max(
+                (self._kind_rank(dependent) for dependent in DEPENDENT_KINDS[kind]), default=0)
+        return self._kind_ranks[kind]
+
+    def _rank(self, node):
+        if node not in self._ranks:
+            self._ranks[node] = durations.estimate(node[0]) + max(
+                (self._rank(dependent) for dependent in self.dependents[node]), default=0)
+        return self._ranks[node]
+
+    def priority(self, node):
+        """Heap key for ready work: longest critical path first, then most dependents"""
+        # Until link() knows the real edges, assume every resource of a dependent type waits
+        rank = self._rank(node) if self.linked else self._kind_rank(node[0])
+        return -rank, -len(self.dependents[node])
+
+    def planned_order(self):
+        """Every node, in the order run() would start them given enough workers"""
+        waiting_on = {node: len(prereqs) for node, prereqs in self.prerequisites.items()}
+        arrivals = itertools.count()
+        ready = [(self.priority(node), next(arrivals), node) for node, count in waiting_on.items() if count == 0]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            node = heapq.heappop(ready)[2]
+            order.append(node)
+            for dependent in self.dependents[node]:
+                waiting_on[dependent] -= 1
+                if waiting_on[dependent] == 0:
+                    heapq.heappush(ready, (self.priority(dependent), next(arrivals), dependent))
+        # A dependency cycle would leave nodes behind; run() starts those last too
+        placed = set(order)
+        order.extend(node for node in self.prerequisites if node not in placed)
+        return order
+
+    def _execute(self, clients, region, tracker, node):
+        """Delete one resource and wait until it is really gone; returns (status, reason)"""
+        start = time.perf_counter()
+        action = 'resume' if self._resumed(node) else 'delete'
+        status, reason = self._delete(clients, region, tracker, node)
+        self._settled(region, node, action, status, reason, time.perf_counter() - start)
+        return status, reason
+
+    def _settled(self, region, node, action, status, reason, seconds):
+        """Record how one attempt at a node ended, in the metrics and the event stream"""
+        metrics.record('node', {'kind': node[0], 'region': region, 'status': status}, seconds)
+        emit('resource', resource=self.records[node].arn, kind=node[0], action=action, region=region,
+             outcome=status, duration=round(seconds, 3), reason=reason, dry_run=DRY_RUN)
+
+    def _delete(self, clients, region, tracker, node):
+        start = time.perf_counter()
+        result = self._issue(clients, region, node)
+        if result is not None:
+            return result
+        kind, ident = node
+        if self._staged(node):
+            tracker.wait(kind, [ident], staged=True)
+            result = self._issue(clients, region, node, STAGED_DELETES[kind][2])
+            if result is not None:
+                return result
+        if not DRY_RUN and kind in STATE_CHECKS and tracker.wait(kind, [ident]):
+            return 'timed_out', f"still present after {tracker.timeouts[kind]}s"
+        return self._confirmed(node, start)
+
+    def _issue(self, clients, region, node, step=None):
+        """Start a deletion, or run step to finish a staged one
+
+        Returns (status, reason) if the resource is already settled, else None.
+        """
+        kind, ident = node
+        record = self.records[node]
+        _, label, delete = RESOURCE_TYPES[kind]
         try:
-            paginator = client.get_paginator('get_resources')
-            for page in paginator.paginate(
-                TagFilters=[{'Key': TAG_KEY, 'Values': [tag_value]}]
-            ):
-                resources.extend(page['ResourceTagMappingList'])
+            if self._resumed(node):
+                log(f"  Resuming wait for {label}: {display_name(kind, ident)}...", Colors.OKCYAN)
+            else:
+                (step or delete)(clients, region, ident)
+                # A staged deletion is only in flight once its last step has run
+                if self.journal and not DRY_RUN and (step or kind not in STAGED_DELETES):
+                    self.journal.delete_issued(record)
         except ClientError as e:
-            log(f"Error getting tagged resources in {region}: {e}", Colors.FAIL)
-    
-    return resources
+            code = e.response['Error']['Code']
+            if code in NOT_FOUND_CODES:
+                log(f"  ✓ Already deleted {label}: {display_name(kind, ident)}", Colors.OKGREEN)
+                if self.journal and not DRY_RUN:
+                    self.journal.gone(record)
+                return 'deleted', None
+            if code in RETRYABLE_ERROR_CODES:
+                return 'retry', f"{code}: {e.response['Error'].get('Message', '')}"
+            log(f"  ✗ Error deleting {label} {display_name(kind, ident)}: {e}", Colors.FAIL)
+            return 'failed', str(e)
+        except Exception as e:
+            log(f"  ✗ Unexpected error deleting {label} {display_name(kind, ident)}: {e}", Colors.FAIL)
+            return 'failed', str(e)
+        return None
 
-def delete_eks_nodegroups(session, region, nodegroups):
-    """Delete EKS node groups"""
-    if not nodegroups:
-        return
-    
-    eks = session.client('eks', region_name=region)
-    
-    for cluster_name, nodegroup_name in nodegroups:
-        log(f"  Deleting EKS nodegroup: {nodegroup_name} from cluster {cluster_name}...", Colors.WARNING)
-        if not DRY_RUN:
-            try:
-                eks.delete_nodegroup(clusterName=cluster_name, nodegroupName=nodegroup_name)
-                log(f"  ✓ Initiated deletion of nodegroup: {nodegroup_name}", Colors.OKGREEN)
-            except ClientError as e:
-                log(f"  ✗ Error deleting nodegroup: {e}", Colors.FAIL)
+    def _resumed(self, node):
+        return self.records[node].arn in self.in_flight and node[0] in STATE_CHECKS
 
-def delete_eks_clusters(session, region, cluster_names):
-    """Delete EKS clusters"""
-    if not cluster_names:
-        return
-    
-    eks = session.client('eks', region_name=region)
-    
-    for cluster_name in cluster_names:
-        log(f"  Deleting EKS cluster: {cluster_name}...", Colors.WARNING)
-        if not DRY_RUN:
-            try:
-                eks.delete_cluster(name=cluster_name)
-                log(f"  ✓ Initiated deletion of cluster: {cluster_name}", Colors.OKGREEN)
-            except ClientError as e:
-                log(f"  ✗ Error deleting cluster: {e}", Colors.FAIL)
+    def _staged(self, node):
+        return not DRY_RUN and node[0] in STAGED_DELETES and not self._resumed(node)
 
-def delete_elasticache_clusters(session, region, cache_clusters):
-    """Delete ElastiCache clusters"""
-    if not cache_clusters:
-        return
-    
-    elasticache = session.client('elasticache', region_name=region)
-    
-    for cluster_id in cache_clusters:
-        log(f"  Deleting ElastiCache cluster: {cluster_id}...", Colors.WARNING)
+    def _confirmed(self, node, start):
+        """Record a deletion issued at start (perf_counter) as confirmed gone"""
         if not DRY_RUN:
-            try:
-                elasticache.delete_cache_cluster(
-                    CacheClusterId=cluster_id,
-                    FinalSnapshotIdentifier=None
-                )
-                log(f"  ✓ Deleted ElastiCache cluster: {cluster_id}", Colors.OKGREEN)
-            except ClientError as e:
-                log(f"  ✗ Error deleting ElastiCache cluster: {e}", Colors.FAIL)
+            if not self._resumed(node):
+                durations.observe(node[0], time.perf_counter() - start)
+            if self.journal:
+                self.journal.gone(self.records[node])
+        return 'deleted', None
 
-def delete_elasticache_replication_groups(session, region, repl_groups):
-    """Delete ElastiCache replication groups"""
-    if not repl_groups:
-        return
-    
-    elasticache = session.client('elasticache', region_name=region)
-    
-    for group_id in repl_groups:
-        log(f"  Deleting ElastiCache replication group: {group_id}...", Colors.WARNING)
-        if not DRY_RUN:
-            try:
-                elasticache.delete_replication_group(
-                    ReplicationGroupId=group_id,
-                    RetainPrimaryCluster=False
-                )
-                log(f"  ✓ Deleted replication group: {group_id}", Colors.OKGREEN)
-            except ClientError as e:
-                log(f"  ✗ Error deleting replication group: {e}", Colors.FAIL)
+    def run(self, clients, region, records, max_workers=None):
+        """Delete resources from a stream of ResourceRecords; returns {node: (status, reason)}
 
-def delete_rds_clusters(session, region, cluster_ids):
-    """Delete RDS clusters"""
-    if not cluster_ids:
-        return
-    
-    rds = session.client('rds', region_name=region)
-    
-    for cluster_id in cluster_ids:
-        log(f"  Deleting RDS cluster: {cluster_id}...", Colors.WARNING)
-        if not DRY_RUN:
-            try:
-                rds.delete_db_cluster(
-                    DBClusterIdentifier=cluster_id,
-                    SkipFinalSnapshot=True
-                )
-                log(f"  ✓ Deleted RDS cluster: {cluster_id}", Colors.OKGREEN)
-            except ClientError as e:
-                log(f"  ✗ Error deleting RDS cluster: {e}", Colors.FAIL)
+        Resources with no possible prerequisites become ready as soon as they are
+        discovered. Everything else waits for discovery to finish, since a
+        prerequisite could still turn up on a later page, and then for its
+        prerequisites to settle. Ready resources are handed to free workers in
+        priority() order. Retryable failures are requeued with jittered
+        exponential backoff until RETRY_DEADLINE; whatever is left then is
+        reported as stuck.
+        """
+        tracker = CompletionTracker(clients, region)
+        max_workers = max_workers or MAX_WORKERS
+        deadline = time.monotonic() + RETRY_DEADLINE
+        outcomes = {}
+        attempts = Counter()
+        retries = []  # heap of (due time, node)
+        ready = []  # heap of (priority, arrival, node)
+        arrivals = itertools.count()
 
-def delete_load_balancers(session, region, lb_arns):
-    """Delete load balancers"""
-    if not lb_arns:
-        return
-    
-    elbv2 = session.client('elbv2', region_name=region)
-    
-    for lb_arn in lb_arns:
-        log(f"  Deleting load balancer: {lb_arn.split('/')[-1]}...", Colors.WARNING)
-        if not DRY_RUN:
-            try:
-                elbv2.delete_load_balancer(LoadBalancerArn=lb_arn)
-                log(f"  ✓ Deleted load balancer", Colors.OKGREEN)
-            except ClientError as e:
-                log(f"  ✗ Error deleting load balancer: {e}", Colors.FAIL)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            running = {}
+            
+            def start(node):
+                heapq.heappush(ready, (self.priority(node), next(arrivals), node))
+                dispatch()
+            
+            def dispatch():
+                while ready and len(running) < max_workers:
+                    node = heapq.heappop(ready)[2]
+                    attempts[node] += 1
+                    running[submit(pool, self._execute, clients, region, tracker, node)] = node
+            
+            def settle(done):
+                for future in done:
+                    node = running.pop(future)
+                    status, reason = future.result()
+                    if status == 'retry':
+                        delay = self._backoff(region, node, attempts[node], reason, deadline)
+                        if delay is not None:
+                            heapq.heappush(retries, (time.monotonic() + delay, node))
+                            continue
+                        status = 'stuck'
+                    
+                    outcomes[node] = (status, reason)
+                    # Before link() nothing depends on anything yet; waiting_on is then
+                    # counted without the nodes settled so far. Failed prerequisites still
+                    # release their dependents, matching the script's continue-on-error behaviour
+                    if self.linked:
+                        for dependent in self.dependents[node]:
+                            waiting_on[dependent] -= 1
+                            if waiting_on[dependent] == 0:
+                                start(dependent)
+                
+                while retries and retries[0][0] <= time.monotonic():
+                    start(heapq.heappop(retries)[1])
+                # Workers freed by finished nodes take the next queued ones
+                dispatch()
+            
+            with metrics.span('phase', phase='discovery', region=region):
+                for record in records:
+                    if self.add(record) and record.kind not in DEPENDENCIES:
+                        start((record.kind, record.ident))
+                    # Free the workers of finished deletions without waiting for the scan to end
+                    settle(wait(running, timeout=0)[0])
+            
+            self.link()
+            # Re-rank what is still queued now that the real edges are known
+            ready[:] = [(self.priority(node), arrival, node) for _, arrival, node in ready]
+            heapq.heapify(ready)
+            self.log_categories()
+            waiting_on = {
+                node: sum(prereq not in outcomes for prereq in prereqs)
+                for node, prereqs in self.prerequisites.items()
+                if node[0] in DEPENDENCIES
+            }
+            for node, count in waiting_on.items():
+                if count == 0:
+                    start(node)
+            
+            while running or retries:
+                timeout = max(0, retries[0][0] - time.monotonic()) if retries else None
+                if running:
+                    done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                else:
+                    # wait() returns at once with no futures, so sleep until the next retry is due
+                    time.sleep(timeout)
+                    done = ()
+                settle(done)
 
-def delete_target_groups(session, region, tg_arns):
-    """Delete target groups"""
-    if not tg_arns:
-        return
-    
-    elbv2 = session.client('elbv2', region_name=region)
-    
-    for tg_arn in tg_arns:
-        log(f"  Deleting target group: {tg_arn.split('/')[-1]}...", Colors.WARNING)
-        if not DRY_RUN:
-            try:
-                elbv2.delete_target_group(TargetGroupArn=tg_arn)
-                log(f"  ✓ Deleted target group", Colors.OKGREEN)
-            except ClientError as e:
-                log(f"  ✗ Error deleting target group: {e}", Colors.FAIL)
+        return outcomes
 
-def delete_nat_gateways(session, region, nat_ids):
-    """Delete NAT gateways"""
-    if not nat_ids:
-        return
-    
-    ec2 = session.client('ec2', region_name=region)
-    
-    for nat_id in nat_ids:
-        log(f"  Deleting NAT gateway: {nat_id}...", Colors.WARNING)
-        if not DRY_RUN:
-            try:
-                ec2.delete_nat_gateway(NatGatewayId=nat_id)
-                log(f"  ✓ Deleted NAT gateway: {nat_id}", Colors.OKGREEN)
-            except ClientError as e:
-                log(f"  ✗ Error deleting NAT gateway: {e}", Colors.FAIL)
-    
-    if not DRY_RUN and nat_ids:
-        log("  Waiting for NAT gateways to be deleted...", Colors.OKCYAN)
-        time.sleep(60)
+    def _backoff(self, region, node, attempt, reason, deadline):
+        """Jittered delay before retrying a node that was not ready, or None to give up on it"""
+        kind, ident = node
+        delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+        if time.monotonic() + delay < deadline:
+            metrics.record('backoff', {'kind': kind, 'region': region}, delay)
+            log(f"  ↻ {RESOURCE_TYPES[kind][1]} {display_name(kind, ident)} not ready "
+                f"({reason.split(':')[0]}), retrying in {delay:.0f}s", Colors.OKCYAN)
+            return delay
+        log(f"  ✗ Giving up on {RESOURCE_TYPES[kind][1]} {display_name(kind, ident)} "
+            f"after {attempt} attempts: {reason}", Colors.FAIL)
+        emit('resource', resource=self.records[node].arn, kind=kind, action='give_up', region=region,
+             outcome='stuck', attempts=attempt, reason=reason, dry_run=DRY_RUN)
+        return None
 
-def delete_internet_gateways(session, region, igw_data):
-    """Delete internet gateways"""
-    if not igw_data:
-        return
-    
-    ec2 = session.client('ec2', region_name=region)
-    
-    for igw_id, vpc_id in igw_data:
-        log(f"  Deleting internet gateway: {igw_id}...", Colors.WARNING)
-        if not DRY_RUN:
-            try:
-                ec2.detach_internet_gateway(InternetGatewayId=igw_id, VpcId=vpc_id)
-                ec2.delete_internet_gateway(InternetGatewayId=igw_id)
-                log(f"  ✓ Deleted internet gateway: {igw_id}", Colors.OKGREEN)
-            except ClientError as e:
-                log(f"  ✗ Error deleting internet gateway: {e}", Colors.FAIL)
+    async def _delete_async(self, engine, clients, region, tracker, node):
+        start = time.perf_counter()
+        kind, ident = node
+        result = await engine.call(KIND_SERVICES[kind], region, self._issue, clients, region, node)
+        if result is not None:
+            return result
+        if self._staged(node):
+            await tracker.wait_async(engine, kind, [ident], staged=True)
+            result = await engine.call(KIND_SERVICES[kind], region, self._issue, clients, region, node,
+                                       STAGED_DELETES[kind][2])
+            if result is not None:
+                return result
+        if not DRY_RUN and kind in STATE_CHECKS and await tracker.wait_async(engine, kind, [ident]):
+            return 'timed_out', f"still present after {tracker.timeouts[kind]}s"
+        return self._confirmed(node, start)
 
-def delete_subnets(session, region, subnet_ids):
-    """Delete subnets"""
-    if not subnet_ids:
-        return
-    
-    ec2 = session.client('ec2', region_name=region)
-    
-    for subnet_id in subnet_ids:
-        log(f"  Deleting subnet: {subnet_id}...", Colors.WARNING)
-        if not DRY_RUN:
-            try:
-                ec2.delete_subnet(SubnetId=subnet_id)
-                log(f"  ✓ Deleted subnet: {subnet_id}", Colors.OKGREEN)
-            except ClientError as e:
-                log(f"  ✗ Error deleting subnet: {e}", Colors.FAIL)
+    async def run_async(self, engine, clients, region, records):
+        """run() on the asyncio engine, with each resource a task instead of a worker thread
 
-def delete_route_tables(session, region, rt_ids):
-    """Delete route tables"""
-    if not rt_ids:
-        return
-    
-    ec2 = session.client('ec2', region_name=region)
-    
-    for rt_id in rt_ids:
-        log(f"  Deleting route table: {rt_id}...", Colors.WARNING)
-        if not DRY_RUN:
-            try:
-                ec2.delete_route_table(RouteTableId=rt_id)
-                log(f"  ✓ Deleted route table: {rt_id}", Colors.OKGREEN)
-            except ClientError as e:
-                log(f"  ✗ Error deleting route table: {e}", Colors.FAIL)
+        Scheduling follows run(): dependents start once their prerequisites have
+        settled, retries back off the same way, and ready tasks are created in
+        priority() order so they queue on the engine's semaphores most urgent first.
+        """
+        tracker = CompletionTracker(clients, region)
+        deadline = time.monotonic() + RETRY_DEADLINE
+        outcomes = {}
+        waiting_on = {}
+        tasks = []
+        linked = asyncio.Event()
 
-def delete_security_groups(session, region, sg_ids):
-    """Delete security groups"""
-    if not sg_ids:
-        return
-    
-    ec2 = session.client('ec2', region_name=region)
-    
-    for sg_id in sg_ids:
-        log(f"  Deleting security group: {sg_id}...", Colors.WARNING)
-        if not DRY_RUN:
-            try:
-                ec2.delete_security_group(GroupId=sg_id)
-                log(f"  ✓ Deleted security group: {sg_id}", Colors.OKGREEN)
-            except ClientError as e:
-                log(f"  ✗ Error deleting security group: {e}", Colors.FAIL)
+        async def execute(node):
+            attempt = 0
+            while True:
+                attempt += 1
+                start = time.perf_counter()
+                action = 'resume' if self._resumed(node) else 'delete'
+                status, reason = await self._delete_async(engine, clients, region, tracker, node)
+                self._settled(region, node, action, status, reason, time.perf_counter() - start)
+                if status != 'retry':
+                    break
+                delay = self._backoff(region, node, attempt, reason, deadline)
+                if delay is None:
+                    status = 'stuck'
+                    break
+                await asyncio.sleep(delay)
+            outcomes[node] = (status, reason)
+            # Dependents are only counted once discovery has finished
+            await linked.wait()
+            for dependent in self.dependents[node]:
+                waiting_on[dependent] -= 1
+                if waiting_on[dependent] == 0:
+                    launch([dependent])
 
-def delete_vpcs(session, region, vpc_ids):
-    """Delete VPCs"""
-    if not vpc_ids:
-        return
-    
-    ec2 = session.client('ec2', region_name=region)
-    
-    for vpc_id in vpc_ids:
-        log(f"  Deleting VPC: {vpc_id}...", Colors.WARNING)
-        if not DRY_RUN:
-            try:
-                ec2.delete_vpc(VpcId=vpc_id)
-                log(f"  ✓ Deleted VPC: {vpc_id}", Colors.OKGREEN)
-            except ClientError as e:
-                log(f"  ✗ Error deleting VPC: {e}", Colors.FAIL)
+        def launch(nodes):
+            for node in sorted(nodes, key=self.priority):
+                tasks.append(asyncio.create_task(execute(node)))
 
-def delete_launch_templates(session, region, lt_ids):
-    """Delete launch templates"""
-    if not lt_ids:
-        return
-    
-    ec2 = session.client('ec2', region_name=region)
-    
-    for lt_id in lt_ids:
-        log(f"  Deleting launch template: {lt_id}...", Colors.WARNING)
-        if not DRY_RUN:
-            try:
-                ec2.delete_launch_template(LaunchTemplateId=lt_id)
-                log(f"  ✓ Deleted launch template: {lt_id}", Colors.OKGREEN)
-            except ClientError as e:
-                log(f"  ✗ Error deleting launch template: {e}", Colors.FAIL)
+        with metrics.span('phase', phase='discovery', region=region):
+            records = iter(records)
+            # Each step of the scan may page through the tagging API, so it runs on the pool
+            while (record := await engine.run(next, records, None)) is not None:
+                if self.add(record) and record.kind not in DEPENDENCIES:
+                    launch([(record.kind, record.ident)])
 
-def delete_elasticache_snapshots(session, region, snapshot_names):
-    """Delete ElastiCache snapshots"""
-    if not snapshot_names:
-        return
-    
-    elasticache = session.client('elasticache', region_name=region)
-    
-    for snapshot_name in snapshot_names:
-        log(f"  Deleting ElastiCache snapshot: {snapshot_name}...", Colors.WARNING)
-        if not DRY_RUN:
-            try:
-                elasticache.delete_snapshot(SnapshotName=snapshot_name)
-                log(f"  ✓ Deleted snapshot: {snapshot_name}", Colors.OKGREEN)
-            except ClientError as e:
-                log(f"  ✗ Error deleting snapshot: {e}", Colors.FAIL)
+        self.link()
+        self.log_categories()
+        waiting_on.update(
+            (node, len(prereqs)) for node, prereqs in self.prerequisites.items() if node[0] in DEPENDENCIES
+        )
+        launch([node for node, count in waiting_on.items() if count == 0])
+        linked.set()
 
-def delete_elasticache_parameter_groups(session, region, param_groups):
-    """Delete ElastiCache parameter groups"""
-    if not param_groups:
-        return
-    
-    elasticache = session.client('elasticache', region_name=region)
-    
-    for pg_name in param_groups:
-        log(f"  Deleting ElastiCache parameter group: {pg_name}...", Colors.WARNING)
-        if not DRY_RUN:
-            try:
-                elasticache.delete_cache_parameter_group(CacheParameterGroupName=pg_name)
-                log(f"  ✓ Deleted parameter group: {pg_name}", Colors.OKGREEN)
-            except ClientError as e:
-                log(f"  ✗ Error deleting parameter group: {e}", Colors.FAIL)
+        while pending := [task for task in tasks if not task.done()]:
+            await asyncio.wait(pending)
+        for task in tasks:
+            # Surface anything that escaped a task's own error handling
+            task.result()
+        return outcomes
 
-def delete_elasticache_subnet_groups(session, region, subnet_groups):
-    """Delete ElastiCache subnet groups"""
-    if not subnet_groups:
-        return
-    
-    elasticache = session.client('elasticache', region_name=region)
-    
-    for sg_name in subnet_groups:
-        log(f"  Deleting ElastiCache subnet group: {sg_name}...", Colors.WARNING)
-        if not DRY_RUN:
-            try:
-                elasticache.delete_cache_subnet_group(CacheSubnetGroupName=sg_name)
-                log(f"  ✓ Deleted subnet group: {sg_name}", Colors.OKGREEN)
-            except ClientError as e:
-                log(f"  ✗ Error deleting subnet group: {e}", Colors.FAIL)
+    def log_categories(self):
+        """Report what discovery found"""
+        if not self.prerequisites:
+            return
+        log(f"\nFound {len(self.prerequisites)} resources", Colors.OKBLUE)
+        log("Categorized resources:", Colors.OKCYAN)
+        for kind, (name, _, _) in RESOURCE_TYPES.items():
+            if self.by_kind[kind]:
+                log(f"  {name}: {len(self.by_kind[kind])}", Colors.OKBLUE)
 
-def delete_rds_parameter_groups(session, region, param_groups):
-    """Delete RDS parameter groups"""
-    if not param_groups:
-        return
-    
-    rds = session.client('rds', region_name=region)
-    
-    for pg_name in param_groups:
-        log(f"  Deleting RDS parameter group: {pg_name}...", Colors.WARNING)
-        if not DRY_RUN:
-            try:
-                rds.delete_db_cluster_parameter_group(DBClusterParameterGroupName=pg_name)
-                log(f"  ✓ Deleted parameter group: {pg_name}", Colors.OKGREEN)
-            except ClientError as e:
-                log(f"  ✗ Error deleting parameter group: {e}", Colors.FAIL)
+class AsyncEngine:
+    """Runs blocking botocore calls for asyncio tasks on one bounded thread pool
 
-def delete_rds_subnet_groups(session, region, subnet_groups):
-    """Delete RDS subnet groups"""
-    if not subnet_groups:
-        return
-    
-    rds = session.client('rds', region_name=region)
-    
-    for sg_name in subnet_groups:
-        log(f"  Deleting RDS subnet group: {sg_name}...", Colors.WARNING)
-        if not DRY_RUN:
-            try:
-                rds.delete_db_subnet_group(DBSubnetGroupName=sg_name)
-                log(f"  ✓ Deleted subnet group: {sg_name}", Colors.OKGREEN)
-            except ClientError as e:
-                log(f"  ✗ Error deleting subnet group: {e}", Colors.FAIL)
+    Calls are also capped per (service, region) by a semaphore, so thousands of
+    pending deletions and polls share a few dozen threads instead of one each.
+    """
 
-def get_igw_vpc_mapping(session, region, igw_ids):
-    """Get VPC attachments for internet gateways"""
-    if not igw_ids:
-        return []
-    
-    ec2 = session.client('ec2', region_name=region)
-    igw_data = []
-    
+    def __init__(self, call_workers=None, service_concurrency=None):
+        self.executor = ThreadPoolExecutor(max_workers=call_workers or ASYNC_CALL_WORKERS,
+                                           thread_name_prefix='aws-call')
+        self.service_concurrency = service_concurrency or ASYNC_SERVICE_CONCURRENCY
+        # Only touched from the event loop's thread, so no lock
+        self._semaphores = {}
+
+    async def run(self, fn, *args):
+        """Run a blocking function on the pool, logging into the calling task's region buffer"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, contextvars.copy_context().run, fn, *args)
+
+    async def call(self, service, region, fn, *args):
+        """run(), holding one of the service's slots in that region"""
+        semaphore = self._semaphores.get((service, region))
+        if semaphore is None:
+            semaphore = self._semaphores[(service, region)] = asyncio.Semaphore(self.service_concurrency)
+        async with semaphore:
+            return await self.run(fn, *args)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+def _is_managed(tags):
+    return any(tag['Key'] == TAG_KEY and tag['Value'] in TAG_VALUES for tag in tags)
+
+def _index_runs(indices):
+    """Compress indices to sorted runs: n alone, or [start, stop) for consecutive ones"""
+    runs = []
+    for index in sorted(indices):
+        last = runs[-1] if runs else None
+        if isinstance(last, list) and last[1] == index:
+            last[1] = index + 1
+        elif last is not None and not isinstance(last, list) and last + 1 == index:
+            runs[-1] = [last, index + 1]
+        else:
+            runs.append(index)
+    return runs
+
+def _expand_runs(runs):
+    for run in runs:
+        if isinstance(run, list):
+            yield from range(*run)
+        else:
+            yield run
+
+def _planned_ident(ident):
+    # JSON has no tuples; compound identifiers come back as lists
+    return tuple(ident) if isinstance(ident, list) else ident
+
+class Plan:
+    """Resources to delete per region and for the edge track, with their edges and start order
+
+    On disk each unit lists its resources in planned start order as
+    [kind index, ARN] (plus the identifier when it is not the one the ARN gives,
+    as for gateways and addresses), and each resource's prerequisites as runs of
+    indices into that list. Type-level dependencies make most prerequisites
+    whole blocks of one kind, which planned order keeps together, so the runs
+    stay short.
+    """
+
+    def __init__(self, source, created=None, select=None):
+        self.source = source  # 'tags', or the state the resources were read from
+        self.select = select  # the --select expression, re-checked by apply
+        self.created = created or time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        self.units = {}       # (region, edge) -> ([ResourceRecord in start order], [(node, prerequisite)])
+
+    def add(self, region, graph, edge=False):
+        """Record a discovered and linked graph as a unit of the plan"""
+        order = graph.planned_order()
+        self.units[(region, edge)] = ([graph.records[node] for node in order],
+                                      [(node, prereq) for node in order for prereq in graph.prerequisites[node]])
+
+    def __len__(self):
+        return sum(len(records) for records, _ in self.units.values())
+
+    def regions(self):
+        return [region for region, edge in self.units if not edge]
+
+    def write(self, path):
+        """Write the plan atomically in its compact JSON form"""
+        units = []
+        for (region, edge), (records, edges) in self.units.items():
+            kinds = {}
+            resources = []
+            positions = {}
+            for position, record in enumerate(records):
+                entry = [kinds.setdefault(record.kind, len(kinds)), record.arn]
+                classified = classify(record.arn)
+                if classified is None or classified.ident != record.ident:
+                    entry.append(record.ident)
+                resources.append(entry)
+                positions[(record.kind, record.ident)] = position
+            prerequisites = [[] for _ in records]
+            for node, prereq in edges:
+                prerequisites[positions[node]].append(positions[prereq])
+            units.append({'region': region, 'edge': edge, 'kinds': list(kinds), 'resources': resources,
+                          'prerequisites': [_index_runs(indices) for indices in prerequisites]})
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'version': PLAN_VERSION, 'created': self.created, 'source': self.source,
+                       'select': self.select, 'units': units}, f, separators=(',', ':'))
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            document = json.load(f)
+        if document.get('version') != PLAN_VERSION:
+            raise ValueError(f"{path} is a version {document.get('version')} plan; "
+                             f"this script reads version {PLAN_VERSION}")
+        plan = cls(document['source'], document['created'], document.get('select'))
+        for unit in document['units']:
+            records = []
+            for entry in unit['resources']:
+                kind = unit['kinds'][entry[0]]
+                ident = _planned_ident(entry[2]) if len(entry) > 2 else classify(entry[1]).ident
+                records.append(ResourceRecord(kind, ident, entry[1], unit['region']))
+            nodes = [(record.kind, record.ident) for record in records]
+            edges = [(nodes[position], nodes[prereq])
+                     for position, runs in enumerate(unit['prerequisites']) for prereq in _expand_runs(runs)]
+            plan.units[(unit['region'], unit['edge'])] = (records, edges)
+        return plan
+
+    def edges(self, region, edge=False):
+        return self.units.get((region, edge), ((), []))[1]
+
+    def records(self, clients, region, edge=False):
+        """Yield a unit's records in planned order, after re-checking them against AWS
+
+        Only the planned resources are looked at: their tags, when the plan came
+        from the tag scan, and the network blockers of the ones in VPCs.
+        """
+        records = list(self.units.get((region, edge), ((), []))[0])
+        if records and self.source == 'tags':
+            records = self._still_tagged(clients, region, records)
+        if records and not edge:
+            self._preflight(clients, region, records)
+        yield from records
+
+    def _still_tagged(self, clients, region, records):
+        client = clients.get('resourcegroupstaggingapi', region)
+        resources = []
+        for chunk in _chunks([record.arn for record in records], TAG_CHECK_BATCH):
+            resources.extend(client.get_resources(ResourceARNList=chunk)['ResourceTagMappingList'])
+        tags = {resource['ResourceARN']: resource['Tags'] for resource in resources}
+        selected = set(Selector(self.select).select(resources)) if self.select else None
+        kept = []
+        for record in records:
+            # Resources missing from the response are left to their deleter, which
+            # treats one that is already gone as deleted
+            if record.arn in tags and not _is_managed(tags[record.arn]):
+                reason = f"no longer tagged {TAG_KEY}={' or '.join(TAG_VALUES)}"
+            elif record.arn in tags and selected is not None and record.arn not in selected:
+                reason = f"no longer matches {self.select!r}"
+            else:
+                kept.append(record)
+                continue
+            log(f"  Skipping {RESOURCE_TYPES[record.kind][1]} {display_name(record.kind, record.ident)}: {reason}",
+                Colors.WARNING)
+        return kept
+
+    def _preflight(self, clients, region, records):
+        found = {kind: set() for kind in NetworkIndex.KINDS}
+        for record in records:
+            if record.kind in found:
+                found[record.kind].add(record.ident[0] if isinstance(record.ident, tuple) else record.ident)
+        index = NetworkIndex(clients, region).build(found)
+        index.release_blockers()
+        # Attachments may have changed since planning; ones that could not be
+        # described keep the planned attachment, and their deletion settles it
+        for record in records:
+            attachments = {'internet_gateway': index.igw_vpcs,
+                           'elastic_ip': index.address_associations}.get(record.kind)
+            if attachments is not None and record.ident[0] in attachments:
+                record.ident = (record.ident[0], attachments[record.ident[0]])
+
+# Set by main() for `apply`; replaces discovery with the plan's resources and edges
+active_plan = None
+
+def plan_unit(clients, region, edge=False):
+    """Discover a region, or the edge stack, and link its graph without deleting anything"""
+    buffer = []
+    _log_buffer.set(buffer)
+    log(f"\n{'='*60}", Colors.HEADER)
+    log(f"Planning {'edge resources' if edge else 'region'}: {region}", Colors.HEADER)
+    log(f"{'='*60}", Colors.HEADER)
+    graph = DeletionGraph()
     try:
-        response = ec2.describe_internet_gateways(InternetGatewayIds=igw_ids)
-        for igw in response['InternetGateways']:
-            if igw['Attachments']:
-                vpc_id = igw['Attachments'][0]['VpcId']
-                igw_data.append((igw['InternetGatewayId'], vpc_id))
-    except ClientError as e:
-        log(f"  Error getting IGW attachments: {e}", Colors.FAIL)
-    
-    return igw_data
+        records = discover_edge_resources(clients, region) if edge else discover_resources(clients, region, preflight=False)
+        for record in records:
+            graph.add(record)
+    except Exception as e:
+        log(f"\n✗ Error planning {region}: {e}", Colors.FAIL)
+        log(traceback.format_exc().rstrip())
+        return buffer, None, e
+    graph.link()
+    graph.log_categories()
+    return buffer, graph, None
 
-def process_region(region):
-    """Process all resources in a region"""
+def _journaled(records, journal, region, skip=()):
+    """Record discovered resources in the journal, dropping ones already confirmed deleted"""
+    for record in records:
+        if record.arn in skip:
+            continue
+        journal.discovered(record)
+        yield record
+    journal.discovery_complete(region)
+
+def _region_plan(clients, region, journal):
+    """Announce a region and work out what to process in it; returns (graph, records)"""
     log(f"\n{'='*60}", Colors.HEADER)
     log(f"Processing region: {region}", Colors.HEADER)
     log(f"{'='*60}", Colors.HEADER)
     
-    session = boto3.Session(region_name=region)
-    
-    log("\nScanning for Terraform-managed resources...", Colors.OKCYAN)
-    resources = get_tagged_resources(session, region)
-    
-    if not resources:
-        log(f"No Terraform-managed resources found in {region}", Colors.OKGREEN)
-        return
-    
-    log(f"Found {len(resources)} resources", Colors.OKBLUE)
-    
-    # Categorize resources
-    eks_clusters = []
-    eks_nodegroups = []
-    elasticache_clusters = []
-    elasticache_repl_groups = []
-    elasticache_snapshots = []
-    elasticache_param_groups = []
-    elasticache_subnet_groups = []
-    rds_clusters = []
-    rds_param_groups = []
-    rds_subnet_groups = []
-    load_balancers = []
-    target_groups = []
-    nat_gateways = []
-    internet_gateways = []
-    subnets = []
-    route_tables = []
-    security_groups = []
-    vpcs = []
-    launch_templates = []
+    checkpoint = journal.checkpoint(region) if journal else None
+    edges = active_plan.edges(region) if active_plan else None
+    if checkpoint and checkpoint.discovery_complete:
+        pending = checkpoint.pending()
+        log(f"\nResuming from {journal.path}: {len(checkpoint.gone)} already deleted, "
+            f"{len(checkpoint.issued - checkpoint.gone)} in flight, {len(pending)} remaining", Colors.OKCYAN)
+        records = pending
+    else:
+        # Deletions start while the scan is still paging through results
+        if ENGINE == 'asyncio':
+            limit = f"{ASYNC_SERVICE_CONCURRENCY} calls in flight per service"
+        else:
+            limit = f"{MAX_WORKERS} workers"
+        if active_plan:
+            log(f"\nDeleting the planned resources with up to {limit}...", Colors.OKCYAN)
+            records = active_plan.records(clients, region)
+        else:
+            log(f"\nScanning for Terraform-managed resources and deleting with up to {limit}...", Colors.OKCYAN)
+            records = discover_resources(clients, region)
+        if journal:
+            records = _journaled(records, journal, region, checkpoint.gone if checkpoint else ())
+    
+    return DeletionGraph(journal, checkpoint.issued if checkpoint else (), edges), records
+
+def _region_finished(region, outcomes):
+    if not outcomes:
+        log(f"No Terraform-managed resources left in {region}", Colors.OKGREEN)
+        return {}
     
-    for resource in resources:
-        arn = resource['ResourceARN']
+    log(f"\n✓ Completed processing {region}", Colors.OKGREEN)
+    return outcomes
+
+def process_region(clients, region, journal=None):
+    """Process all resources in a region"""
+    graph, records = _region_plan(clients, region, journal)
+    return _region_finished(region, graph.run(clients, region, records))
+
+async def process_region_async(engine, clients, region, journal=None):
+    """process_region() on the asyncio engine"""
+    graph, records = _region_plan(clients, region, journal)
+    return _region_finished(region, await graph.run_async(engine, clients, region, records))
+
+def process_region_safely(clients, region, journal=None):
+    """Process a region, containing any error to it; returns (outcomes, error)"""
+    try:
+        with metrics.span('phase', phase='region', region=region):
+            return process_region(clients, region, journal), None
+    except Exception as e:
+        log(f"\n✗ Error processing region {region}: {e}", Colors.FAIL)
+        log(traceback.format_exc().rstrip())
+        return {}, e
+
+def _process_region_buffered(clients, region, journal):
+    buffer = []
+    _log_buffer.set(buffer)
+    return buffer, process_region_safely(clients, region, journal)
+
+def run_regions(clients, regions, workers=None, journal=None):
+    """Process regions, concurrently when workers > 1; returns {region: (outcomes, error)}"""
+    workers = workers or REGION_WORKERS
+    if workers <= 1:
+        return {region: process_region_safely(clients, region, journal) for region in regions}
+    
+    log(f"Processing {len(regions)} regions with up to {workers} at a time; "
+        f"each region's output is shown when it finishes", Colors.OKCYAN)
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {submit(pool, _process_region_buffered, clients, region, journal): region for region in regions}
+        for future in as_completed(futures):
+            buffer, results[futures[future]] = future.result()
+            log_lines(buffer)
+    
+    # Keep the summary in the configured region order
+    return {region: results[region] for region in regions}
+
+async def _process_region_async_buffered(engine, clients, region, journal):
+    # Each task runs in its own copy of the context, so this buffer is the region's alone
+    buffer = []
+    _log_buffer.set(buffer)
+    try:
+        with metrics.span('phase', phase='region', region=region):
+            result = await process_region_async(engine, clients, region, journal), None
+    except Exception as e:
+        log(f"\n✗ Error processing region {region}: {e}", Colors.FAIL)
+        log(traceback.format_exc().rstrip())
+        result = {}, e
+    return region, buffer, result
+
+async def _run_regions_async(clients, regions, journal):
+    engine = AsyncEngine()
+    try:
+        results = {}
+        tasks = [_process_region_async_buffered(engine, clients, region, journal) for region in regions]
+        for task in asyncio.as_completed(tasks):
+            region, buffer, results[region] = await task
+            log_lines(buffer)
+        return {region: results[region] for region in regions}
+    finally:
+        engine.close()
+
+def run_regions_async(clients, regions, journal=None):
+    """run_regions() on the asyncio engine: every region at once, on one event loop"""
+    log(f"Processing {len(regions)} regions on the asyncio engine; "
+        f"each region's output is shown when it finishes", Colors.OKCYAN)
+    return asyncio.run(_run_regions_async(clients, regions, journal))
+
+class EdgeTeardown:
+    """Delete the CloudFront/WAF/ACM stack on a background thread while the regions run
+
+    A distribution has to be disabled, and that change deployed (10-20 minutes),
+    before it can be deleted, and its web ACL and certificate can only go after it.
+    The track is started before the regions and joined after them, so the wait
+    overlaps with the regional work instead of adding to it.
+    """
+
+    def __init__(self, clients, region=None):
+        self.clients = clients
+        self.region = region or EDGE_REGION
+        self.result = None
+        # Output is held back, like a concurrently processed region's, until join()
+        self._buffer = []
+        self._thread = threading.Thread(target=self._run, name='edge-teardown', daemon=True)
+
+    def start(self):
+        log(f"Tearing down CloudFront, WAF and ACM in {self.region} in the background", Colors.OKCYAN)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        _log_buffer.set(self._buffer)
+        log(f"\n{'='*60}", Colors.HEADER)
+        log(f"Processing edge resources: {self.region}", Colors.HEADER)
+        log(f"{'='*60}", Colors.HEADER)
+        try:
+            with metrics.span('phase', phase='edge', region=self.region):
+                # Not journaled: a resumed run rediscovers the few edge resources, and
+                # disabling an already disabled distribution is a no-op
+                if active_plan:
+                    records = active_plan.records(self.clients, self.region, edge=True)
+                    graph = DeletionGraph(edges=active_plan.edges(self.region, edge=True))
+                else:
+                    records = discover_edge_resources(self.clients, self.region)
+                    graph = DeletionGraph()
+                outcomes = graph.run(self.clients, self.region, records)
+            if not outcomes:
+                log(f"No Terraform-managed edge resources left in {self.region}", Colors.OKGREEN)
+            self.result = (outcomes, None)
+        except Exception as e:
+            log(f"\n✗ Error processing edge resources: {e}", Colors.FAIL)
+            log(traceback.format_exc().rstrip())
+            self.result = ({}, e)
+
+    def join(self):
+        """Wait for the track, printing its output as it goes; returns (outcomes, error)"""
+        if self._thread.is_alive():
+            log(f"\nWaiting for the edge teardown in {self.region} to finish...", Colors.OKCYAN)
+        printed = 0
+        while True:
+            self._thread.join(POLL_INTERVAL)
+            finished = not self._thread.is_alive()
+            # Appends from the track's thread are atomic, so the buffer can be read as it grows
+            lines = self._buffer[printed:]
+            printed += len(lines)
+            if lines:
+                log_lines(lines)
+            if finished:
+                return self.result
+
+class AssumedRoleProvider(CredentialProvider):
+    """Credential provider handing botocore refreshable credentials for an assumed role"""
+    METHOD = 'cleanup-assume-role'
+
+    def __init__(self, fetch):
+        super().__init__()
+        self.fetch = fetch
+
+    def load(self):
+        # Resolved once per session and shared by all its clients, so the role is assumed
+        # once however many regions and threads use it; botocore serialises refreshes
+        return DeferredRefreshableCredentials(self.fetch, self.METHOD)
+
+def assumed_role_session(base_session, role_arn):
+    """A boto3 Session for a role, assumed on first use and refreshed before it expires"""
+    sts = base_session.client('sts', config=client_config())
+    
+    def fetch():
+        credentials = sts.assume_role(RoleArn=role_arn, RoleSessionName=ROLE_SESSION_NAME,
+                                      DurationSeconds=ROLE_SESSION_SECONDS)['Credentials']
+        return {
+            'access_key': credentials['AccessKeyId'],
+            'secret_key': credentials['SecretAccessKey'],
+            'token': credentials['SessionToken'],
+            'expiry_time': credentials['Expiration'].isoformat(),
+        }
+    
+    # Put ahead of every other source (environment, profiles, instance roles), so the
+    # session resolves to the role whatever the base credentials came from
+    botocore_session = get_botocore_session()
+    botocore_session.get_component('credential_provider').insert_before('env', AssumedRoleProvider(fetch))
+    return boto3.Session(botocore_session=botocore_session)
+
+def _account_path(path, account_id):
+    # cleanup-journal.jsonl -> cleanup-journal-123456789012.jsonl
+    root, ext = os.path.splitext(path)
+    return f"{root}-{account_id}{ext}"
+
+class Account:
+    """One account of a multi-account run, with its own clients, rate limits and journal"""
+
+    def __init__(self, base_session, role_arn, rates, journal_path=None, resume=False):
+        self.role_arn = role_arn
+        self.id = parse_arn(role_arn)[3]
+        # API rate limits are per account, so each account gets its own buckets
+        self.limiter = RateLimiter(rates)
+        self.clients = ClientPool(assumed_role_session(base_session, role_arn), limiter=self.limiter)
+        self.journal = Journal(_account_path(journal_path, self.id), resume) if journal_path else None
+        self.regions = REGIONS
+        self.edge = None
+
+    def label(self, region):
+        return f"{self.id} {region}"
+
+def read_role_arns(path):
+    """Role ARNs listed one per line in a file; blank lines and # comments are skipped"""
+    with open(path, encoding='utf-8') as f:
+        return [line.split('#', 1)[0].strip() for line in f if line.split('#', 1)[0].strip()]
+
+async def _process_region_on_engine(clients, region, journal):
+    engine = AsyncEngine()
+    try:
+        return await _process_region_async_buffered(engine, clients, region, journal)
+    finally:
+        engine.close()
+
+def _process_account_region(account, region):
+    if ENGINE == 'asyncio':
+        # Each unit gets an event loop of its own on its pool thread
+        _, buffer, result = asyncio.run(_process_region_on_engine(account.clients, region, account.journal))
+        return buffer, result
+    return _process_region_buffered(account.clients, region, account.journal)
+
+def run_accounts(accounts, workers=None, account_workers=None):
+    """Process every (account, region) unit; returns {"account region": (outcomes, error)}
+
+    Units are started round-robin across accounts, so a sweep takes about as long
+    as the slowest account rather than the sum of them.
+    """
+    workers = workers or UNIT_WORKERS
+    account_workers = account_workers or REGION_WORKERS
+    log(f"Processing {sum(len(account.regions) for account in accounts)} regions across {len(accounts)} accounts "
+        f"with up to {workers} at a time, {account_workers} per account; each region's output is shown "
+        f"when it finishes", Colors.OKCYAN)
+    
+    pending = {account.id: list(account.regions) for account in accounts}
+    running = Counter()
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {}
         
-        if ':eks:' in arn and ':cluster/' in arn:
-            cluster_name = arn.split('cluster/')[-1]
-            eks_clusters.append(cluster_name)
-        elif ':eks:' in arn and ':nodegroup/' in arn:
-            parts = arn.split('nodegroup/')[-1].split('/')
-            cluster_name = parts[0]
-            nodegroup_name = parts[1]
-            eks_nodegroups.append((cluster_name, nodegroup_name))
-        elif ':elasticache:' in arn and ':cluster:' in arn:
-            cluster_id = arn.split(':')[-1]
-            elasticache_clusters.append(cluster_id)
-        elif ':elasticache:' in arn and ':replicationgroup:' in arn:
-            group_id = arn.split(':')[-1]
-            elasticache_repl_groups.append(group_id)
-        elif ':elasticache:' in arn and ':snapshot:' in arn:
-            snapshot_name = arn.split(':')[-1]
-            elasticache_snapshots.append(snapshot_name)
-        elif ':elasticache:' in arn and ':parametergroup:' in arn:
-            pg_name = arn.split(':')[-1]
-            elasticache_param_groups.append(pg_name)
-        elif ':elasticache:' in arn and ':subnetgroup:' in arn:
-            sg_name = arn.split(':')[-1]
-            elasticache_subnet_groups.append(sg_name)
-        elif ':rds:' in arn and ':cluster:' in arn:
-            cluster_id = arn.split(':')[-1]
-            rds_clusters.append(cluster_id)
-        elif ':rds:' in arn and ':cluster-pg:' in arn:
-            pg_name = arn.split(':')[-1]
-            rds_param_groups.append(pg_name)
-        elif ':rds:' in arn and ':subgrp:' in arn:
-            sg_name = arn.split(':')[-1]
-            rds_subnet_groups.append(sg_name)
-        elif ':elasticloadbalancing:' in arn and 'loadbalancer/' in arn:
-            load_balancers.append(arn)
-        elif ':elasticloadbalancing:' in arn and 'targetgroup/' in arn:
-            target_groups.append(arn)
-        elif ':ec2:' in arn and 'natgateway/' in arn:
-            nat_gateways.append(arn.split('/')[-1])
-        elif ':ec2:' in arn and 'internet-gateway/' in arn:
-            internet_gateways.append(arn.split('/')[-1])
-        elif ':ec2:' in arn and 'subnet/' in arn:
-            subnets.append(arn.split('/')[-1])
-        elif ':ec2:' in arn and 'route-table/' in arn:
-            route_tables.append(arn.split('/')[-1])
-        elif ':ec2:' in arn and 'security-group/' in arn:
-            sg_id = arn.split('/')[-1]
-            if sg_id != 'default':
-                security_groups.append(sg_id)
-        elif ':ec2:' in arn and 'vpc/' in arn:
-            vpcs.append(arn.split('/')[-1])
-        elif ':ec2:' in arn and 'launch-template/' in arn:
-            launch_templates.append(arn.split('/')[-1])
-    
-    # Show categorization
-    log(f"\nCategorized resources:", Colors.OKCYAN)
-    categories = [
-        ("EKS Clusters", eks_clusters),
-        ("EKS Node Groups", eks_nodegroups),
-        ("ElastiCache Clusters", elasticache_clusters),
-        ("ElastiCache Replication Groups", elasticache_repl_groups),
-        ("ElastiCache Snapshots", elasticache_snapshots),
-        ("ElastiCache Parameter Groups", elasticache_param_groups),
-        ("ElastiCache Subnet Groups", elasticache_subnet_groups),
-        ("RDS Clusters", rds_clusters),
-        ("RDS Parameter Groups", rds_param_groups),
-        ("RDS Subnet Groups", rds_subnet_groups),
-        ("Load Balancers", load_balancers),
-        ("Target Groups", target_groups),
-        ("NAT Gateways", nat_gateways),
-        ("Internet Gateways", internet_gateways),
-        ("Subnets", subnets),
-        ("Route Tables", route_tables),
-        ("Security Groups", security_groups),
-        ("VPCs", vpcs),
-        ("Launch Templates", launch_templates)
-    ]
-    
-    for name, items in categories:
-        if items:
-            log(f"  {name}: {len(items)}", Colors.OKBLUE)
-    
-    # Get IGW-VPC mappings
-    igw_data = get_igw_vpc_mapping(session, region, internet_gateways)
-    
-    # Delete in dependency order
-    log("\n--- Phase 1: EKS Resources ---", Colors.BOLD)
-    delete_eks_nodegroups(session, region, eks_nodegroups)
-    if eks_nodegroups and not DRY_RUN:
-        log("  Waiting for node groups to be deleted...", Colors.OKCYAN)
-        time.sleep(120)
-    delete_eks_clusters(session, region, eks_clusters)
-    if eks_clusters and not DRY_RUN:
-        log("  Waiting for EKS clusters to be deleted...", Colors.OKCYAN)
-        time.sleep(120)
-    
-    log("\n--- Phase 2: Database & Cache Resources ---", Colors.BOLD)
-    delete_elasticache_replication_groups(session, region, elasticache_repl_groups)
-    delete_elasticache_clusters(session, region, elasticache_clusters)
-    delete_rds_clusters(session, region, rds_clusters)
-    if (elasticache_clusters or elasticache_repl_groups or rds_clusters) and not DRY_RUN:
-        log("  Waiting for databases to be deleted...", Colors.OKCYAN)
-        time.sleep(60)
-    
-    log("\n--- Phase 3: Load Balancing ---", Colors.BOLD)
-    delete_load_balancers(session, region, load_balancers)
-    if load_balancers and not DRY_RUN:
-        time.sleep(30)
-    delete_target_groups(session, region, target_groups)
-    
-    log("\n--- Phase 4: Network Infrastructure ---", Colors.BOLD)
-    delete_nat_gateways(session, region, nat_gateways)
-    delete_internet_gateways(session, region, igw_data)
-    
-    log("\n--- Phase 5: Subnets and Routing ---", Colors.BOLD)
-    delete_subnets(session, region, subnets)
-    delete_route_tables(session, region, route_tables)
-    
-    log("\n--- Phase 6: Security and VPC ---", Colors.BOLD)
-    delete_security_groups(session, region, security_groups)
-    delete_vpcs(session, region, vpcs)
-    
-    log("\n--- Phase 7: Supporting Resources ---", Colors.BOLD)
-    delete_launch_templates(session, region, launch_templates)
-    delete_elasticache_snapshots(session, region, elasticache_snapshots)
-    delete_elasticache_subnet_groups(session, region, elasticache_subnet_groups)
-    delete_elasticache_parameter_groups(session, region, elasticache_param_groups)
-    delete_rds_subnet_groups(session, region, rds_subnet_groups)
-    delete_rds_parameter_groups(session, region, rds_param_groups)
+        def dispatch():
+            started = True
+            while started and len(futures) < workers:
+                started = False
+                for account in accounts:
+                    if pending[account.id] and running[account.id] < account_workers and len(futures) < workers:
+                        region = pending[account.id].pop(0)
+                        running[account.id] += 1
+                        futures[submit(pool, _process_account_region, account, region)] = (account, region)
+                        started = True
+        
+        dispatch()
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                account, region = futures.pop(future)
+                running[account.id] -= 1
+                buffer, results[account.label(region)] = future.result()
+                log(f"\n[account {account.id}]", Colors.BOLD)
+                log_lines(buffer)
+            dispatch()
+    
+    # Keep the summary grouped by account, in the configured region order
+    return {account.label(region): results[account.label(region)] for account in accounts for region in account.regions}
+
+def print_account_totals(accounts, results):
+    """Print deletion outcomes summed per account"""
+    log("\nPer account:", Colors.HEADER)
+    for account in accounts:
+        counts = Counter()
+        aborted = 0
+        for label, (outcomes, error) in results.items():
+            if label.split(' ', 1)[0] == account.id:
+                counts.update(status for status, _ in outcomes.values())
+                aborted += error is not None
+        line = (f"  {account.id}: {counts['deleted']} deleted, {counts['failed']} failed, "
+                f"{counts['stuck']} stuck, {counts['timed_out']} timed out")
+        if aborted:
+            log(f"{line}, {aborted} regions aborted", Colors.FAIL)
+        else:
+            log(line, Colors.FAIL if set(counts) - {'deleted'} else Colors.OKGREEN)
+
+def print_summary(results):
+    """Print per-region and total deletion outcomes, and anything left behind"""
+    log(f"\n{'='*60}", Colors.HEADER)
+    log("Summary", Colors.HEADER)
+    log(f"{'='*60}", Colors.HEADER)
     
-    log(f"\n✓ Completed processing {region}", Colors.OKGREEN)
+    totals = Counter()
+    unresolved = []
+    for region, (outcomes, error) in results.items():
+        counts = Counter(status for status, _ in outcomes.values())
+        totals.update(counts)
+        line = (f"  {region}: {counts['deleted']} deleted, {counts['failed']} failed, "
+                f"{counts['stuck']} stuck, {counts['timed_out']} timed out")
+        if error:
+            log(f"{line} (aborted: {error})", Colors.FAIL)
+        else:
+            log(line, Colors.FAIL if set(counts) - {'deleted'} else Colors.OKGREEN)
+        for (kind, ident), (status, reason) in outcomes.items():
+            if status != 'deleted':
+                unresolved.append((region, kind, ident, status, reason))
+    log(f"  Total: {totals['deleted']} deleted, {totals['failed']} failed, "
+        f"{totals['stuck']} stuck, {totals['timed_out']} timed out", Colors.BOLD)
+    emit('summary', deleted=totals['deleted'], failed=totals['failed'], stuck=totals['stuck'],
+         timed_out=totals['timed_out'], aborted=[region for region, (_, error) in results.items() if error])
+    
+    if unresolved:
+        log("\nResources still present:", Colors.FAIL)
+        for region, kind, ident, status, reason in unresolved:
+            log(f"  [{region}] {RESOURCE_TYPES[kind][1]} {display_name(kind, ident)}: {status} - {reason}",
+                Colors.FAIL)
+
+def positive_int(value):
+    """Parse a worker count, which has to be at least 1"""
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"expected a positive integer, got {value!r}")
+    return number
+
+def rate_limit(value):
+    """Parse --rate SERVICE=CALLS_PER_SECOND into (service, calls per second)"""
+    service, sep, rate = value.partition('=')
+    try:
+        rate = float(rate)
+    except ValueError:
+        rate = None
+    # A zero, negative or infinite rate would stall or break the token bucket
+    if not service or not sep or rate is None or not 0 < rate < float('inf'):
+        raise argparse.ArgumentTypeError(f"expected SERVICE=CALLS_PER_SECOND with a positive rate, got {value!r}")
+    return service, rate
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Delete Terraform-managed AWS resources")
+    parser.add_argument('command', nargs='?', choices=['run', 'plan', 'apply'], default='run',
+                        help="run: discover and delete (default); plan: write what would be deleted to "
+                             "--plan-file, deleting nothing; apply: delete what --plan-file lists, without rescanning")
+    parser.add_argument('--plan-file', default=PLAN_PATH,
+                        help=f"plan written by plan and read by apply (default: {PLAN_PATH})")
+    parser.add_argument('--select', metavar='EXPRESSION',
+                        help="only process matching resources, e.g. 'Environment=dev and not Protected=true'; "
+                             "terms are Key, Key=glob, Key!=glob, arn:glob and type:glob, combined with "
+                             "and, or, not and parentheses")
+    parser.add_argument('--all-regions', action='store_true',
+                        help="process every enabled region that has matching resources instead of REGIONS, "
+                             "finding them with a quick parallel probe (with --state, the regions it lists)")
+    parser.add_argument('--region-workers', type=positive_int, default=REGION_WORKERS,
+                        help=f"regions to process concurrently; 1 runs them serially (default: {REGION_WORKERS})")
+    parser.add_argument('--engine', choices=['threads', 'asyncio'], default=ENGINE,
+                        help=f"run deletions on worker threads or as asyncio tasks (default: {ENGINE})")
+    parser.add_argument('--workers', type=positive_int, default=MAX_WORKERS,
+                        help=f"concurrent deletions per region (default: {MAX_WORKERS})")
+    parser.add_argument('--retry-mode', choices=['adaptive', 'standard'], default=CLIENT_RETRY_MODE,
+                        help=f"botocore retry mode for all clients (default: {CLIENT_RETRY_MODE})")
+    parser.add_argument('--rate', action='append', default=[], type=rate_limit, metavar='SERVICE=CALLS_PER_SECOND',
+                        help="baseline rate limit for a service, e.g. --rate ec2=10 (repeatable)")
+    parser.add_argument('--metrics-json', default=METRICS_JSON_PATH,
+                        help=f"JSON latency report written at exit; '' disables it (default: {METRICS_JSON_PATH})")
+    parser.add_argument('--metrics-prom', default=METRICS_PROM_PATH,
+                        help=f"Prometheus textfile written at exit; '' disables it (default: {METRICS_PROM_PATH})")
+    parser.add_argument('--events', default=EVENTS_PATH, metavar='PATH',
+                        help="append JSON-lines progress events (one per deletion attempt, plus the run's start "
+                             "and summary) to PATH as they happen; '-' writes them to stdout and the colored "
+                             "output to stderr")
+    parser.add_argument('--durations', default=DURATIONS_PATH,
+                        help=f"deletion duration history used to order work, updated at exit; "
+                             f"'' disables it (default: {DURATIONS_PATH})")
+    parser.add_argument('--role-arn', dest='role_arns', action='append', default=[], metavar='ROLE_ARN',
+                        help="clean up the account of this role, assumed from the default credentials (repeatable)")
+    parser.add_argument('--accounts-file', metavar='PATH',
+                        help="file of role ARNs to clean up, one per line, as if each were given with --role-arn")
+    parser.add_argument('--unit-workers', type=positive_int, default=UNIT_WORKERS,
+                        help=f"(account, region) pairs processed at once across all accounts, each account "
+                             f"limited to --region-workers (default: {UNIT_WORKERS})")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--state', metavar='PATH_OR_S3_URI',
+                        help="discover resources from a Terraform state file (local path or s3://bucket/key) "
+                             "instead of scanning tags")
+    source.add_argument('--state-key', metavar='KEY',
+                        help=f"like --state, for a key in the s3://{STATE_BUCKET} backend")
+    parser.add_argument('--cross-check', action='store_true',
+                        help="with --state, also scan tags, report where the two differ and delete both")
+    parser.add_argument('--journal', default=JOURNAL_PATH,
+                        help=f"checkpoint journal file (default: {JOURNAL_PATH})")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue an interrupted run from the journal instead of starting over")
+    args = parser.parse_args()
+    if args.state_key:
+        args.state = f"s3://{STATE_BUCKET}/{args.state_key}"
+    if args.cross_check and not args.state:
+        parser.error("--cross-check needs --state or --state-key")
+    if args.accounts_file:
+        try:
+            args.role_arns += read_role_arns(args.accounts_file)
+        except OSError as e:
+            parser.error(f"cannot read --accounts-file: {e}")
+    for role_arn in args.role_arns:
+        if (parse_arn(role_arn) or ())[1:2] != ('iam',):
+            parser.error(f"not an IAM role ARN: {role_arn}")
+    if args.role_arns and args.command != 'run':
+        parser.error(f"{args.command} works on a single account")
+    if args.select is not None:
+        try:
+            args.selector = Selector(args.select)
+        except ValueError as e:
+            parser.error(f"--select: {e}")
+        if args.state:
+            # A state already belongs to one environment, and its tags are not indexed
+            parser.error("--select works with the tag scan, not --state or --state-key")
+        if args.command == 'apply':
+            parser.error("apply re-checks the selection recorded in its plan; --select is for run and plan")
+    if args.command == 'apply' and args.all_regions:
+        parser.error("apply processes the regions in its plan; --all-regions is for run and plan")
+    if args.command == 'apply' and args.state:
+        # The plan already records where its resources came from
+        parser.error("apply reads its resources from the plan; --state is for run and plan")
+    if args.role_arns and args.state:
+        # A state describes a single account
+        parser.error("--state and --state-key cannot be combined with --role-arn or --accounts-file")
+    return args
+
+def run_plan(args, rates):
+    """Discover every region and the edge stack, and write what a run would delete to a plan"""
+    global state_inventory
+    limiter = RateLimiter(rates)
+    clients = ClientPool(boto3.Session(), limiter=limiter)
+    if args.state:
+        state_inventory = StateInventory.load(clients, args.state, cross_check=args.cross_check)
+    plan = Plan(args.state or 'tags', select=args.select)
+    units = [(region, False) for region in resolve_regions(clients, args.all_regions)] + [(EDGE_REGION, True)]
+    failed = []
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, REGION_WORKERS) + 1) as pool:
+            futures = [submit(pool, plan_unit, clients, region, edge) for region, edge in units]
+            for (region, edge), future in zip(units, futures):
+                buffer, graph, error = future.result()
+                log_lines(buffer)
+                if error:
+                    failed.append(region)
+                else:
+                    plan.add(region, graph, edge)
+    finally:
+        metrics.write(args.metrics_json, args.metrics_prom)
+    limiter.log_state()
+    
+    # A partial plan would be applied as if it were complete
+    if failed:
+        log(f"\n✗ Could not plan {', '.join(failed)}; no plan written", Colors.FAIL)
+        sys.exit(1)
+    plan.write(args.plan_file)
+    log(f"\nPlan written to {args.plan_file}: {len(plan):,} resources in {len(plan.regions())} regions "
+        f"and the edge stack ({os.path.getsize(args.plan_file) / 1024:,.1f} KiB)", Colors.OKGREEN)
+    log(f"Review it, then delete exactly these with: {os.path.basename(sys.argv[0])} apply "
+        f"--plan-file {args.plan_file}", Colors.OKCYAN)
+
+def run_single_account(args, rates, regions=None):
+    """Clean up the account of the default credentials"""
+    global state_inventory
+    # A dry run deletes nothing, so there is nothing to checkpoint
+    journal = None if DRY_RUN else Journal(args.journal, resume=args.resume)
+    limiter = RateLimiter(rates)
+    clients = ClientPool(boto3.Session(), limiter=limiter)
+    if args.state:
+        # Read once up front; every region and the edge track take their share of it
+        state_inventory = StateInventory.load(clients, args.state, cross_check=args.cross_check)
+    # Started first, since disabling a distribution outlasts most regions' cleanup
+    edge = EdgeTeardown(clients).start()
+    try:
+        if regions is None:
+            regions = resolve_regions(clients, args.all_regions)
+        if ENGINE == 'asyncio':
+            results = run_regions_async(clients, regions, journal=journal)
+        else:
+            results = run_regions(clients, regions, journal=journal)
+        results[f"{EDGE_REGION} (edge)"] = edge.join()
+    finally:
+        if journal:
+            journal.close()
+        metrics.write(args.metrics_json, args.metrics_prom)
+        durations.save(args.durations)
+    print_summary(results)
+    limiter.log_state()
+
+def _discover_account_regions(accounts):
+    def discover(account):
+        buffer = []
+        _log_buffer.set(buffer)
+        account.regions = discover_regions(account.clients)
+        return buffer
+    
+    with ThreadPoolExecutor(max_workers=len(accounts)) as pool:
+        futures = [submit(pool, discover, account) for account in accounts]
+        for account, future in zip(accounts, futures):
+            for line in future.result():
+                log(f"[account {account.id}] {line}")
+
+def run_multi_account(args, rates):
+    """Clean up every account in args.role_arns at once, with one consolidated summary"""
+    base_session = boto3.Session()
+    accounts = [Account(base_session, role_arn, rates, None if DRY_RUN else args.journal, args.resume)
+                for role_arn in args.role_arns]
+    try:
+        for account in accounts:
+            account.edge = EdgeTeardown(account.clients).start()
+        if args.all_regions:
+            _discover_account_regions(accounts)
+        results = run_accounts(accounts, args.unit_workers)
+        for account in accounts:
+            results[account.label(f"{EDGE_REGION} (edge)")] = account.edge.join()
+    finally:
+        for account in accounts:
+            if account.journal:
+                account.journal.close()
+        metrics.write(args.metrics_json, args.metrics_prom)
+        durations.save(args.durations)
+    print_summary(results)
+    print_account_totals(accounts, results)
+    for account in accounts:
+        log(f"\nAccount {account.id}", Colors.BOLD)
+        account.limiter.log_state()
 
 def main():
     """Main execution function"""
+    global event_stream
+    args = parse_args()
+    # With the events on stdout, the colored output moves to stderr to keep them parseable
+    subscribers = [ConsoleRenderer(sys.stderr if args.events == '-' else None)]
+    if args.events:
+        try:
+            subscribers.append(JsonLinesWriter(args.events))
+        except OSError as e:
+            log(f"✗ Cannot open event stream {args.events}: {e}", Colors.FAIL)
+            sys.exit(1)
+    event_stream = EventStream(subscribers)
+    try:
+        run(args)
+    finally:
+        # Drains whatever is still queued, including on errors and interrupts
+        event_stream.close()
+        event_stream = None
+
+def run(args):
+    """Clean up as configured by the command line"""
+    global ENGINE, MAX_WORKERS, REGION_WORKERS, CLIENT_RETRY_MODE, active_plan, resource_selector
+    ENGINE = args.engine
+    MAX_WORKERS = args.workers
+    REGION_WORKERS = args.region_workers
+    CLIENT_RETRY_MODE = args.retry_mode
+    if args.select is not None:
+        resource_selector = args.selector
+    
     log(f"\n{'='*60}", Colors.HEADER)
     log("AWS Terraform Resource Cleanup Script", Colors.HEADER)
     log(f"{'='*60}", Colors.HEADER)
     
-    if DRY_RUN:
+    if args.command == 'apply':
+        try:
+            active_plan = Plan.load(args.plan_file)
+        except (OSError, ValueError, KeyError, IndexError) as e:
+            log(f"\n✗ Cannot read plan {args.plan_file}: {e}", Colors.FAIL)
+            sys.exit(1)
+    
+    if args.command == 'plan':
+        log("\nPLAN MODE - resources are discovered and written to a plan; nothing is deleted", Colors.OKCYAN)
+    elif DRY_RUN:
         log("\n⚠️  DRY RUN MODE - No resources will be deleted", Colors.WARNING)
         log("Set DRY_RUN = False to actually delete resources\n", Colors.WARNING)
     else:
         log("\n⚠️  LIVE MODE - Resources WILL be deleted!", Colors.FAIL)
-        response = input("Are you sure you want to continue? (type 'DELETE' to confirm): ")
+        # The warning has to be on screen before the prompt
+        event_stream.flush()
+        prompt = "Are you sure you want to continue? (type 'DELETE' to confirm): "
+        if args.events == '-':
+            # input() would write the prompt into the event stream on stdout
+            print(prompt, end='', file=sys.stderr, flush=True)
+            response = sys.stdin.readline().rstrip('\n')
+        else:
+            response = input(prompt)
         if response != 'DELETE':
             log("Aborted.", Colors.OKGREEN)
             sys.exit(0)
     
-    log(f"\nTarget regions: {', '.join(REGIONS)}", Colors.OKBLUE)
-    log(f"Looking for tag: {TAG_KEY} = {' or '.join(TAG_VALUES)}\n", Colors.OKBLUE)
-    
-    for region in REGIONS:
-        try:
-            process_region(region)
-        except Exception as e:
-            log(f"\n✗ Error processing region {region}: {e}", Colors.FAIL)
-            import traceback
-            traceback.print_exc()
-            continue
+    if active_plan:
+        log(f"\nApplying {args.plan_file}, planned {active_plan.created} from {active_plan.source}: "
+            f"{len(active_plan):,} resources in {', '.join(active_plan.regions())} and the edge stack"
+            f"{f', selecting {active_plan.select}' if active_plan.select else ''}", Colors.OKBLUE)
+    else:
+        log(f"\nTarget regions: {'every enabled region with matching resources' if args.all_regions else ', '.join(REGIONS)}",
+            Colors.OKBLUE)
+    if args.role_arns:
+        log(f"Target accounts: {', '.join(parse_arn(role_arn)[3] for role_arn in args.role_arns)}", Colors.OKBLUE)
+    if args.state:
+        log(f"Reading resources from Terraform state: {args.state}\n", Colors.OKBLUE)
+    if not active_plan and (not args.state or args.cross_check):
+        log(f"Looking for tag: {TAG_KEY} = {' or '.join(TAG_VALUES)}\n", Colors.OKBLUE)
+    if resource_selector:
+        log(f"Selecting: {resource_selector.expression}\n", Colors.OKBLUE)
+    
+    emit('start', command=args.command, dry_run=DRY_RUN, engine=ENGINE,
+         regions=active_plan.regions() if active_plan else 'all' if args.all_regions else REGIONS,
+         accounts=[parse_arn(role_arn)[3] for role_arn in args.role_arns], select=args.select)
+    
+    rates = dict(RATE_LIMITS)
+    for service, rate in args.rate:
+        rates[service] = rate
+    durations.load(args.durations)
+    if args.command == 'plan':
+        run_plan(args, rates)
+        return
+    if args.role_arns:
+        run_multi_account(args, rates)
+    else:
+        run_single_account(args, rates, active_plan.regions() if active_plan else None)
     
     log(f"\n{'='*60}", Colors.HEADER)
     log("Cleanup Complete!", Colors.HEADER)
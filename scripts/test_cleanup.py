@@ -0,0 +1,522 @@
+"""Unit tests for cleanup.py; run with `python -m pytest scripts`"""
+
+import io
+import json
+import sys
+import time
+import types
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from botocore.exceptions import ClientError
+
+import cleanup
+
+ACCOUNT = '123456789012'
+WEB_ACL_ARN = f'arn:aws:wafv2:us-east-1:{ACCOUNT}:global/webacl/site/0b2f6f4e-1111-2222-3333-444455556666'
+DISTRIBUTION_ARN = f'arn:aws:cloudfront::{ACCOUNT}:distribution/E2ABCDEF123456'
+
+class FakeTaggingClient:
+    """resourcegroupstaggingapi stand-in recording the filters of each scan"""
+
+    def __init__(self, resources):
+        self.resources = resources
+        self.scans = []
+
+    def get_paginator(self, operation):
+        return self
+
+    def paginate(self, **filters):
+        self.scans.append(filters)
+        return [{'ResourceTagMappingList': self.resources}]
+
+class FakeEC2:
+    """ec2 stand-in for the network pre-flight: describe calls fail as a whole on any unknown id"""
+
+    def __init__(self, gateways=None, addresses=None, members=None):
+        self.gateways = gateways or {}    # igw id -> attached VPC id, or None
+        self.addresses = addresses or {}  # allocation id -> association id, or None
+        self.members = members or {}      # subnet, route table or group id -> VPC id
+        self.calls = []
+
+    def _lookup(self, operation, items, ids, code):
+        self.calls.append((operation, list(ids)))
+        missing = [ident for ident in ids if ident not in items]
+        if missing:
+            raise ClientError({'Error': {'Code': code, 'Message': f"{missing[0]} does not exist"}}, operation)
+        return ids
+
+    def describe_internet_gateways(self, InternetGatewayIds):
+        ids = self._lookup('describe_internet_gateways', self.gateways, InternetGatewayIds,
+                           'InvalidInternetGatewayID.NotFound')
+        return {'InternetGateways': [
+            {'InternetGatewayId': ident,
+             'Attachments': [{'VpcId': self.gateways[ident]}] if self.gateways[ident] else []}
+            for ident in ids
+        ]}
+
+    def describe_addresses(self, AllocationIds):
+        ids = self._lookup('describe_addresses', self.addresses, AllocationIds, 'InvalidAllocationID.NotFound')
+        return {'Addresses': [
+            {'AllocationId': ident, **({'AssociationId': self.addresses[ident]} if self.addresses[ident] else {})}
+            for ident in ids
+        ]}
+
+    def _in_vpcs(self, operation, ids, key, id_field, code):
+        ids = self._lookup(operation, self.members, ids, code)
+        return {key: [{id_field: ident, 'VpcId': self.members[ident]} for ident in ids]}
+
+    def describe_subnets(self, SubnetIds):
+        return self._in_vpcs('describe_subnets', SubnetIds, 'Subnets', 'SubnetId', 'InvalidSubnetID.NotFound')
+
+    def describe_route_tables(self, RouteTableIds):
+        return self._in_vpcs('describe_route_tables', RouteTableIds, 'RouteTables', 'RouteTableId',
+                             'InvalidRouteTableID.NotFound')
+
+    def describe_security_groups(self, GroupIds):
+        return self._in_vpcs('describe_security_groups', GroupIds, 'SecurityGroups', 'GroupId',
+                             'InvalidGroup.NotFound')
+
+class FakeClients:
+    def __init__(self, client, **services):
+        self.client = client
+        self.services = services
+
+    def get(self, service, region):
+        return self.services.get(service, self.client)
+
+def _arn(service, resource):
+    return f'arn:aws:{service}:us-east-1:{ACCOUNT}:{resource}'
+
+def _record(kind, ident, resource):
+    return cleanup.ResourceRecord(kind, ident, _arn('ec2', resource), 'us-east-1')
+
+def _record_tuples(records):
+    return [(record.kind, record.ident, record.arn, record.region) for record in records]
+
+def _tagged(arn, **tags):
+    return {'ResourceARN': arn, 'Tags': [{'Key': key, 'Value': value} for key, value in tags.items()]}
+
+def test_edge_type_filters_come_from_kind_type_filters():
+    assert cleanup.EDGE_RESOURCE_TYPE_FILTERS == [
+        cleanup.KIND_TYPE_FILTERS[kind] for kind in cleanup.KIND_TYPE_FILTERS if kind in cleanup.EDGE_KINDS]
+    assert cleanup.KIND_TYPE_FILTERS['waf_web_acl'] == 'wafv2'
+
+def test_selecting_web_acls_still_scans_the_edge(monkeypatch):
+    monkeypatch.setattr(cleanup, 'resource_selector', cleanup.Selector('type:waf_web_acl'))
+    client = FakeTaggingClient([_tagged(WEB_ACL_ARN, ManagedBy='terraform'),
+                                _tagged(DISTRIBUTION_ARN, ManagedBy='terraform')])
+    records = list(cleanup.discover_edge_resources(FakeClients(client), 'us-east-1'))
+    assert client.scans and client.scans[0]['ResourceTypeFilters'] == ['wafv2']
+    assert [(record.kind, record.arn) for record in records] == [('waf_web_acl', WEB_ACL_ARN)]
+
+def test_type_glob_keeps_every_edge_type(monkeypatch):
+    monkeypatch.setattr(cleanup, 'resource_selector', cleanup.Selector('type:*'))
+    filters = cleanup.tag_scan_filters(cleanup.EDGE_RESOURCE_TYPE_FILTERS)
+    assert filters['ResourceTypeFilters'] == cleanup.EDGE_RESOURCE_TYPE_FILTERS
+
+def test_deletions_keep_starting_while_discovery_streams(monkeypatch):
+    deleted = []
+    name, label, _ = cleanup.RESOURCE_TYPES['elasticache_snapshot']
+    monkeypatch.setitem(cleanup.RESOURCE_TYPES, 'elasticache_snapshot',
+                        (name, label, lambda clients, region, ident: deleted.append(ident)))
+    monkeypatch.setattr(cleanup, 'metrics', cleanup.Metrics())
+    monkeypatch.setattr(cleanup, 'durations', cleanup.DurationStats())
+    during_scan = []
+
+    def records():
+        for i in range(3):
+            yield cleanup.ResourceRecord('elasticache_snapshot', f'snap-{i}',
+                                         f'arn:aws:elasticache:us-east-1:{ACCOUNT}:snapshot:snap-{i}', 'us-east-1')
+            # The next page only arrives once this snapshot is gone, with a single worker
+            deadline = time.monotonic() + 5
+            while len(deleted) <= i and time.monotonic() < deadline:
+                time.sleep(0.01)
+            time.sleep(0.05)
+        during_scan.extend(deleted)
+
+    outcomes = cleanup.DeletionGraph().run(None, 'us-east-1', records(), max_workers=1)
+    assert during_scan == ['snap-0', 'snap-1', 'snap-2']
+    assert {status for status, _ in outcomes.values()} == {'deleted'}
+
+def test_stale_gateway_and_address_ids_do_not_hide_the_others():
+    tagging = FakeTaggingClient([_tagged(_arn('ec2', f'internet-gateway/{ident}'), ManagedBy='terraform')
+                                 for ident in ('igw-live', 'igw-gone')] +
+                                [_tagged(_arn('ec2', f'elastic-ip/{ident}'), ManagedBy='terraform')
+                                 for ident in ('eipalloc-live', 'eipalloc-gone')])
+    ec2 = FakeEC2({'igw-live': 'vpc-1'}, {'eipalloc-live': 'eipassoc-1'})
+    records = list(cleanup.discover_resources(FakeClients(tagging, ec2=ec2), 'us-east-1', preflight=False))
+    assert sorted(record.ident for record in records) == [
+        ('eipalloc-gone', None), ('eipalloc-live', 'eipassoc-1'), ('igw-gone', None), ('igw-live', 'vpc-1')]
+    # The failed bulk call is followed by one call per id
+    assert [operation for operation, ids in ec2.calls if len(ids) == 1] == ['describe_internet_gateways'] * 2 + \
+        ['describe_addresses'] * 2
+
+def test_rate_limits_are_validated_while_parsing(monkeypatch, capsys):
+    monkeypatch.setattr(sys, 'argv', ['cleanup.py', '--rate', 'ec2=12.5', '--rate', 'eks=2'])
+    assert cleanup.parse_args().rate == [('ec2', 12.5), ('eks', 2.0)]
+    for bad in ('ec2', 'ec2=fast', '=5', 'ec2=0', 'ec2=-1', 'ec2=inf', 'ec2=nan'):
+        monkeypatch.setattr(sys, 'argv', ['cleanup.py', '--rate', bad])
+        with pytest.raises(SystemExit):
+            cleanup.parse_args()
+        assert 'SERVICE=CALLS_PER_SECOND' in capsys.readouterr().err
+
+class FakeSTS:
+    def __init__(self, lifetime):
+        self.lifetime = lifetime
+        self.calls = 0
+
+    def assume_role(self, RoleArn, RoleSessionName, DurationSeconds):
+        self.calls += 1
+        return {'Credentials': {
+            'AccessKeyId': f'ASIAROLE{self.calls}', 'SecretAccessKey': 'secret', 'SessionToken': 'token',
+            'Expiration': datetime.now(timezone.utc) + self.lifetime,
+        }}
+
+def test_assumed_role_session_is_assumed_once_and_refreshed(monkeypatch):
+    # Environment credentials would win if the role's provider were not consulted first
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'AKIABASE')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'base-secret')
+    sts = FakeSTS(timedelta(hours=1))
+    base_session = types.SimpleNamespace(client=lambda service, config=None: sts)
+    session = cleanup.assumed_role_session(base_session, f'arn:aws:iam::{ACCOUNT}:role/cleanup')
+    assert sts.calls == 0
+    for region in ('us-east-1', 'eu-central-1'):
+        session.client('sqs', region_name=region)
+    credentials = session.get_credentials()
+    assert credentials.method == cleanup.AssumedRoleProvider.METHOD
+    assert credentials.get_frozen_credentials().access_key == 'ASIAROLE1'
+    assert sts.calls == 1
+
+
+def test_assumed_role_credentials_are_refreshed_before_they_expire():
+    # A minute left is inside botocore's mandatory refresh window, so each use fetches again
+    sts = FakeSTS(timedelta(minutes=1))
+    base_session = types.SimpleNamespace(client=lambda service, config=None: sts)
+    credentials = cleanup.assumed_role_session(base_session, f'arn:aws:iam::{ACCOUNT}:role/cleanup').get_credentials()
+    assert credentials.get_frozen_credentials().access_key == 'ASIAROLE1'
+    assert credentials.get_frozen_credentials().access_key == 'ASIAROLE2'
+
+class RecordingSubscriber:
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.events = []
+        self.closed = False
+
+    def handle(self, event):
+        if self.fail_on == 'handle':
+            raise OSError("disk full")
+        self.events.append(event)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.fail_on == 'close':
+            raise OSError("broken pipe")
+        self.closed = True
+
+def test_a_failing_subscriber_does_not_skip_the_next_one(capsys):
+    for fail_on in ('handle', 'close'):
+        broken, healthy = RecordingSubscriber(fail_on), RecordingSubscriber()
+        stream = cleanup.EventStream([broken, healthy])
+        stream.emit({'event': 'resource', 'outcome': 'deleted'})
+        stream.close()
+        assert healthy.events == [{'event': 'resource', 'outcome': 'deleted'}]
+        assert healthy.closed
+        assert 'RecordingSubscriber stopped' in capsys.readouterr().err
+
+def test_parse_arn_splits_every_resource_form():
+    assert cleanup.parse_arn(f'arn:aws:ec2:us-east-1:{ACCOUNT}:subnet/subnet-1') == \
+        ('aws', 'ec2', 'us-east-1', ACCOUNT, 'subnet', 'subnet-1')
+    assert cleanup.parse_arn(f'arn:aws:rds:us-east-1:{ACCOUNT}:cluster:db-1') == \
+        ('aws', 'rds', 'us-east-1', ACCOUNT, 'cluster', 'db-1')
+    assert cleanup.parse_arn(f'arn:aws:eks:us-east-1:{ACCOUNT}:nodegroup/main/ng1/abcd') == \
+        ('aws', 'eks', 'us-east-1', ACCOUNT, 'nodegroup', 'main/ng1/abcd')
+    assert cleanup.parse_arn('arn:aws:s3:::bucket-1') == ('aws', 's3', '', '', '', 'bucket-1')
+    assert cleanup.parse_arn('not-an-arn') is None
+
+def test_classify_builds_the_identifiers_the_deleters_take():
+    cases = {
+        _arn('ec2', 'subnet/subnet-1'): ('subnet', 'subnet-1', 'us-east-1'),
+        _arn('eks', 'nodegroup/main/ng1/abcd'): ('eks_nodegroup', ('main', 'ng1'), 'us-east-1'),
+        _arn('ecs', 'service/main/api'): ('ecs_service', ('main', 'api'), 'us-east-1'),
+        _arn('sqs', 'jobs'): ('sqs_queue', ('jobs', ACCOUNT), 'us-east-1'),
+        _arn('elasticloadbalancing', 'loadbalancer/app/web/50dc'): (
+            'load_balancer', _arn('elasticloadbalancing', 'loadbalancer/app/web/50dc'), 'us-east-1'),
+        'arn:aws:s3:::bucket-1': ('s3_bucket', 'bucket-1', ''),
+        f'arn:aws-cn:ec2:cn-north-1:{ACCOUNT}:vpc/vpc-1': ('vpc', 'vpc-1', 'cn-north-1'),
+        WEB_ACL_ARN: ('waf_web_acl', ('site', '0b2f6f4e-1111-2222-3333-444455556666'), 'us-east-1'),
+    }
+    for arn, expected in cases.items():
+        record = cleanup.classify(arn)
+        assert (record.kind, record.ident, record.region) == expected, arn
+    assert cleanup.classify(_arn('ec2', 'instance/i-1')) is None
+    assert cleanup.classify('not-an-arn') is None
+
+def test_selector_evaluates_against_tags_types_and_arns():
+    subnet, queue, table = _arn('ec2', 'subnet/subnet-1'), _arn('sqs', 'jobs'), _arn('dynamodb', 'table/orders')
+    resources = [_tagged(subnet, Environment='dev', Team='net'),
+                 _tagged(queue, Environment='dev', Protected='true'),
+                 _tagged(table, Environment='prod', Team='data team')]
+    cases = {
+        'Environment=dev': [subnet, queue],
+        'Environment=dev and not Protected=true': [subnet],
+        'Protected': [queue],
+        'Team!=net': [queue, table],
+        'Environment=pr* or type:sqs_*': [queue, table],
+        '"Team" = "data team"': [table],
+        'arn:*:table/* or (Team=net and not type:vpc)': [subnet, table],
+    }
+    for expression, expected in cases.items():
+        assert cleanup.Selector(expression).select(resources) == expected, expression
+
+def test_selector_rejects_malformed_expressions():
+    for expression in ('', 'Environment=dev and', '(Team=net', 'Team=net)', 'not', 'Team=', 'a b'):
+        with pytest.raises(ValueError):
+            cleanup.Selector(expression)
+
+def test_selector_pushes_exact_conjuncts_into_the_tag_scan(monkeypatch):
+    monkeypatch.setattr(cleanup, 'resource_selector', cleanup.Selector(
+        'Environment=dev and (Team=a or Team=b) and Name=web-* and not Protected and type:sqs_queue'))
+    filters = cleanup.tag_scan_filters()
+    assert filters['TagFilters'] == [{'Key': cleanup.TAG_KEY, 'Values': cleanup.TAG_VALUES},
+                                     {'Key': 'Environment', 'Values': ['dev']},
+                                     {'Key': 'Team', 'Values': ['a', 'b']}]
+    assert filters['ResourceTypeFilters'] == ['sqs']
+    # An or across keys can only be evaluated locally
+    monkeypatch.setattr(cleanup, 'resource_selector', cleanup.Selector('Environment=dev or Team=a'))
+    assert cleanup.tag_scan_filters()['TagFilters'] == [{'Key': cleanup.TAG_KEY, 'Values': cleanup.TAG_VALUES}]
+    # Nothing the scan could return is selected
+    monkeypatch.setattr(cleanup, 'resource_selector', cleanup.Selector('type:cloudfront_distribution'))
+    assert cleanup.tag_scan_filters() is None
+
+def test_index_runs_round_trip():
+    for indices in ([], [4], [0, 1, 2], [0, 1, 2, 5, 7, 8, 9, 12], [9, 3, 4, 1]):
+        runs = cleanup._index_runs(indices)
+        assert list(cleanup._expand_runs(runs)) == sorted(indices)
+    assert cleanup._index_runs([0, 1, 2, 5, 7, 8]) == [[0, 3], 5, [7, 9]]
+
+def test_plan_survives_a_write_and_load(tmp_path, monkeypatch):
+    monkeypatch.setattr(cleanup, 'durations', cleanup.DurationStats())
+    graph = cleanup.DeletionGraph()
+    records = [
+        _record('vpc', 'vpc-1', 'vpc/vpc-1'),
+        _record('subnet', 'subnet-1', 'subnet/subnet-1'),
+        _record('subnet', 'subnet-2', 'subnet/subnet-2'),
+        # Attachments are not in the ARN, so the plan has to store the identifier
+        _record('internet_gateway', ('igw-1', 'vpc-1'), 'internet-gateway/igw-1'),
+        _record('elastic_ip', ('eipalloc-1', None), 'elastic-ip/eipalloc-1'),
+    ]
+    for record in records:
+        graph.add(record)
+    graph.link()
+    plan = cleanup.Plan('tags', select='Environment=dev')
+    plan.add('us-east-1', graph)
+    path = str(tmp_path / 'plan.json')
+    plan.write(path)
+
+    loaded = cleanup.Plan.load(path)
+    assert (loaded.source, loaded.select, loaded.created) == ('tags', 'Environment=dev', plan.created)
+    assert loaded.regions() == ['us-east-1'] and len(loaded) == len(records)
+    assert _record_tuples(loaded.units[('us-east-1', False)][0]) == _record_tuples(plan.units[('us-east-1', False)][0])
+    assert set(loaded.edges('us-east-1')) == set(plan.edges('us-east-1'))
+    assert (('vpc', 'vpc-1'), ('internet_gateway', ('igw-1', 'vpc-1'))) in loaded.edges('us-east-1')
+
+def test_plan_of_another_version_is_refused(tmp_path):
+    path = tmp_path / 'plan.json'
+    path.write_text(json.dumps({'version': cleanup.PLAN_VERSION + 1, 'units': []}))
+    with pytest.raises(ValueError):
+        cleanup.Plan.load(str(path))
+
+def test_journal_resumes_past_a_truncated_last_line(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    subnet = _record('subnet', 'subnet-1', 'subnet/subnet-1')
+    gateway = _record('internet_gateway', ('igw-1', 'vpc-1'), 'internet-gateway/igw-1')
+    vpc = _record('vpc', 'vpc-1', 'vpc/vpc-1')
+    journal = cleanup.Journal(path)
+    for record in (subnet, gateway, vpc):
+        journal.discovered(record)
+    journal.discovery_complete('us-east-1')
+    journal.delete_issued(subnet)
+    journal.gone(subnet)
+    journal.delete_issued(gateway)
+    journal.close()
+    with open(path, 'a', encoding='utf-8') as f:
+        # The run was killed halfway through writing this line
+        f.write('{"event": "gone", "region": "us-east-1", "arn": "arn:aws:ec2:us-e')
+
+    resumed = cleanup.Journal(path, resume=True)
+    checkpoint = resumed.checkpoint('us-east-1')
+    assert checkpoint.discovery_complete
+    assert checkpoint.gone == {subnet.arn}
+    assert checkpoint.issued == {subnet.arn, gateway.arn}
+    assert _record_tuples(checkpoint.pending()) == _record_tuples([gateway, vpc])
+    assert resumed.checkpoint('eu-central-1') is None
+    resumed.close()
+    # Resuming appends instead of starting the journal over
+    with open(path, encoding='utf-8') as f:
+        assert f.readline().startswith('{"event": "discovered"')
+
+def test_state_resources_stream_across_chunk_boundaries():
+    state = {
+        'version': 4,
+        'outputs': {'url': {'value': 'https://example.com/{"not": [json]}', 'type': 'string'}},
+        'resources': [
+            {'mode': 'managed', 'type': 'aws_vpc', 'name': 'main',
+             'instances': [{'attributes': {'id': 'vpc-1', 'tags': {'Name': 'a "quoted" ] name'}}}]},
+            {'mode': 'data', 'type': 'aws_region', 'name': 'current', 'instances': []},
+            {'mode': 'managed', 'type': 'aws_sqs_queue', 'name': 'jobs',
+             'instances': [{'attributes': {'id': 'https://sqs', 'delay': 1.5e2, 'fifo': False, 'dlq': None}}]},
+        ],
+        'check_results': None,
+    }
+    for separators, chunk_size in (((',', ':'), 1), ((', ', ': '), 7), (None, 4096)):
+        document = json.dumps(state, indent=None if separators else 2, separators=separators)
+        assert list(cleanup.iter_state_resources(io.StringIO(document), chunk_size)) == state['resources']
+
+def test_state_without_resources_yields_nothing():
+    assert list(cleanup.iter_state_resources(io.StringIO('{"version": 4, "resources": []}'), 3)) == []
+    assert list(cleanup.iter_state_resources(io.StringIO('{"version": 4}'), 3)) == []
+
+def test_backoff_sleeps_instead_of_spinning_when_nothing_runs(monkeypatch):
+    attempts = []
+
+    def delete(clients, region, ident):
+        attempts.append(ident)
+        if len(attempts) < 3:
+            raise ClientError({'Error': {'Code': 'DependencyViolation', 'Message': 'in use'}}, 'DeleteLaunchTemplate')
+
+    name, label, _ = cleanup.RESOURCE_TYPES['launch_template']
+    monkeypatch.setitem(cleanup.RESOURCE_TYPES, 'launch_template', (name, label, delete))
+    monkeypatch.setattr(cleanup, 'metrics', cleanup.Metrics())
+    monkeypatch.setattr(cleanup, 'durations', cleanup.DurationStats())
+    monkeypatch.setattr(cleanup, 'RETRY_BASE_DELAY', 0.1)
+    monkeypatch.setattr(cleanup.random, 'uniform', lambda low, high: high)
+    polls = []
+    real_wait = cleanup.wait
+    monkeypatch.setattr(cleanup, 'wait', lambda *args, **kwargs: polls.append(1) or real_wait(*args, **kwargs))
+
+    record = _record('launch_template', 'lt-1', 'launch-template/lt-1')
+    outcomes = cleanup.DeletionGraph().run(None, 'us-east-1', [record], max_workers=1)
+    assert outcomes == {('launch_template', 'lt-1'): ('deleted', None)}
+    assert len(attempts) == 3
+    # About a second of backoff passes with the pool idle; each attempt needs only a few polls
+    assert len(polls) < 20
+
+def test_events_on_stdout_stay_parseable_in_live_mode(monkeypatch, tmp_path, capsys):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(cleanup, 'DRY_RUN', False)
+    monkeypatch.setattr(cleanup, 'durations', cleanup.DurationStats())
+    monkeypatch.setattr(cleanup, 'run_single_account', lambda args, rates, regions=None: cleanup.print_summary({}))
+    monkeypatch.setattr(sys, 'argv', ['cleanup.py', '--events', '-'])
+    monkeypatch.setattr(sys, 'stdin', io.StringIO('DELETE\n'))
+    cleanup.main()
+    out, err = capsys.readouterr()
+    events = [json.loads(line) for line in out.splitlines()]
+    assert [event['event'] for event in events] == ['start', 'summary']
+    assert "type 'DELETE' to confirm" in err and 'Cleanup Complete!' in err
+
+def test_worker_counts_must_be_positive(monkeypatch, capsys):
+    monkeypatch.setattr(sys, 'argv', ['cleanup.py', '--workers', '3', '--region-workers', '1', '--unit-workers', '8'])
+    args = cleanup.parse_args()
+    assert (args.workers, args.region_workers, args.unit_workers) == (3, 1, 8)
+    for option in ('--workers', '--region-workers', '--unit-workers'):
+        for bad in ('0', '-2', 'many', '1.5'):
+            monkeypatch.setattr(sys, 'argv', ['cleanup.py', option, bad])
+            with pytest.raises(SystemExit):
+                cleanup.parse_args()
+            assert 'expected a positive integer' in capsys.readouterr().err
+
+def test_network_edges_stay_within_each_vpc(monkeypatch):
+    monkeypatch.setattr(cleanup, 'durations', cleanup.DurationStats())
+    graph = cleanup.DeletionGraph()
+    for vpc in ('vpc-a', 'vpc-b'):
+        graph.add(_record('vpc', vpc, f'vpc/{vpc}'))
+        for kind in ('subnet', 'route_table', 'security_group'):
+            ident = f'{kind}-{vpc[-1]}'
+            graph.add(cleanup.ResourceRecord(kind, ident, _arn('ec2', f"{kind.replace('_', '-')}/{ident}"),
+                                             'us-east-1', vpc))
+    # Membership that could not be looked up keeps the type-level edges
+    graph.add(_record('subnet', 'subnet-unknown', 'subnet/subnet-unknown'))
+    graph.link()
+    assert graph.prerequisites[('vpc', 'vpc-a')] == {
+        ('subnet', 'subnet-a'), ('route_table', 'route_table-a'), ('security_group', 'security_group-a'),
+        ('subnet', 'subnet-unknown')}
+    assert graph.prerequisites[('route_table', 'route_table-b')] == {
+        ('subnet', 'subnet-b'), ('subnet', 'subnet-unknown')}
+
+def test_discovery_records_the_vpc_of_network_members():
+    tagging = FakeTaggingClient([_tagged(_arn('ec2', resource), ManagedBy='terraform') for resource in (
+        'subnet/subnet-a', 'subnet/subnet-gone', 'route-table/rtb-b', 'security-group/sg-a')])
+    ec2 = FakeEC2(members={'subnet-a': 'vpc-a', 'rtb-b': 'vpc-b', 'sg-a': 'vpc-a'})
+    records = cleanup.discover_resources(FakeClients(tagging, ec2=ec2), 'us-east-1', preflight=False)
+    assert sorted((record.ident, record.vpc) for record in records) == [
+        ('rtb-b', 'vpc-b'), ('sg-a', 'vpc-a'), ('subnet-a', 'vpc-a'), ('subnet-gone', None)]
+
+class FakeCloudFront:
+    def __init__(self, deploy_polls):
+        self.deploy_polls = deploy_polls
+        self.calls = []
+
+    def get_distribution_config(self, Id):
+        self.calls.append('get_distribution_config')
+        return {'DistributionConfig': {'Enabled': True}, 'ETag': 'E1'}
+
+    def update_distribution(self, Id, IfMatch, DistributionConfig):
+        self.calls.append('update_distribution')
+        return {'ETag': 'E2'}
+
+    def get_distribution(self, Id):
+        self.calls.append('get_distribution')
+        self.deploy_polls -= 1
+        return {'Distribution': {'Status': 'InProgress' if self.deploy_polls > 0 else 'Deployed'}, 'ETag': 'E2'}
+
+    def delete_distribution(self, Id, IfMatch):
+        assert IfMatch == 'E2'
+        self.calls.append('delete_distribution')
+
+def test_staged_deletions_wait_in_the_tracker_not_the_deleter(monkeypatch):
+    monkeypatch.setattr(cleanup, 'DRY_RUN', False)
+    monkeypatch.setattr(cleanup, 'metrics', cleanup.Metrics())
+    monkeypatch.setattr(cleanup, 'durations', cleanup.DurationStats())
+    monkeypatch.setattr(cleanup, 'POLL_INTERVAL', 0.01)
+    sleeps = []
+    monkeypatch.setattr(cleanup.time, 'sleep', sleeps.append)
+    cloudfront = FakeCloudFront(deploy_polls=3)
+    record = cleanup.ResourceRecord('cloudfront_distribution', 'E2ABCDEF123456', DISTRIBUTION_ARN, 'us-east-1')
+
+    async def run():
+        engine = cleanup.AsyncEngine(call_workers=2)
+        try:
+            return await cleanup.DeletionGraph().run_async(engine, FakeClients(cloudfront), 'us-east-1', [record])
+        finally:
+            engine.close()
+
+    outcomes = cleanup.asyncio.run(run())
+    assert outcomes == {('cloudfront_distribution', 'E2ABCDEF123456'): ('deleted', None)}
+    assert cloudfront.calls == ['get_distribution_config', 'update_distribution', 'get_distribution',
+                                'get_distribution', 'get_distribution', 'get_distribution', 'delete_distribution']
+    # The deploy wait ran on asyncio.sleep between polls, holding no aws-call thread
+    assert sleeps == []
+
+class FakeSQS:
+    def __init__(self, url):
+        self.url = url
+        self.deleted = []
+
+    def get_queue_url(self, QueueName, QueueOwnerAWSAccountId):
+        assert (QueueName, QueueOwnerAWSAccountId) == ('jobs', ACCOUNT)
+        return {'QueueUrl': self.url}
+
+    def delete_queue(self, QueueUrl):
+        self.deleted.append(QueueUrl)
+
+def test_queue_urls_are_looked_up_in_any_partition(monkeypatch):
+    monkeypatch.setattr(cleanup, 'DRY_RUN', False)
+    record = cleanup.classify(f'arn:aws-cn:sqs:cn-north-1:{ACCOUNT}:jobs')
+    assert (record.kind, record.ident) == ('sqs_queue', ('jobs', ACCOUNT))
+    url = f'https://sqs.cn-north-1.amazonaws.com.cn/{ACCOUNT}/jobs'
+    sqs = FakeSQS(url)
+    cleanup.delete_sqs_queue(FakeClients(sqs), 'cn-north-1', record.ident)
+    assert sqs.deleted == [url]